@@ -1,159 +1,42 @@
 
-
-from langchain.chat_models import init_chat_model
-from typing import Literal
-from langgraph.types import Command
-from langgraph.graph import StateGraph, START, END
-from schemas import RouterSchema,State
-from utils import parse_email, format_email_markdown
-from prompts import DEFAULT_TRIAGE_INSTRUCTIONS, TRIAGE_SYSTEM_PROMPT, DEFAULT_BACKGROUND, TRIAGE_USER_PROMPT, AGENT_SYSTEM_PROMPT, DEFAULT_RESPONSE_PREFERENCES, DEFAULT_CAL_PREFERENCES
-from agent_tools import TOOLS
+from typing import Optional
+
+import asyncio
+from langchain_core.utils.json import parse_partial_json
+from graphs import graph_factory, build_email_assistant, EMAIL, EMAIL_ASYNC
+from nodes import triage_router, atriage_router, llm_call, allm_call, tool_handler, atool_handler, should_continue, _classify, _aclassify
+from utils import parse_email, normalize_email_input
+from dedup import cluster_near_duplicates
+from conversations import group_conversations as _group_conversations, with_earlier_messages
+from singleflight import SingleFlight
+from triage_cache import email_fingerprint
+from metrics import register_process_flights
+import tracing
 from dotenv import load_dotenv
 load_dotenv()
 import os 
 
 os.environ['OPENAI_API_KEY']=os.getenv("OPENAI_API_KEY")
 
-llm=init_chat_model("openai:gpt-4.1",temperature=0.0)
-llm_router=llm.with_structured_output(RouterSchema)
-
-
-tools_by_name={tool.name:tool for tool in TOOLS}
-llm_with_tools=llm.bind_tools(TOOLS, tool_choice='any')
-
-def triage_router(state:State):
-
-    author,to, subject, email_thread=parse_email(state["email_input"])
-
-    system_prompt=TRIAGE_SYSTEM_PROMPT.format(background=DEFAULT_BACKGROUND,triage_instructions=DEFAULT_TRIAGE_INSTRUCTIONS)
-
-    user_prompt= TRIAGE_USER_PROMPT.format(
-        author=author, to=to, subject=subject, email_thread=email_thread
-    )
-
-    result=llm_router.invoke([
-        {"role":"system","content":system_prompt},
-        {"role":"user","content":user_prompt}
-    ])
-
-    print(f"Email Triage: {result.classification.upper()}")
-    print(f"Result",result)
-
-    if result.classification=='respond':
-        print("Routing to response agent")
-        goto="response_agent"
-        update={
-            "classification_decision":result.classification,
-            "messages":[{
-                "role":"user",
-                "content":f"Respond to the email: \n\n {format_email_markdown(subject,author, to, email_thread)}"
-            }]
-        }
-    elif result.classification=='ignore':
-        print("Email will be ignored")
-        goto=END 
-        update={"classification_decision":result.classification}
-    elif result.classification=='notify':
-        print("Email marked for notification only")
-        goto=END 
-        update={"classification_decision":{result.classification}}
-    else:
-        raise ValueError(f"Invalid classificaton: {result.classification}")
-    
-    return Command(goto=goto,update=update)
-
-def llm_call(state:State):
-    system_prompt=AGENT_SYSTEM_PROMPT.format(
-        background=DEFAULT_BACKGROUND,
-        responses_preferences=DEFAULT_RESPONSE_PREFERENCES,
-        cal_preferences=DEFAULT_CAL_PREFERENCES
-    )
-    print("******")
-    print(f'state',state['messages'])
-    print('------')
-
-    return {
-        "messages":[
-            llm_with_tools.invoke([
-                {"role":"system","content":system_prompt}
-            ]+ state["messages"]) 
-        ]
-    }
-
-
-def tool_handler(state:State):
-    last_message=state['messages'][-1]
-    result=[]
-
-    for tool_call in last_message.tool_calls:
-        tool=tools_by_name[tool_call['name']]
-        observation=tool.invoke(tool_call['args'])
-        result.append({
-            "role":"tool",
-            "content":str(observation),
-            "tool_call_id":tool_call['id']
-        })
-        print(f"Tool executed: {tool_call['name']}")
-        print(f"Tool Args",tool_call['args'])
-
-    return {'messages':result}
-
-
-def should_continue(state: State)-> Literal["tool_handler","__end__"]:
-    
-    last_message=state['messages'][-1]
-
-    if last_message.tool_calls:
-
-        for tool_call in last_message.tool_calls:
-            if tool_call['name']=='Done':
-                print("Processing Completed")
-                return END 
-        return "tool_handler"
-    
-    return  END
-
-
-
-
-
-response_agent=StateGraph(State)
-response_agent.add_node("llm_call",llm_call)
-response_agent.add_node("tool_handler",tool_handler)
-
-response_agent.add_edge(START, "llm_call")
-response_agent.add_conditional_edges(
-    "llm_call",
-    should_continue,
-    {
-        "tool_handler":"tool_handler",
-        END: END,
-        },
-
-
-)
-
-response_agent.add_edge("tool_handler","llm_call")
-compiled_response_agent=response_agent.compile()
+BATCH_MAX_CONCURRENCY=int(os.getenv("BATCH_MAX_CONCURRENCY","8"))
+BATCH_GROUP_CONVERSATIONS=os.getenv("BATCH_GROUP_CONVERSATIONS","true").lower() in ("1","true","yes")
 
+process_flights=SingleFlight()
+register_process_flights(process_flights)
 
 
-email_assistant=StateGraph(State)
-email_assistant.add_node("triage_router",triage_router)
-email_assistant.add_node("response_agent",compiled_response_agent)
+def __getattr__(name:str):
+    # Compiled graphs are built on first access; see graphs.GraphFactory.
+    if name=="compiled_email_assistant":
+        return graph_factory.get(EMAIL)
+    if name=="compiled_email_assistant_async":
+        return graph_factory.get(EMAIL_ASYNC)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-email_assistant.add_edge(START,"triage_router")
 
-compiled_email_assistant=email_assistant.compile()
-
-
-def process_email(email_input:dict)->dict:
-    result=compiled_email_assistant.invoke({'email_input':email_input})
+def _format_result(result:dict)->dict:
     response_text="No response generated"
 
-
-
-
     if result.get("messages"):
 
         for message in result['messages']:
@@ -178,10 +61,169 @@ def process_email(email_input:dict)->dict:
     return {
         "classification":result.get("classification_decision","unknown"),
         "response": response_text, 
-        "reasoning": f"Email classified as : {result.get('classification_decision','unknown')}"
+        "reasoning": f"Email classified as : {result.get('classification_decision','unknown')}",
+        "compaction_tokens_saved": result.get("compaction_tokens_saved",0),
+        "thread_chars_removed": result.get("thread_chars_removed",0)
+    }
+
+
+def triage_email(email_input:dict)->dict:
+    """Classify one email without running the response agent, e.g. for bulk backfills."""
+    email_input, _=normalize_email_input(email_input)
+    result=_classify(*parse_email(email_input))
+    return {"classification":result.classification, "reasoning":result.reasoning}
+
+
+async def atriage_email(email_input:dict)->dict:
+    email_input, _=normalize_email_input(email_input)
+    result=await _aclassify(*parse_email(email_input))
+    return {"classification":result.classification, "reasoning":result.reasoning}
+
+
+def process_email(email_input:dict)->dict:
+    result=graph_factory.get(EMAIL).invoke({'email_input':email_input})
+    return _format_result(result)
+
+
+async def aprocess_email(email_input:dict, triage_decision:Optional[dict]=None)->dict:
+    """Run the email graph; `triage_decision` (as returned by `atriage_email`) skips its triage."""
+    graph_input={'email_input':email_input}
+    if triage_decision is not None:
+        graph_input['triage_decision']=triage_decision
+    result=await graph_factory.get(EMAIL_ASYNC).ainvoke(graph_input)
+    return _format_result(result)
+
+
+async def aprocess_email_shared(email_input:dict, triage_decision:Optional[dict]=None)->dict:
+    """`aprocess_email`, with concurrent identical emails sharing one graph run and its result."""
+    # The recipient is part of the key: the reply drafted for one recipient
+    # must not be handed to a request for another.
+    key=email_fingerprint(*parse_email(normalize_email_input(email_input)[0]))
+    return await process_flights.do(key, lambda: aprocess_email(email_input, triage_decision))
+
+
+async def astream_email(email_input:dict):
+    """Run the email graph and yield (event, data) pairs as soon as they are known.
+
+    Events are `triage` once the router has decided, `tool_call` for each tool
+    the response agent calls, `draft` with incremental `write_email` content as
+    the model streams it, and a final `result` shaped like `process_email`'s.
+    """
+    drafts={}
+    final_state={}
+
+    async for namespace, mode, data in graph_factory.get(EMAIL_ASYNC).astream(
+        {'email_input':email_input},
+        stream_mode=["updates","messages","values"],
+        subgraphs=True
+    ):
+        if mode=="values":
+            if not namespace:
+                final_state=data
+
+        elif mode=="updates":
+            if "triage_router" in data:
+                yield "triage", {"classification":data["triage_router"]["classification_decision"]}
+            if data.get("llm_call"):
+                for message in data["llm_call"]["messages"]:
+                    for tool_call in getattr(message,'tool_calls',None) or []:
+                        yield "tool_call", {"id":tool_call["id"], "name":tool_call["name"], "args":tool_call["args"]}
+
+        elif mode=="messages":
+            chunk, metadata=data
+            if metadata.get("langgraph_node")!="llm_call":
+                continue
+
+            # Tool-call arguments arrive as JSON fragments; re-parse the partial
+            # JSON and emit only the part of `content` not sent yet.
+            for tool_call_chunk in getattr(chunk,'tool_call_chunks',None) or []:
+                draft=drafts.setdefault((chunk.id, tool_call_chunk.get("index")), {"name":None, "args":"", "sent":0})
+                draft["name"]=draft["name"] or tool_call_chunk.get("name")
+                draft["args"]+=tool_call_chunk.get("args") or ""
+                if draft["name"]!="write_email":
+                    continue
+
+                try:
+                    partial=parse_partial_json(draft["args"]) or {}
+                except ValueError:
+                    continue
+                content=(partial.get("content") or "") if isinstance(partial, dict) else ""
+                if len(content)>draft["sent"]:
+                    yield "draft", {"delta":content[draft["sent"]:]}
+                    draft["sent"]=len(content)
+
+    yield "result", _format_result(final_state)
+
+
+def _failed_result(error:Exception)->dict:
+    return {
+        "classification":None,
+        "response":"No response generated",
+        "reasoning":"Processing failed",
+        "compaction_tokens_saved":0,
+        "thread_chars_removed":0,
+        "error":f"{type(error).__name__}: {error}"
     }
 
 
+def _superseded_result(latest_result:dict, latest_index:int)->dict:
+    return {
+        "classification":latest_result["classification"],
+        "response":"No response generated",
+        "reasoning":f"Earlier message in a conversation; email {latest_index} was processed with it as context",
+        "compaction_tokens_saved":0,
+        "thread_chars_removed":0,
+        "superseded_by":latest_index,
+        "error":latest_result.get("error")
+    }
+
+
+async def process_emails_batch(email_inputs:list[dict], max_concurrency:int=BATCH_MAX_CONCURRENCY, group_conversations:bool=BATCH_GROUP_CONVERSATIONS)->list[dict]:
+    # Fan out over the whole batch but keep at most `max_concurrency` graphs
+    # (and therefore LLM calls) in flight.
+    semaphore=asyncio.Semaphore(max_concurrency)
+
+    async def _process(email_input:dict)->dict:
+        # One failing email must not fail the rest of the batch.
+        async with semaphore:
+            try:
+                return await aprocess_email(email_input)
+            except Exception as e:
+                tracing.error("batch.email_failed", error=str(e))
+                return _failed_result(e)
+
+    # Only the newest message of each conversation runs through the graph,
+    # with the earlier ones attached as context.
+    if group_conversations:
+        groups=_group_conversations(email_inputs)
+    else:
+        groups=[[index] for index in range(len(email_inputs))]
+    latest=[group[-1] for group in groups]
+    merged=[with_earlier_messages(email_inputs[group[-1]], [email_inputs[index] for index in group[:-1]]) for group in groups]
+
+    # One email per near-duplicate cluster goes first; each of the rest starts
+    # once its own representative is done and finds that triage decision in
+    # the near-duplicate index instead of asking the LLM.
+    labels=cluster_near_duplicates([normalize_email_input(email_input)[0] for email_input in merged])
+    tasks={position:asyncio.ensure_future(_process(merged[position])) for position, label in enumerate(labels) if label==position}
+
+    async def _after_representative(position:int)->dict:
+        await tasks[labels[position]]
+        return await _process(merged[position])
+
+    for position, label in enumerate(labels):
+        if label!=position:
+            tasks[position]=asyncio.ensure_future(_after_representative(position))
+
+    results=[None]*len(email_inputs)
+    for position, result in enumerate(await asyncio.gather(*(tasks[position] for position in range(len(labels))))):
+        results[latest[position]]=result
+    for group in groups:
+        for index in group[:-1]:
+            results[index]=_superseded_result(results[group[-1]], group[-1])
+    return results
+
+
 
 
 
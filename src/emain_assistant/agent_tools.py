@@ -1,7 +1,21 @@
 
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.tools import tool 
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import contextvars
+import os
+from calendar_engine import calendar_engine
+from metrics import record_tool_calls
+
+
+TOOL_MAX_WORKERS=int(os.getenv("TOOL_MAX_WORKERS","8"))
+
+# Id of the tool call being executed, so tools with side effects can make
+# them idempotent: HITL nodes re-run earlier accepted calls when they resume.
+_current_tool_call_id:contextvars.ContextVar[Optional[str]]=contextvars.ContextVar("current_tool_call_id", default=None)
 
 
 
@@ -20,7 +34,11 @@ def check_calendar_availability(
 ) -> str:
     """Check calendar availability for meeting attendees."""
     date_str = preferred_day.strftime("%A, %B %d, %Y")
-    return f" All attendess available on {date_str} between 9:00-17:00"
+    slots = calendar_engine.find_slots(attendees, preferred_day.date(), preferred_day.date(), duration_minutes)
+    if not slots:
+        return f"No {duration_minutes} minute slot on {date_str} where all attendees are available"
+    times = ", ".join(f"{start:%H:%M}-{end:%H:%M}" for start, end in slots)
+    return f"All attendees available on {date_str} at: {times}"
 
 
 @tool
@@ -32,8 +50,24 @@ def schedule_meeting(
     start_time: int
 ):
     """Schedular a calendar meeting"""
+    # Bookings are kept by the process-local calendar engine: they are lost on
+    # restart and not shared between server workers.
     date_str= preferred_day.strftime("%A, %B %d, %Y")
-    return f" Meeting '{subject}', scheduled on {date_str} at {start_time}"
+    # start_time is an hour (14) or HHMM (1430); 24-99 is neither.
+    hour, minute = (start_time, 0) if 0 <= start_time < 24 else divmod(start_time, 100)
+    if start_time < 0 or 24 <= start_time < 100 or not (0 <= hour < 24 and 0 <= minute < 60):
+        return f"Invalid start_time {start_time}: use an hour (0-23) or HHMM (e.g. 1430)"
+    if duration_minutes <= 0:
+        return f"Invalid duration_minutes {duration_minutes}: must be positive"
+    start = datetime.combine(preferred_day.date(), time(hour, minute))
+    end = start + timedelta(minutes=duration_minutes)
+
+    conflicting = calendar_engine.book(attendees, start, end, booking_id=_current_tool_call_id.get())
+    if conflicting:
+        alternatives = calendar_engine.find_slots(attendees, preferred_day.date(), preferred_day.date(), duration_minutes)
+        suggestion = ", ".join(f"{slot_start:%H:%M}" for slot_start, _ in alternatives) or "none that day"
+        return f"Cannot schedule '{subject}' on {date_str} at {start:%H:%M}: conflicts for {', '.join(conflicting)}. Free start times: {suggestion}"
+    return f" Meeting '{subject}', scheduled on {date_str} at {start:%H:%M}"
 
 
 @tool
@@ -47,4 +81,46 @@ TOOLS=[
     check_calendar_availability,
     schedule_meeting,
     Done
-]
\ No newline at end of file
+]
+
+
+tools_by_name={tool.name:tool for tool in TOOLS}
+
+_tool_executor=ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+
+
+def invoke_tool(tool_call:dict, args:Optional[dict]=None):
+    """Run one tool call, with `args` (e.g. reviewer-edited) in place of the model's if given."""
+    token=_current_tool_call_id.set(tool_call.get('id'))
+    try:
+        return tools_by_name[tool_call['name']].invoke(tool_call['args'] if args is None else args)
+    finally:
+        _current_tool_call_id.reset(token)
+
+
+async def ainvoke_tool(tool_call:dict, args:Optional[dict]=None):
+    token=_current_tool_call_id.set(tool_call.get('id'))
+    try:
+        return await tools_by_name[tool_call['name']].ainvoke(tool_call['args'] if args is None else args)
+    finally:
+        _current_tool_call_id.reset(token)
+
+
+def run_tool_calls(tool_calls:list)->list:
+    """Run independent tool calls concurrently; observations come back in call order."""
+    record_tool_calls(tool_calls)
+    if len(tool_calls)<=1:
+        return [invoke_tool(tool_call) for tool_call in tool_calls]
+
+    # Each call runs in a copy of the caller's context so callbacks and
+    # tracing configured for the graph step still apply inside the pool.
+    futures=[
+        _tool_executor.submit(contextvars.copy_context().run, invoke_tool, tool_call)
+        for tool_call in tool_calls
+    ]
+    return [future.result() for future in futures]
+
+
+async def arun_tool_calls(tool_calls:list)->list:
+    record_tool_calls(tool_calls)
+    return list(await asyncio.gather(*(ainvoke_tool(tool_call) for tool_call in tool_calls)))
@@ -0,0 +1,210 @@
+"""Offline load test for the FastAPI app, driven in-process against the fake chat model.
+
+    python benchmark.py --scenario all --requests 200 --concurrency 16 --latency-ms 50
+
+Reports throughput, p50/p95/p99 latency and RSS per endpoint. With the model
+latency fixed, changes in these numbers are FastAPI/LangGraph overhead.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import resource
+import time
+import uuid
+
+
+def _percentile(values:list, pct:float)->float:
+    if not values:
+        return 0.0
+    ordered=sorted(values)
+    index=max(0, min(len(ordered)-1, math.ceil(pct/100*len(ordered))-1))
+    return ordered[index]
+
+
+def _rss_mb()->float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+    except OSError:
+        return 0.0
+
+
+def _peak_rss_mb()->float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def _email(index:int, unique:bool)->dict:
+    suffix=f" #{index}-{uuid.uuid4().hex[:8]}" if unique else ""
+    return {
+        "author":"Alice Smith <alice.smith@company.com>",
+        "to":"John Doe <john.doe@company.com>",
+        "subject":f"Question about the quarterly report{suffix}",
+        "email_thread":"Hi John,\n\nCould you send me the latest numbers for the quarterly report before Friday?\n\nThanks,\nAlice"
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies={}
+        self.errors={}
+
+    def record(self, name:str, seconds:float, ok:bool)->None:
+        self.latencies.setdefault(name, [])
+        self.errors.setdefault(name, 0)
+        if ok:
+            self.latencies[name].append(seconds)
+        else:
+            self.errors[name]+=1
+
+    async def timed(self, name:str, request)->dict:
+        start=time.perf_counter()
+        try:
+            response=await request
+            ok=response.status_code==200
+            return response.json() if ok else {}
+        except Exception:
+            ok=False
+            return {}
+        finally:
+            self.record(name, time.perf_counter()-start, ok)
+
+
+async def _process_email(client, recorder:Recorder, index:int, unique:bool)->None:
+    await recorder.timed("process_email", client.post("/process-email", json={"email":_email(index, unique)}))
+
+
+async def _process_email_hitl(client, recorder:Recorder, index:int, unique:bool)->None:
+    # One HITL operation is a new thread that interrupts, then resumes with accept.
+    body=await recorder.timed("hitl_new", client.post("/process-email-hitl", json={"email":_email(index, unique)}))
+    if body.get("status")!="interrupted":
+        return
+    await recorder.timed("hitl_resume", client.post("/process-email-hitl", json={
+        "thread_id":body["thread_id"],
+        "human_response":{"type":"accept", "args":{}}
+    }))
+
+
+SCENARIOS={
+    "process":_process_email,
+    "hitl":_process_email_hitl,
+}
+
+
+async def _run(app, scenario, requests:int, concurrency:int, unique:bool, recorder:Recorder)->float:
+    import httpx
+
+    counter=iter(range(requests))
+
+    async def worker(client):
+        for index in counter:
+            await scenario(client, recorder, index, unique)
+
+    transport=httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start=time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter()-start
+
+
+def run_benchmark(scenarios:list, requests:int, concurrency:int, warmup:int=10, unique:bool=True, quiet:bool=True)->dict:
+    # Imported here so the environment set up by main() is in place first.
+    start=time.perf_counter()
+    import main as service
+    import_seconds=time.perf_counter()-start
+
+    report={"config":{"requests":requests, "concurrency":concurrency, "latency_ms":os.getenv("FAKE_LLM_LATENCY_MS","0"), "model":os.getenv("LLM_MODEL")}, "scenarios":{}}
+    report["cold_start_seconds"]={"import":round(import_seconds, 4), **service.graph_factory.warm_up()}
+    output=open(os.devnull, "w") if quiet else None
+
+    try:
+        for name in scenarios:
+            scenario=SCENARIOS[name]
+            with (contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext()):
+                asyncio.run(_run(service.app, scenario, warmup, min(concurrency, max(warmup,1)), unique, Recorder()))
+                recorder=Recorder()
+                rss_before=_rss_mb()
+                elapsed=asyncio.run(_run(service.app, scenario, requests, concurrency, unique, recorder))
+
+            report["scenarios"][name]={
+                "elapsed_seconds":round(elapsed, 3),
+                "throughput_per_second":round(requests/elapsed, 2) if elapsed else 0.0,
+                "rss_mb_before":round(rss_before, 1),
+                "rss_mb_after":round(_rss_mb(), 1),
+                "endpoints":{
+                    endpoint:{
+                        "count":len(latencies),
+                        "errors":recorder.errors[endpoint],
+                        "p50_ms":round(_percentile(latencies, 50)*1000, 2),
+                        "p95_ms":round(_percentile(latencies, 95)*1000, 2),
+                        "p99_ms":round(_percentile(latencies, 99)*1000, 2),
+                        "max_ms":round(max(latencies, default=0)*1000, 2),
+                    }
+                    for endpoint, latencies in recorder.latencies.items()
+                }
+            }
+    finally:
+        service.memory_worker.stop(timeout=30)
+        if output is not None:
+            output.close()
+
+    report["peak_rss_mb"]=round(_peak_rss_mb(), 1)
+    return report
+
+
+def _print_report(report:dict)->None:
+    config=report["config"]
+    print(f"model={config['model']} latency_ms={config['latency_ms']} requests={config['requests']} concurrency={config['concurrency']}")
+    print(f"{'scenario':<10} {'endpoint':<15} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'rss MB':>8}")
+    for name, result in report["scenarios"].items():
+        for endpoint, stats in result["endpoints"].items():
+            print(
+                f"{name:<10} {endpoint:<15} {stats['count']:>6} {stats['errors']:>6} "
+                f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+                f"{result['throughput_per_second']:>8.2f} {result['rss_mb_after']:>8.1f}"
+            )
+    print(f"peak rss: {report['peak_rss_mb']} MB")
+    print("cold start (s): "+", ".join(f"{key}={value}" for key, value in report["cold_start_seconds"].items()))
+
+
+def main()->None:
+    parser=argparse.ArgumentParser(description="Offline load test for the email assistant API.")
+    parser.add_argument("--scenario", choices=["process","hitl","all"], default="all")
+    parser.add_argument("--requests", type=int, default=200, help="Operations per scenario (a HITL operation is new + resume)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake model latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--classification", choices=["respond","notify","ignore"], default="respond")
+    parser.add_argument("--repeat-emails", action="store_true", help="Send identical emails, so the triage cache answers after the first (and leave near-duplicate matching on)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's own output")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path")
+    args=parser.parse_args()
+
+    # The model registry and module-level graphs read these at import time.
+    os.environ["LLM_MODEL"]="fake:benchmark"
+    os.environ["FAKE_LLM_LATENCY_MS"]=str(args.latency_ms)
+    os.environ["FAKE_LLM_JITTER_MS"]=str(args.jitter_ms)
+    os.environ["FAKE_LLM_CLASSIFICATION"]=args.classification
+    os.environ.setdefault("OPENAI_API_KEY","offline-benchmark")
+    if not args.repeat_emails:
+        # Unique emails differ only in their subject suffix, which the
+        # near-duplicate index would (rightly) collapse; keep them on the LLM path.
+        os.environ.setdefault("DEDUP_WINDOW_SECONDS","0")
+    if not args.verbose:
+        os.environ.setdefault("TRACE_LEVEL","WARNING")
+
+    scenarios=list(SCENARIOS) if args.scenario=="all" else [args.scenario]
+    report=run_benchmark(scenarios, args.requests, args.concurrency, args.warmup, not args.repeat_emails, not args.verbose)
+
+    _print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,252 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+
+CALENDAR_DIR=os.getenv(
+    "CALENDAR_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),"calendars")
+)
+CALENDAR_TIMEZONE=ZoneInfo(os.getenv("CALENDAR_TIMEZONE","UTC"))
+WORKDAY_START_HOUR=int(os.getenv("WORKDAY_START_HOUR","9"))
+WORKDAY_END_HOUR=int(os.getenv("WORKDAY_END_HOUR","17"))
+CALENDAR_SLOT_STEP_MINUTES=int(os.getenv("CALENDAR_SLOT_STEP_MINUTES","30"))
+CALENDAR_SLOT_COUNT=int(os.getenv("CALENDAR_SLOT_COUNT","3"))
+
+Interval=Tuple[datetime, datetime]
+
+_ADDRESS=re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_DURATION=re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def attendee_key(attendee:str)->str:
+    match=_ADDRESS.search(attendee)
+    return (match.group(0) if match else attendee).strip().lower()
+
+
+def _parse_ics_datetime(value:str, params:Dict[str, str])->Tuple[datetime, bool]:
+    """Return a naive datetime in CALENDAR_TIMEZONE and whether it was an all-day date."""
+    value=value.strip()
+    if params.get("VALUE")=="DATE" or len(value)==8:
+        return datetime.strptime(value[:8],"%Y%m%d"), True
+
+    if value.endswith("Z"):
+        parsed=datetime.strptime(value[:-1],"%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    elif "TZID" in params:
+        parsed=datetime.strptime(value,"%Y%m%dT%H%M%S").replace(tzinfo=ZoneInfo(params["TZID"]))
+    else:
+        # Floating time: already local to the calendar's owner.
+        return datetime.strptime(value,"%Y%m%dT%H%M%S"), False
+    return parsed.astimezone(CALENDAR_TIMEZONE).replace(tzinfo=None), False
+
+
+def _parse_ics_duration(value:str)->timedelta:
+    match=_DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid DURATION: {value}")
+    sign, weeks, days, hours, minutes, seconds=match.groups()
+    delta=timedelta(
+        weeks=int(weeks or 0), days=int(days or 0),
+        hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0)
+    )
+    return -delta if sign=="-" else delta
+
+
+def _unfold(lines:Iterable[str])->Iterator[str]:
+    current=None
+    for line in lines:
+        line=line.rstrip("\r\n")
+        if line[:1] in (" ","\t") and current is not None:
+            current+=line[1:]
+            continue
+        if current is not None:
+            yield current
+        current=line
+    if current is not None:
+        yield current
+
+
+def parse_ics_busy(lines:Iterable[str])->List[Interval]:
+    """Busy intervals of the VEVENTs in an ICS stream (cancelled/transparent events skipped).
+
+    Recurring events (RRULE) are only counted for their first occurrence.
+    """
+    busy=[]
+    event=None
+    for line in _unfold(lines):
+        if line=="BEGIN:VEVENT":
+            event={}
+            continue
+        if line=="END:VEVENT":
+            if event and "DTSTART" in event and event.get("STATUS")!="CANCELLED" and event.get("TRANSP")!="TRANSPARENT":
+                start, all_day=_parse_ics_datetime(*event["DTSTART"])
+                if "DTEND" in event:
+                    end, _=_parse_ics_datetime(*event["DTEND"])
+                elif "DURATION" in event:
+                    end=start+_parse_ics_duration(event["DURATION"][0])
+                else:
+                    end=start+timedelta(days=1) if all_day else start
+                if end>start:
+                    busy.append((start, end))
+            event=None
+            continue
+        if event is None or ":" not in line:
+            continue
+
+        name_params, value=line.split(":",1)
+        name, *raw_params=name_params.split(";")
+        params=dict(param.split("=",1) for param in raw_params if "=" in param)
+        name=name.upper()
+        if name in ("DTSTART","DTEND","DURATION"):
+            event[name]=(value, params)
+        elif name in ("STATUS","TRANSP"):
+            event[name]=value.strip().upper()
+    return busy
+
+
+class BusyIndex:
+    """Sorted, non-overlapping busy intervals with bisect lookups.
+
+    Never changed after construction, so a slot search can keep reading an
+    index while a booking swaps in a new one.
+    """
+
+    def __init__(self, intervals:Iterable[Interval]=()):
+        self.starts:List[datetime]=[]
+        self.ends:List[datetime]=[]
+        for start, end in sorted(intervals):
+            if self.ends and start<=self.ends[-1]:
+                self.ends[-1]=max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlapping(self, lo:datetime, hi:datetime)->Iterator[Interval]:
+        index=bisect.bisect_right(self.ends, lo)
+        while index<len(self.starts) and self.starts[index]<hi:
+            yield self.starts[index], self.ends[index]
+            index+=1
+
+    def is_free(self, lo:datetime, hi:datetime)->bool:
+        return next(self.overlapping(lo, hi), None) is None
+
+    def added(self, start:datetime, end:datetime)->"BusyIndex":
+        """A copy of this index with `start`-`end` also busy."""
+        lo=bisect.bisect_left(self.ends, start)
+        hi=bisect.bisect_right(self.starts, end)
+        if lo<hi:
+            start=min(start, self.starts[lo])
+            end=max(end, self.ends[hi-1])
+        index=BusyIndex()
+        index.starts=self.starts[:lo]+[start]+self.starts[hi:]
+        index.ends=self.ends[:lo]+[end]+self.ends[hi:]
+        return index
+
+
+class CalendarEngine:
+    """Free/busy queries over per-attendee ICS files (`<address>.ics` in `calendar_dir`).
+
+    Indexes are built on first use and rebuilt when the file changes. Meetings
+    booked through `book` are kept in memory on top of the file contents, so
+    they are lost on restart and not shared between processes. Attendees
+    without a calendar file are treated as always free.
+    """
+
+    def __init__(self, calendar_dir:str=CALENDAR_DIR):
+        self.calendar_dir=calendar_dir
+        self._lock=threading.RLock()
+        self._indexes:Dict[str, Tuple[Optional[float], BusyIndex]]={}
+        self._booked:Dict[str, List[Interval]]={}
+        self._booking_ids:Dict[str, Interval]={}
+
+    def _path(self, attendee:str)->str:
+        return os.path.join(self.calendar_dir, f"{attendee}.ics")
+
+    def index(self, attendee:str)->BusyIndex:
+        attendee=attendee_key(attendee)
+        path=self._path(attendee)
+        try:
+            mtime=os.path.getmtime(path)
+        except OSError:
+            mtime=None
+
+        with self._lock:
+            cached=self._indexes.get(attendee)
+            if cached is not None and cached[0]==mtime:
+                return cached[1]
+
+            busy=[]
+            if mtime is not None:
+                with open(path, encoding="utf-8") as f:
+                    busy=parse_ics_busy(f)
+            index=BusyIndex(busy+self._booked.get(attendee, []))
+            self._indexes[attendee]=(mtime, index)
+            return index
+
+    def _working_windows(self, start:date, end:date)->Iterator[Interval]:
+        day=start
+        while day<=end:
+            yield (
+                datetime.combine(day, time(WORKDAY_START_HOUR)),
+                datetime.combine(day, time(WORKDAY_END_HOUR))
+            )
+            day+=timedelta(days=1)
+
+    def find_slots(self, attendees:List[str], start:date, end:date, duration_minutes:int, k:int=CALENDAR_SLOT_COUNT)->List[Interval]:
+        """Earliest `k` working-hour slots between `start` and `end` (inclusive) free for everyone."""
+        duration=timedelta(minutes=duration_minutes)
+        step=timedelta(minutes=CALENDAR_SLOT_STEP_MINUTES)
+        indexes=[self.index(attendee) for attendee in attendees]
+        slots=[]
+
+        for window_start, window_end in self._working_windows(start, end):
+            # Union of everyone's busy time inside the window, as one sorted stream.
+            busy=heapq.merge(*(index.overlapping(window_start, window_end) for index in indexes))
+            cursor=window_start
+            for busy_start, busy_end in list(busy)+[(window_end, window_end)]:
+                gap_end=min(busy_start, window_end)
+                while cursor+duration<=gap_end:
+                    slots.append((cursor, cursor+duration))
+                    if len(slots)>=k:
+                        return slots
+                    cursor+=step
+                if busy_end>cursor:
+                    cursor=busy_end
+                    # Re-align to the slot grid after a busy block.
+                    offset=(cursor-window_start)%step
+                    if offset:
+                        cursor+=step-offset
+        return slots
+
+    def conflicts(self, attendees:List[str], start:datetime, end:datetime)->List[str]:
+        return [attendee for attendee in attendees if not self.index(attendee).is_free(start, end)]
+
+    def book(self, attendees:List[str], start:datetime, end:datetime, booking_id:Optional[str]=None)->List[str]:
+        """Reserve the slot for all attendees; returns the conflicting attendees instead if any.
+
+        Booking again with a `booking_id` that already succeeded is a no-op
+        that succeeds, so a replayed request does not conflict with itself.
+        """
+        with self._lock:
+            if booking_id is not None and booking_id in self._booking_ids:
+                return []
+            conflicting=self.conflicts(attendees, start, end)
+            if conflicting:
+                return conflicting
+            for attendee in attendees:
+                key=attendee_key(attendee)
+                self._booked.setdefault(key, []).append((start, end))
+                cached=self._indexes.get(key)
+                if cached is not None:
+                    self._indexes[key]=(cached[0], cached[1].added(start, end))
+            if booking_id is not None:
+                self._booking_ids[booking_id]=(start, end)
+        return []
+
+
+calendar_engine=CalendarEngine()
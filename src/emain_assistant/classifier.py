@@ -0,0 +1,263 @@
+"""Local triage classifier: hashed n-gram features and a softmax linear model in NumPy.
+
+It is trained from the triage log (LLM decisions plus reviewer corrections)
+and only answers when its confidence clears a threshold; otherwise triage
+falls through to the LLM.
+
+    python classifier.py train --log triage_log.jsonl --out triage_model.npz
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from schemas import RouterSchema
+from triage_cache import email_fingerprint
+from triage_rules import CLASSIFICATIONS, sender_domain
+
+
+TRIAGE_LOG_PATH=os.getenv("TRIAGE_LOG_PATH")
+TRIAGE_CLASSIFIER_PATH=os.getenv("TRIAGE_CLASSIFIER_PATH")
+TRIAGE_CLASSIFIER_THRESHOLD=float(os.getenv("TRIAGE_CLASSIFIER_THRESHOLD","0.9"))
+TRIAGE_CLASSIFIER_FEATURES=int(os.getenv("TRIAGE_CLASSIFIER_FEATURES",str(2**18)))
+TRIAGE_CLASSIFIER_MIN_SAMPLES=int(os.getenv("TRIAGE_CLASSIFIER_MIN_SAMPLES","50"))
+TRIAGE_LOG_MAX_BODY_CHARS=int(os.getenv("TRIAGE_LOG_MAX_BODY_CHARS","4000"))
+
+_TOKEN=re.compile(r"[a-z0-9][a-z0-9'_-]*")
+_MAX_BODY_TOKENS=400
+
+
+def _ngrams(prefix:str, text:str, limit:Optional[int]=None)->List[str]:
+    tokens=_TOKEN.findall(text.lower())[:limit]
+    return [f"{prefix}:{token}" for token in tokens]+[f"{prefix}:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def featurize(author:str, to:str, subject:str, email_thread:str, n_features:int=TRIAGE_CLASSIFIER_FEATURES)->Tuple[np.ndarray, np.ndarray]:
+    """Hash sender, domain and subject/body unigrams+bigrams into an L2-normalised sparse vector."""
+    features=[f"d:{sender_domain(author)}", f"f:{author.lower().strip()}"]
+    features+=_ngrams("s", subject)
+    features+=_ngrams("b", email_thread, _MAX_BODY_TOKENS)
+
+    # crc32 rather than hash(): feature ids must be stable across processes.
+    hashed=np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.int64, count=len(features))
+    indices, counts=np.unique(hashed%n_features, return_counts=True)
+    values=counts.astype(np.float32)
+    values/=np.linalg.norm(values)
+    return indices, values
+
+
+class LinearTriageClassifier:
+    """Multinomial logistic regression over hashed features."""
+
+    def __init__(self, weights:np.ndarray, bias:np.ndarray, classes=CLASSIFICATIONS):
+        self.weights=weights
+        self.bias=bias
+        self.classes=tuple(classes)
+
+    @property
+    def n_features(self)->int:
+        return self.weights.shape[0]
+
+    def predict_proba(self, author:str, to:str, subject:str, email_thread:str)->np.ndarray:
+        indices, values=featurize(author, to, subject, email_thread, self.n_features)
+        logits=values@self.weights[indices]+self.bias
+        logits-=logits.max()
+        probabilities=np.exp(logits)
+        return probabilities/probabilities.sum()
+
+    def predict(self, author:str, to:str, subject:str, email_thread:str)->Tuple[str, float]:
+        probabilities=self.predict_proba(author, to, subject, email_thread)
+        best=int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    @classmethod
+    def fit(cls, samples:List[dict], labels:List[str], n_features:int=TRIAGE_CLASSIFIER_FEATURES, epochs:int=200, learning_rate:float=0.5, l2:float=1e-4)->"LinearTriageClassifier":
+        """Full-batch AdaGrad on the softmax cross-entropy, with L2 regularisation."""
+        rows, indices, values=[], [], []
+        for row, sample in enumerate(samples):
+            sample_indices, sample_values=featurize(sample["author"], sample["to"], sample["subject"], sample["email_thread"], n_features)
+            rows.append(np.full(len(sample_indices), row))
+            indices.append(sample_indices)
+            values.append(sample_values)
+        rows=np.concatenate(rows)
+        indices=np.concatenate(indices)
+        values=np.concatenate(values)
+
+        n_samples, n_classes=len(samples), len(CLASSIFICATIONS)
+        targets=np.zeros((n_samples, n_classes), dtype=np.float32)
+        targets[np.arange(n_samples), [CLASSIFICATIONS.index(label) for label in labels]]=1.0
+
+        weights=np.zeros((n_features, n_classes), dtype=np.float32)
+        bias=np.zeros(n_classes, dtype=np.float32)
+        weights_g2=np.full_like(weights, 1e-8)
+        bias_g2=np.full_like(bias, 1e-8)
+
+        for _ in range(epochs):
+            logits=np.zeros((n_samples, n_classes), dtype=np.float32)
+            for c in range(n_classes):
+                logits[:, c]=np.bincount(rows, weights=values*weights[indices, c], minlength=n_samples)
+            logits+=bias
+            logits-=logits.max(axis=1, keepdims=True)
+            probabilities=np.exp(logits)
+            probabilities/=probabilities.sum(axis=1, keepdims=True)
+
+            errors=(probabilities-targets)/n_samples
+            weights_grad=np.empty_like(weights)
+            for c in range(n_classes):
+                weights_grad[:, c]=np.bincount(indices, weights=values*errors[rows, c], minlength=n_features)
+            weights_grad+=l2*weights
+            bias_grad=errors.sum(axis=0)
+
+            weights_g2+=weights_grad**2
+            bias_g2+=bias_grad**2
+            weights-=learning_rate*weights_grad/np.sqrt(weights_g2)
+            bias-=learning_rate*bias_grad/np.sqrt(bias_g2)
+
+        return cls(weights, bias)
+
+    def save(self, path:str)->None:
+        tmp_path=f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, classes=np.array(self.classes))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path:str)->"LinearTriageClassifier":
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], [str(c) for c in data["classes"]])
+
+
+class TriageClassifierTier:
+    """The classifier as a triage tier: answers only above `threshold`, reloads when the model file changes."""
+
+    def __init__(self, path:Optional[str]=TRIAGE_CLASSIFIER_PATH, threshold:float=TRIAGE_CLASSIFIER_THRESHOLD):
+        self.path=path
+        self.threshold=threshold
+        self.model:Optional[LinearTriageClassifier]=None
+        self._mtime=None
+        self._checked=None
+        self._lock=threading.Lock()
+
+    def _current_model(self)->Optional[LinearTriageClassifier]:
+        if not self.path:
+            return None
+        now=time.monotonic()
+        if self._checked is not None and now-self._checked<5:
+            return self.model
+        with self._lock:
+            self._checked=now
+            try:
+                mtime=os.stat(self.path).st_mtime
+            except OSError:
+                return self.model
+            if mtime!=self._mtime:
+                self.model=LinearTriageClassifier.load(self.path)
+                self._mtime=mtime
+        return self.model
+
+    def match(self, author:str, to:str, subject:str, email_thread:str)->Tuple[Optional[RouterSchema], Optional[float]]:
+        """Return (decision, confidence); decision is None when the tier abstains."""
+        model=self._current_model()
+        if model is None:
+            return None, None
+        classification, confidence=model.predict(author, to, subject, email_thread)
+        if confidence<self.threshold:
+            return None, confidence
+        return RouterSchema(
+            reasoning=f"Local classifier predicted '{classification}' with confidence {confidence:.2f}",
+            classification=classification
+        ), confidence
+
+
+class TriageLog:
+    """Append-only JSONL of triage labels (LLM decisions and reviewer corrections) for training."""
+
+    def __init__(self, path:Optional[str]=TRIAGE_LOG_PATH):
+        self.path=path
+        self._lock=threading.Lock()
+
+    def record(self, email_input:dict, classification:str, source:str)->None:
+        if not self.path:
+            return
+        entry={
+            "ts":time.time(),
+            "author":email_input.get("author",""),
+            "to":email_input.get("to",""),
+            "subject":email_input.get("subject",""),
+            "email_thread":email_input.get("email_thread","")[:TRIAGE_LOG_MAX_BODY_CHARS],
+            "classification":classification,
+            "source":source,
+        }
+        line=json.dumps(entry)+"\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def load_training_set(path:str)->Tuple[List[dict], List[str]]:
+    """Latest label per email, with reviewer corrections overriding LLM decisions."""
+    latest={}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry=json.loads(line)
+            key=email_fingerprint(entry["author"], entry["to"], entry["subject"], entry["email_thread"])
+            previous=latest.get(key)
+            if previous is not None and previous["source"]=="human" and entry["source"]!="human":
+                continue
+            latest[key]=entry
+    samples=list(latest.values())
+    return samples, [sample["classification"] for sample in samples]
+
+
+def train(log_path:str, out_path:str, holdout:float=0.1, threshold:float=TRIAGE_CLASSIFIER_THRESHOLD, seed:int=0, **fit_kwargs)->dict:
+    samples, labels=load_training_set(log_path)
+    if len(samples)<TRIAGE_CLASSIFIER_MIN_SAMPLES:
+        raise ValueError(f"Need at least {TRIAGE_CLASSIFIER_MIN_SAMPLES} labelled emails, found {len(samples)}")
+
+    order=np.random.default_rng(seed).permutation(len(samples))
+    n_holdout=int(len(samples)*holdout)
+    test, fit=order[:n_holdout], order[n_holdout:]
+
+    report={"samples":len(samples), "holdout":n_holdout}
+    if n_holdout:
+        model=LinearTriageClassifier.fit([samples[i] for i in fit], [labels[i] for i in fit], **fit_kwargs)
+        predictions=[model.predict(samples[i]["author"], samples[i]["to"], samples[i]["subject"], samples[i]["email_thread"]) for i in test]
+        confident=[(label, labels[i]) for (label, confidence), i in zip(predictions, test) if confidence>=threshold]
+        report["holdout_accuracy"]=round(float(np.mean([label==labels[i] for (label, _), i in zip(predictions, test)])), 4)
+        report["coverage_at_threshold"]=round(len(confident)/n_holdout, 4)
+        report["accuracy_at_threshold"]=round(float(np.mean([a==b for a, b in confident])), 4) if confident else None
+
+    # The shipped model is trained on everything.
+    LinearTriageClassifier.fit(samples, labels, **fit_kwargs).save(out_path)
+    report["model"]=out_path
+    return report
+
+
+triage_classifier=TriageClassifierTier()
+triage_log=TriageLog()
+
+
+def main()->None:
+    parser=argparse.ArgumentParser(description="Local triage classifier.")
+    commands=parser.add_subparsers(dest="command", required=True)
+    train_parser=commands.add_parser("train", help="Train from the triage log and write the model file")
+    train_parser.add_argument("--log", default=TRIAGE_LOG_PATH, required=TRIAGE_LOG_PATH is None)
+    train_parser.add_argument("--out", default=TRIAGE_CLASSIFIER_PATH, required=TRIAGE_CLASSIFIER_PATH is None)
+    train_parser.add_argument("--holdout", type=float, default=0.1)
+    train_parser.add_argument("--threshold", type=float, default=TRIAGE_CLASSIFIER_THRESHOLD)
+    train_parser.add_argument("--epochs", type=int, default=200)
+    args=parser.parse_args()
+
+    report=train(args.log, args.out, args.holdout, args.threshold, epochs=args.epochs)
+    print(json.dumps(report))
+
+
+if __name__=="__main__":
+    main()
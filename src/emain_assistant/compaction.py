@@ -0,0 +1,73 @@
+import os
+from typing import List, Tuple
+
+
+AGENT_CONTEXT_TOKEN_BUDGET=int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET","6000"))
+COMPACTION_KEEP_RECENT=int(os.getenv("COMPACTION_KEEP_RECENT","3"))
+COMPACTION_TOOL_RESULT_CHARS=int(os.getenv("COMPACTION_TOOL_RESULT_CHARS","300"))
+COMPACTION_MESSAGE_CHARS=int(os.getenv("COMPACTION_MESSAGE_CHARS","2000"))
+
+# Rough OpenAI-tokenizer ratio for English text; good enough for budgeting
+# without loading a tokenizer on the hot path.
+CHARS_PER_TOKEN=4
+
+
+def _role(message)->str:
+    if isinstance(message, dict):
+        return message.get("role","")
+    return getattr(message,'type','')
+
+
+def _content(message)->str:
+    content=message.get("content","") if isinstance(message, dict) else getattr(message,'content','')
+    return content if isinstance(content, str) else str(content)
+
+
+def _with_content(message, content:str):
+    if isinstance(message, dict):
+        return {**message, "content":content}
+    return message.model_copy(update={"content":content})
+
+
+def estimate_tokens(text:str)->int:
+    return (len(text)+CHARS_PER_TOKEN-1)//CHARS_PER_TOKEN
+
+
+def _trim(text:str, limit:int)->str:
+    # Keep the head and the tail: greetings/questions sit at the start of an
+    # email, sign-offs and deadlines often at the end.
+    removed=len(text)-limit
+    head=limit*2//3
+    tail=limit-head
+    return f"{text[:head]}\n[... {removed} characters trimmed ...]\n{text[len(text)-tail:] if tail else ''}"
+
+
+def compact_messages(messages:List, budget:int=AGENT_CONTEXT_TOKEN_BUDGET, reserved_tokens:int=0)->Tuple[List, int]:
+    """Trim older messages until the history fits in `budget` tokens.
+
+    The last `COMPACTION_KEEP_RECENT` messages are never touched. Older tool
+    results are cut first, then older long messages (the quoted email itself,
+    mostly). Messages are never dropped, so every tool call keeps its result.
+    Returns the compacted list and the estimated number of tokens saved.
+    """
+    total=reserved_tokens+sum(estimate_tokens(_content(message)) for message in messages)
+    if total<=budget:
+        return messages, 0
+
+    compacted=list(messages)
+    saved=0
+    older=range(max(len(compacted)-COMPACTION_KEEP_RECENT, 0))
+
+    for roles, limit in ((("tool",), COMPACTION_TOOL_RESULT_CHARS), (("human","user","ai","assistant"), COMPACTION_MESSAGE_CHARS)):
+        for index in older:
+            if total-saved<=budget:
+                return compacted, saved
+            message=compacted[index]
+            content=_content(message)
+            if _role(message) not in roles or len(content)<=limit+64:
+                continue
+            trimmed=_trim(content, limit)
+            saved+=estimate_tokens(content)-estimate_tokens(trimmed)
+            compacted[index]=_with_content(message, trimmed)
+
+    return compacted, saved
@@ -0,0 +1,62 @@
+import re
+from email.utils import getaddresses
+from typing import FrozenSet, List, Optional, Tuple
+
+from utils import normalize_email_thread, THREAD_NORMALIZED
+
+
+_REPLY_PREFIX=re.compile(r"^\s*(?:(?:re|fwd?|aw|wg|sv|antw)\s*(?:\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_WHITESPACE=re.compile(r"\s+")
+
+
+def normalize_subject(subject:str)->str:
+    """Subject without reply/forward prefixes ("Re:", "Fwd:", "RE[2]:", ...), case-folded."""
+    return _WHITESPACE.sub(" ", _REPLY_PREFIX.sub("", subject or "")).strip().casefold()
+
+
+def participants(email_input:dict)->FrozenSet[str]:
+    # Sender and recipients together, so a reply (with the two swapped) lands
+    # in the same conversation as the message it answers.
+    addresses=getaddresses([email_input.get("author",""), email_input.get("to","")])
+    return frozenset(address.lower() for _, address in addresses if address)
+
+
+def conversation_key(email_input:dict)->Optional[Tuple[str, FrozenSet[str]]]:
+    """(normalized subject, participants); None when there is no subject to group on."""
+    subject=normalize_subject(email_input.get("subject",""))
+    if not subject:
+        return None
+    return subject, participants(email_input)
+
+
+def group_conversations(email_inputs:List[dict])->List[List[int]]:
+    """Indices of the emails grouped by conversation, each group oldest first.
+
+    Emails are taken to be in arrival order, so the last index of a group is
+    its newest message. Groups are ordered by their first message.
+    """
+    groups={}
+    ungrouped=0
+    for index, email_input in enumerate(email_inputs):
+        key=conversation_key(email_input)
+        if key is None:
+            key=("", ungrouped)
+            ungrouped+=1
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+
+def with_earlier_messages(latest:dict, earlier:List[dict])->dict:
+    """Copy of `latest` with the earlier messages of its conversation appended as context.
+
+    Each body is normalized on its own and the result is marked as already
+    normalized, so triage does not normalize the merged thread again: a line
+    of one message that looks like a signature delimiter or disclaimer would
+    otherwise cut off every message after it.
+    """
+    if not earlier:
+        return latest
+    parts=[normalize_email_thread(latest.get("email_thread","")).text, "", "Earlier messages in this conversation, oldest first:"]
+    for email_input in earlier:
+        parts+=["", f"[{email_input.get('author','')} | {email_input.get('subject','')}]", normalize_email_thread(email_input.get("email_thread","")).text]
+    return {**latest, "email_thread":"\n".join(parts), THREAD_NORMALIZED:True}
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from schemas import RouterSchema
+from triage_rules import sender_domain
+
+
+DEDUP_WINDOW_SECONDS=float(os.getenv("DEDUP_WINDOW_SECONDS","3600"))
+# A one-name change in an email of 40+ tokens is nearly always within 4 bits,
+# while unrelated long emails with a similar vocabulary can come within 6.
+DEDUP_MAX_DISTANCE=int(os.getenv("DEDUP_MAX_DISTANCE","4"))
+DEDUP_MAX_ENTRIES=int(os.getenv("DEDUP_MAX_ENTRIES","50000"))
+DEDUP_MIN_TOKENS=int(os.getenv("DEDUP_MIN_TOKENS","12"))
+
+BANDS=8
+BAND_BITS=64//BANDS
+_BAND_MASK=(1<<BAND_BITS)-1
+
+_URL=re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_EMAIL_ADDRESS=re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_DIGITS=re.compile(r"\d+")
+_TOKEN=re.compile(r"\w+")
+
+
+def _tokens(subject:str, email_thread:str)->List[str]:
+    # Tracking links, addresses and numbers are what personalised copies of one
+    # mailing differ in, so they are collapsed to placeholders first.
+    text=f"{subject}\n{email_thread}".lower()
+    text=_URL.sub(" url ", text)
+    text=_EMAIL_ADDRESS.sub(" address ", text)
+    text=_DIGITS.sub("0", text)
+    return _TOKEN.findall(text)
+
+
+def simhash(subject:str, email_thread:str)->Optional[int]:
+    """64-bit SimHash over word tokens; None for texts too short to compare reliably.
+
+    Tokens rather than word shingles: emails are short, and a personalised
+    name would otherwise disturb every shingle it falls in.
+    """
+    tokens=_tokens(subject, email_thread)
+    if len(tokens)<DEDUP_MIN_TOKENS:
+        return None
+
+    digests=b"".join(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest() for token in tokens)
+    bits=np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(tokens), 8), axis=1)
+    votes=bits.sum(axis=0, dtype=np.int64)*2-len(tokens)
+
+    value=0
+    for bit in np.flatnonzero(votes>0):
+        value|=1<<(63-int(bit))
+    return value
+
+
+def _bands(signature:int)->List[Tuple[int, int]]:
+    return [(band, (signature>>(band*BAND_BITS))&_BAND_MASK) for band in range(BANDS)]
+
+
+class _Entry:
+    __slots__=("signature","scope","domain","result","added_at")
+
+    def __init__(self, signature:int, scope, domain:str, result:RouterSchema, added_at:float):
+        self.signature=signature
+        self.scope=scope
+        self.domain=domain
+        self.result=result
+        self.added_at=added_at
+
+
+class NearDuplicateIndex:
+    """SimHash LSH index of recent triage decisions, for personalised copies of one mailing.
+
+    Signatures are split into 8 bands of 8 bits; two signatures within Hamming
+    distance 7 must agree exactly on at least one band, so a lookup only
+    compares against entries sharing a band bucket. Entries expire after
+    `window_seconds`. A match also requires the same sender domain and the same
+    `scope` (the rendered triage prompt), so preference changes are respected.
+    """
+
+    def __init__(self, window_seconds:float=DEDUP_WINDOW_SECONDS, max_distance:int=DEDUP_MAX_DISTANCE, max_entries:int=DEDUP_MAX_ENTRIES):
+        if max_distance>=BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for the band index to find every match")
+        self.window_seconds=window_seconds
+        self.max_distance=max_distance
+        self.max_entries=max_entries
+        self.hits=0
+        self.misses=0
+        self._entries:"deque[_Entry]"=deque()
+        self._buckets:Dict[Tuple[int, int], List[_Entry]]={}
+        self._lock=threading.Lock()
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def _expire(self, now:float)->None:
+        while self._entries and (now-self._entries[0].added_at>self.window_seconds or len(self._entries)>self.max_entries):
+            entry=self._entries.popleft()
+            for band in _bands(entry.signature):
+                bucket=self._buckets.get(band)
+                if bucket is not None:
+                    bucket.remove(entry)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def _nearest(self, signature:int, scope, domain:str)->Optional[_Entry]:
+        best, best_distance=None, self.max_distance+1
+        for band in _bands(signature):
+            for entry in self._buckets.get(band, ()):
+                if entry.scope!=scope or entry.domain!=domain:
+                    continue
+                distance=(entry.signature^signature).bit_count()
+                if distance<best_distance:
+                    best, best_distance=entry, distance
+        return best
+
+    def get(self, scope, author:str, subject:str, email_thread:str)->Optional[RouterSchema]:
+        signature=simhash(subject, email_thread)
+        if signature is None:
+            return None
+        with self._lock:
+            self._expire(time.monotonic())
+            entry=self._nearest(signature, scope, sender_domain(author))
+            if entry is None:
+                self.misses+=1
+                return None
+            self.hits+=1
+            return entry.result
+
+    def put(self, scope, author:str, subject:str, email_thread:str, result:RouterSchema)->None:
+        signature=simhash(subject, email_thread)
+        if signature is None:
+            return
+        with self._lock:
+            now=time.monotonic()
+            entry=_Entry(signature, scope, sender_domain(author), result, now)
+            self._entries.append(entry)
+            for band in _bands(signature):
+                self._buckets.setdefault(band, []).append(entry)
+            self._expire(now)
+
+    def clear(self)->None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self)->dict:
+        with self._lock:
+            return {"size":len(self._entries), "hits":self.hits, "misses":self.misses}
+
+
+def cluster_near_duplicates(email_inputs:List[dict], max_distance:int=DEDUP_MAX_DISTANCE)->List[int]:
+    """Label each email with the index of the first near-duplicate of it in the list (itself if none)."""
+    index=NearDuplicateIndex(window_seconds=float("inf"), max_distance=max_distance, max_entries=len(email_inputs)+1)
+    labels=[]
+    for position, email_input in enumerate(email_inputs):
+        author, subject, email_thread=email_input.get("author",""), email_input.get("subject",""), email_input.get("email_thread","")
+        # The batch index stores positions (as the "result") instead of decisions.
+        representative=index.get(None, author, subject, email_thread)
+        if representative is None:
+            index.put(None, author, subject, email_thread, position)
+            labels.append(position)
+        else:
+            labels.append(representative)
+    return labels
+
+
+near_duplicate_index=NearDuplicateIndex()
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+FAKE_LLM_LATENCY_MS=float(os.getenv("FAKE_LLM_LATENCY_MS","0"))
+FAKE_LLM_JITTER_MS=float(os.getenv("FAKE_LLM_JITTER_MS","0"))
+FAKE_LLM_CLASSIFICATION=os.getenv("FAKE_LLM_CLASSIFICATION","respond")
+
+DEFAULT_TOOL_SCRIPT=[
+    ("write_email", {"to":"sender@example.com", "subject":"Re: your email", "content":"Thanks for reaching out, I'll get back to you shortly."}),
+    ("Done", {"done":True}),
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model with scripted outputs and injectable latency.
+
+    Bound to a single structured-output schema (as `with_structured_output`
+    does), it answers with the scripted arguments for that schema. Bound to the
+    agent tools, it walks `tool_script`, one step per AI message already in the
+    conversation, so a run ends on the script's last call (normally `Done`).
+    """
+
+    latency_ms:float=FAKE_LLM_LATENCY_MS
+    jitter_ms:float=FAKE_LLM_JITTER_MS
+    structured_outputs:Dict[str, dict]={}
+    tool_script:List[tuple]=DEFAULT_TOOL_SCRIPT
+
+    @classmethod
+    def from_env(cls, **kwargs)->"FakeChatModel":
+        structured_outputs={
+            "RouterSchema":{"reasoning":"Scripted fake triage decision", "classification":FAKE_LLM_CLASSIFICATION},
+            "UserPrefernces":{"chain_of_thought":"Scripted fake preference update", "user_preferences":"No changes."},
+        }
+        return cls(structured_outputs=structured_outputs, **kwargs)
+
+    @property
+    def _llm_type(self)->str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    def _delay(self)->float:
+        return max(0.0, self.latency_ms+random.uniform(-self.jitter_ms, self.jitter_ms))/1000
+
+    def _respond(self, messages:List[BaseMessage], tools:Optional[list])->ChatResult:
+        tool_names=[tool["function"]["name"] for tool in tools or []]
+
+        if len(tool_names)==1 and tool_names[0] in self.structured_outputs:
+            name, args=tool_names[0], self.structured_outputs[tool_names[0]]
+        elif tool_names:
+            step=sum(1 for message in messages if isinstance(message, AIMessage))
+            name, args=self.tool_script[min(step, len(self.tool_script)-1)]
+        else:
+            message=AIMessage(content="Scripted fake response.")
+            return self._result(messages, message)
+
+        message=AIMessage(content="", tool_calls=[{"name":name, "args":args, "id":f"call_{uuid.uuid4().hex[:12]}"}])
+        return self._result(messages, message)
+
+    def _result(self, messages:List[BaseMessage], message:AIMessage)->ChatResult:
+        # Rough chars/4 usage so token metrics move under load tests.
+        input_tokens=sum(len(str(m.content)) for m in messages)//4
+        output_tokens=(len(str(message.content))+len(json.dumps([call["args"] for call in message.tool_calls])))//4
+        message.usage_metadata={"input_tokens":input_tokens, "output_tokens":output_tokens, "total_tokens":input_tokens+output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages:List[BaseMessage], stop=None, run_manager=None, tools:Optional[list]=None, **kwargs:Any)->ChatResult:
+        time.sleep(self._delay())
+        return self._respond(messages, tools)
+
+    async def _agenerate(self, messages:List[BaseMessage], stop=None, run_manager=None, tools:Optional[list]=None, **kwargs:Any)->ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._respond(messages, tools)
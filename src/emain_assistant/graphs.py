@@ -0,0 +1,146 @@
+"""Single factory for the compiled email graphs, built lazily from the shared nodes."""
+import threading
+import time
+from langgraph.graph import StateGraph, START, END
+from schemas import State, StateInput
+from nodes import (
+    models,
+    triage_router, atriage_router,
+    llm_call, allm_call,
+    tool_handler, atool_handler,
+    triage_interrupt_handler, atriage_interrupt_handler,
+    interrupt_handler, ainterrupt_handler,
+    should_continue, hitl_should_continue,
+)
+from persistence import build_checkpointer
+from preferences import store
+import tracing
+
+
+EMAIL="email"
+EMAIL_ASYNC="email_async"
+HITL="hitl"
+HITL_ASYNC="hitl_async"
+GRAPH_NAMES=(EMAIL, EMAIL_ASYNC, HITL, HITL_ASYNC)
+
+
+
+def build_email_assistant(triage_router, llm_call, tool_handler):
+    response_agent=StateGraph(State)
+    response_agent.add_node("llm_call",llm_call)
+    response_agent.add_node("tool_handler",tool_handler)
+
+    response_agent.add_edge(START, "llm_call")
+    response_agent.add_conditional_edges(
+        "llm_call",
+        should_continue,
+        {
+            "tool_handler":"tool_handler",
+            END: END,
+            },
+    )
+
+    response_agent.add_edge("tool_handler","llm_call")
+    compiled_response_agent=response_agent.compile()
+
+    email_assistant=StateGraph(State)
+    email_assistant.add_node("triage_router",triage_router)
+    email_assistant.add_node("response_agent",compiled_response_agent)
+
+    email_assistant.add_edge(START,"triage_router")
+
+    return email_assistant.compile()
+
+
+def build_email_assistant_hitl(triage_router, triage_interrupt_handler, llm_call, interrupt_handler, checkpointer, store):
+    response_agent = StateGraph(State)
+    response_agent.add_node("llm_call", llm_call) 
+    response_agent.add_node("interrupt_handler", interrupt_handler)
+
+    response_agent.add_edge(START, "llm_call")
+    response_agent.add_conditional_edges(
+        "llm_call",
+        hitl_should_continue,
+        {
+            "interrupt_handler": "interrupt_handler",
+            END: END,
+        },
+    )
+    response_agent.add_edge("interrupt_handler", "llm_call")
+
+    compiled_response_agent = response_agent.compile()
+
+    email_assistant_hitl = StateGraph(State, input=StateInput)
+    email_assistant_hitl.add_node("triage_router", triage_router)
+    email_assistant_hitl.add_node("triage_interrupt_handler", triage_interrupt_handler)
+    email_assistant_hitl.add_node("response_agent", compiled_response_agent)
+
+    email_assistant_hitl.add_edge(START, "triage_router")
+
+    return email_assistant_hitl.compile(checkpointer=checkpointer, store=store)
+
+
+
+class GraphFactory:
+    """Compiles each graph once, on first `get` or in `warm_up`, and records how long it took.
+
+    The HITL graphs share one checkpointer and store, so a thread started
+    through either the sync or the coroutine graph can be resumed through the
+    other.
+    """
+
+    def __init__(self):
+        self._lock=threading.RLock()
+        self._graphs={}
+        self._checkpointer=None
+        self.timings={}
+
+    def _timed(self, key:str, build):
+        start=time.perf_counter()
+        result=build()
+        self.timings[key]=round(time.perf_counter()-start, 4)
+        tracing.info("graphs.built", component=key, seconds=self.timings[key])
+        return result
+
+    @property
+    def checkpointer(self):
+        with self._lock:
+            if self._checkpointer is None:
+                self._checkpointer=self._timed("checkpointer", build_checkpointer)
+            return self._checkpointer
+
+    def _build(self, name:str):
+        if name==EMAIL:
+            return build_email_assistant(triage_router, llm_call, tool_handler)
+        if name==EMAIL_ASYNC:
+            return build_email_assistant(atriage_router, allm_call, atool_handler)
+        if name==HITL:
+            return build_email_assistant_hitl(triage_router, triage_interrupt_handler, llm_call, interrupt_handler, self.checkpointer, store)
+        if name==HITL_ASYNC:
+            return build_email_assistant_hitl(atriage_router, atriage_interrupt_handler, allm_call, ainterrupt_handler, self.checkpointer, store)
+        raise ValueError(f"Unknown graph: {name}")
+
+    def get(self, name:str):
+        graph=self._graphs.get(name)
+        if graph is not None:
+            return graph
+        with self._lock:
+            if name not in self._graphs:
+                self._graphs[name]=self._timed(name, lambda: self._build(name))
+            return self._graphs[name]
+
+    def warm_up(self, names=(EMAIL_ASYNC, HITL_ASYNC))->dict:
+        """Build the chat models and the named graphs now instead of on the first request.
+
+        Defaults to the async graphs, the ones the API serves.
+        """
+        start=time.perf_counter()
+        self._timed("models", lambda: (models.router, models.with_tools, models.memory))
+        for name in names:
+            self.get(name)
+        self.timings["warm_up"]=round(time.perf_counter()-start, 4)
+        tracing.info("graphs.warm_up", **self.timings)
+        return dict(self.timings)
+
+
+graph_factory=GraphFactory()
@@ -0,0 +1,286 @@
+"""Bulk triage of a local mailbox (mbox file or Maildir directory) to JSONL.
+
+    python ingest.py archive.mbox --out triage.jsonl --workers 8
+
+Messages are streamed one at a time (an mbox is memory-mapped, never read
+whole) and triaged on a thread pool. Results are written in mailbox order,
+and a cursor file next to the output records how far the run got, so an
+interrupted run picks up where it stopped when started again with the same
+arguments.
+
+Messages of one conversation (same subject without Re:/Fwd:, same
+participants) that fall in the same read-ahead chunk are triaged once: the
+newest with the earlier ones attached as context, and the earlier ones are
+written with its decision and a `superseded_by` pointing at it.
+"""
+import argparse
+import email
+import email.policy
+import html
+import json
+import mmap
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple, Union
+
+import tracing
+from conversations import group_conversations as _group_conversations, with_earlier_messages
+
+
+Position=Union[int, str]
+
+INGEST_WORKERS=int(os.getenv("INGEST_WORKERS","8"))
+INGEST_CURSOR_EVERY=int(os.getenv("INGEST_CURSOR_EVERY","100"))
+INGEST_GROUP_CONVERSATIONS=os.getenv("INGEST_GROUP_CONVERSATIONS","true").lower() in ("1","true","yes")
+
+_MBOX_SEPARATOR=b"\nFrom "
+_MBOX_ESCAPED_FROM=re.compile(rb"(?m)^>(>*From )")
+_HTML_TAG=re.compile(r"<[^>]+>")
+_HTML_DROP=re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+
+
+def iter_mbox(path:str, start:int=0)->Iterator[Tuple[int, int, bytes]]:
+    """Yield (offset, next offset, raw message) for each message in an mbox, from `start`."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size==0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset=start
+            if offset==0 and not mm[:5]==b"From ":
+                offset=mm.find(_MBOX_SEPARATOR)+1
+                if offset==0:
+                    return
+
+            while offset<len(mm):
+                next_separator=mm.find(_MBOX_SEPARATOR, offset)
+                end=len(mm) if next_separator==-1 else next_separator+1
+                # Skip the "From sender date" envelope line.
+                body_start=mm.find(b"\n", offset, end)+1 or end
+                yield offset, end, _MBOX_ESCAPED_FROM.sub(rb"\1", mm[body_start:end])
+                offset=end
+
+
+def iter_maildir(path:str, start:Optional[str]=None)->Iterator[Tuple[str, str, bytes]]:
+    """Yield (name, name, raw message) from a Maildir's cur/ and new/, in name order, after `start`.
+
+    The name is both the message's position and the resume point after it.
+    """
+    entries=[]
+    for sub in ("cur","new"):
+        directory=os.path.join(path, sub)
+        if os.path.isdir(directory):
+            entries.extend((entry.name, entry.path) for entry in os.scandir(directory) if entry.is_file())
+
+    # Maildir names begin with the delivery timestamp, so name order roughly
+    # follows arrival and, more importantly, is the same on every run.
+    for name, file_path in sorted(entries):
+        if start is not None and name<=start:
+            continue
+        with open(file_path, "rb") as f:
+            yield name, name, f.read()
+
+
+def _body_text(message)->str:
+    part=message.get_body(preferencelist=("plain","html"))
+    if part is None:
+        return ""
+    try:
+        content=part.get_content()
+    except (LookupError, ValueError):
+        content=part.get_payload(decode=True).decode("utf-8", errors="replace")
+    if part.get_content_type()=="text/html":
+        content=html.unescape(_HTML_TAG.sub(" ", _HTML_DROP.sub(" ", content)))
+    return content
+
+
+def to_email_input(raw:bytes)->Tuple[Optional[str], dict]:
+    """Parse a raw RFC 822 message into (Message-ID, EmailInput-shaped dict)."""
+    message=email.message_from_bytes(raw, policy=email.policy.default)
+    return message.get("Message-ID"), {
+        "author":str(message.get("From","")),
+        "to":str(message.get("To","")),
+        "subject":str(message.get("Subject","")),
+        "email_thread":_body_text(message),
+    }
+
+
+def _parse(position:Position, raw:bytes)->Tuple[dict, Optional[dict]]:
+    record={"position":position}
+    try:
+        message_id, email_input=to_email_input(raw)
+    except Exception as e:
+        record["error"]=str(e)
+        return record, None
+    record.update({"message_id":message_id, "author":email_input["author"], "subject":email_input["subject"]})
+    return record, email_input
+
+
+def _triage(record:dict, email_input:dict, triage)->dict:
+    record=dict(record)
+    try:
+        record.update(triage(email_input))
+    except Exception as e:
+        record["error"]=str(e)
+    return record
+
+
+def _superseded(record:dict, latest:dict)->dict:
+    record={**record, "superseded_by":latest["position"]}
+    if "error" in latest:
+        record["error"]=latest["error"]
+    else:
+        record.update({"classification":latest["classification"], "reasoning":latest["reasoning"]})
+    return record
+
+
+def _submit_chunk(pool:ThreadPoolExecutor, chunk:List[Tuple[Position, Position, bytes]], triage, group_conversations:bool)->list:
+    """Submit one triage per conversation in `chunk`; return (future, record, next position, is latest) per message, in order."""
+    parsed=[_parse(position, raw) for position, _, raw in chunk]
+    entries=[(None, record, chunk[index][1], True) for index, (record, _) in enumerate(parsed)]
+
+    valid=[index for index, (_, email_input) in enumerate(parsed) if email_input is not None]
+    if group_conversations:
+        groups=[[valid[member] for member in group] for group in _group_conversations([parsed[index][1] for index in valid])]
+    else:
+        groups=[[index] for index in valid]
+
+    for group in groups:
+        latest=group[-1]
+        email_input=with_earlier_messages(parsed[latest][1], [parsed[index][1] for index in group[:-1]])
+        future=pool.submit(_triage, parsed[latest][0], email_input, triage)
+        for index in group:
+            entries[index]=(future, parsed[index][0], chunk[index][1], index==latest)
+    return entries
+
+
+class Cursor:
+    """Resume point for one (source, output) pair, replaced atomically on save.
+
+    Alongside the last finished position it stores the output size at that
+    point; on resume the output is cut back to it, so records written after
+    the last save are not duplicated.
+    """
+
+    def __init__(self, path:str, source:str):
+        self.path=path
+        self.source=os.path.abspath(source)
+        self.position:Optional[Position]=None
+        self.processed=0
+        self.output_bytes=0
+
+    def load(self)->"Cursor":
+        with open(self.path) as f:
+            state=json.load(f)
+        if state.get("source")!=self.source:
+            raise ValueError(f"Cursor {self.path} belongs to {state.get('source')}, not {self.source}")
+        self.position=state["position"]
+        self.processed=state["processed"]
+        self.output_bytes=state["output_bytes"]
+        return self
+
+    def save(self)->None:
+        tmp_path=f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source":self.source, "position":self.position, "processed":self.processed, "output_bytes":self.output_bytes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def ingest(source:str, out_path:str, cursor_path:Optional[str]=None, workers:int=INGEST_WORKERS, limit:Optional[int]=None, cursor_every:int=INGEST_CURSOR_EVERY, triage=None, group_conversations:bool=INGEST_GROUP_CONVERSATIONS)->dict:
+    if triage is None:
+        from agent import triage_email as triage
+
+    cursor=Cursor(cursor_path or f"{out_path}.cursor", source)
+    if os.path.exists(cursor.path):
+        cursor.load()
+    elif os.path.exists(out_path):
+        # First run against an existing file: append after what is there.
+        cursor.output_bytes=os.path.getsize(out_path)
+    is_maildir=os.path.isdir(source)
+    if is_maildir:
+        messages=iter_maildir(source, cursor.position)
+    else:
+        messages=iter_mbox(source, cursor.position or 0)
+
+    started=time.perf_counter()
+    processed=errors=0
+    mode="r+b" if os.path.exists(out_path) else "wb"
+
+    with open(out_path, mode) as out, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        out.truncate(cursor.output_bytes)
+        out.seek(cursor.output_bytes)
+
+        def write(record:dict, next_position:Position)->None:
+            nonlocal processed, errors
+            out.write((json.dumps(record, default=str)+"\n").encode("utf-8"))
+            processed+=1
+            errors+="error" in record
+            cursor.position=next_position
+            cursor.processed+=1
+            if processed%cursor_every==0:
+                out.flush()
+                os.fsync(out.fileno())
+                cursor.output_bytes=out.tell()
+                cursor.save()
+                tracing.info("ingest.progress", processed=cursor.processed, errors=errors)
+
+        def write_entry(entry)->None:
+            future, record, next_position, is_latest=entry
+            if future is not None:
+                record=future.result() if is_latest else _superseded(record, future.result())
+            write(record, next_position)
+
+        # Messages are read in chunks (grouped by conversation within a chunk)
+        # and drained in submission order, so the output and cursor always
+        # follow mailbox order while the next chunk is being triaged.
+        chunk_size=workers*2
+        window=deque()
+        messages=islice(messages, limit)
+        try:
+            while True:
+                chunk=list(islice(messages, chunk_size))
+                if not chunk:
+                    break
+                window.extend(_submit_chunk(pool, chunk, triage, group_conversations))
+                while len(window)>chunk_size:
+                    write_entry(window.popleft())
+            while window:
+                write_entry(window.popleft())
+        finally:
+            for future, _, _, _ in window:
+                if future is not None:
+                    future.cancel()
+            out.flush()
+            os.fsync(out.fileno())
+            cursor.output_bytes=out.tell()
+            cursor.save()
+
+    return {
+        "processed":processed,
+        "errors":errors,
+        "total_processed":cursor.processed,
+        "seconds":round(time.perf_counter()-started, 2),
+    }
+
+
+def main()->None:
+    parser=argparse.ArgumentParser(description="Triage every message in an mbox file or Maildir directory.")
+    parser.add_argument("source", help="mbox file or Maildir directory")
+    parser.add_argument("--out", required=True, help="JSONL file to append results to")
+    parser.add_argument("--cursor", help="Resume cursor file (default: <out>.cursor)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--limit", type=int, help="Stop after this many messages")
+    parser.add_argument("--no-group-conversations", dest="group_conversations", action="store_false", default=INGEST_GROUP_CONVERSATIONS, help="Triage every message on its own")
+    args=parser.parse_args()
+
+    summary=ingest(args.source, args.out, args.cursor, args.workers, args.limit, group_conversations=args.group_conversations)
+    print(json.dumps(summary))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+import tracing
+from metrics import register_job_queue
+from agent import aprocess_email_shared, atriage_email
+from triage_rules import triage_rules, sender_domain
+
+
+JOBS_WORKERS=int(os.getenv("JOBS_WORKERS","8"))
+JOBS_MAX_PENDING=int(os.getenv("JOBS_MAX_PENDING","1000"))
+JOBS_MAX_FINISHED=int(os.getenv("JOBS_MAX_FINISHED","10000"))
+JOBS_RESULT_TTL_SECONDS=float(os.getenv("JOBS_RESULT_TTL_SECONDS","3600"))
+JOBS_RETRY_AFTER_SECONDS=int(os.getenv("JOBS_RETRY_AFTER_SECONDS","5"))
+JOBS_PRIORITY_SENDERS=[sender.strip().lower() for sender in os.getenv("JOBS_PRIORITY_SENDERS","").split(",") if sender.strip()]
+
+# Lower runs first. Drafting replies comes first, then triage (known or
+# same-domain senders ahead of the rest), then finishing emails that need no reply.
+PRIORITY_RESPOND=0
+PRIORITY_TRIAGE_SENDER=1
+PRIORITY_TRIAGE=2
+PRIORITY_NOTIFY=3
+PRIORITY_IGNORE=4
+_CLASSIFICATION_PRIORITY={"respond":PRIORITY_RESPOND, "notify":PRIORITY_NOTIFY, "ignore":PRIORITY_IGNORE}
+
+TRIAGE="triage"
+PROCESS="process"
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when JOBS_MAX_PENDING jobs are already queued or running."""
+
+
+class Job:
+    __slots__=("id","email_input","status","stage","priority","classification","triage","result","error","trace_id","created_at","finished_at")
+
+    def __init__(self, email_input:dict, trace_id:Optional[str]):
+        self.id=uuid.uuid4().hex
+        self.email_input=email_input
+        self.status="queued"
+        self.stage=TRIAGE
+        self.priority=PRIORITY_TRIAGE
+        self.classification=None
+        self.triage=None
+        self.result=None
+        self.error=None
+        self.trace_id=trace_id
+        self.created_at=time.time()
+        self.finished_at=None
+
+
+def _is_priority_sender(author:str, to:str)->bool:
+    domain=sender_domain(author)
+    if domain and domain==sender_domain(to):
+        return True
+    author=author.lower()
+    return any(sender in author if "@" in sender else sender==domain for sender in JOBS_PRIORITY_SENDERS)
+
+
+class JobQueue:
+    """Priority queue of email jobs drained by a fixed pool of asyncio workers.
+
+    A job is queued twice: once for triage, prioritised by cheap signals
+    (a matching pre-triage rule decides the classification outright, and
+    known or same-domain senders go first), then for processing, prioritised
+    by the triage outcome. The triage stage's decision is handed to the
+    process stage, so the graph does not triage (or count) the email again.
+    """
+
+    def __init__(self, triage_fn:Callable[[dict], Awaitable[dict]], process_fn:Callable[[dict, Optional[dict]], Awaitable[dict]], workers:int=JOBS_WORKERS, max_pending:int=JOBS_MAX_PENDING, max_finished:int=JOBS_MAX_FINISHED, result_ttl:float=JOBS_RESULT_TTL_SECONDS):
+        self._triage_fn=triage_fn
+        self._process_fn=process_fn
+        self.workers=workers
+        self.max_pending=max_pending
+        self.max_finished=max_finished
+        self.result_ttl=result_ttl
+        self._jobs:Dict[str, Job]={}
+        self._finished:"OrderedDict[str, float]"=OrderedDict()
+        self._queue:Optional[asyncio.PriorityQueue]=None
+        self._tasks:list=[]
+        self._sequence=itertools.count()
+        self._pending=0
+        self.completed=0
+        self.failed=0
+        self.rejected=0
+
+    def depth(self)->int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def pending(self)->int:
+        return self._pending
+
+    def get(self, job_id:str)->Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def submit(self, email_input:dict)->Job:
+        if self._pending>=self.max_pending:
+            self.rejected+=1
+            raise QueueFull(f"{self._pending} jobs pending (max {self.max_pending})")
+        self._ensure_started()
+        self._expire()
+
+        job=Job(email_input, tracing.current_trace_id())
+        rule=triage_rules.match(email_input.get("author",""), email_input.get("to",""), email_input.get("subject",""), email_input.get("email_thread",""))
+        if rule is not None:
+            job.stage=PROCESS
+            job.classification=rule.classification
+            job.priority=_CLASSIFICATION_PRIORITY[rule.classification]
+        elif _is_priority_sender(email_input.get("author",""), email_input.get("to","")):
+            job.priority=PRIORITY_TRIAGE_SENDER
+
+        self._jobs[job.id]=job
+        self._pending+=1
+        self._enqueue(job)
+        return job
+
+    def _enqueue(self, job:Job)->None:
+        self._queue.put_nowait((job.priority, next(self._sequence), job))
+
+    def _ensure_started(self)->None:
+        if self._queue is None:
+            self._queue=asyncio.PriorityQueue()
+            self._tasks=[asyncio.create_task(self._run(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    def _expire(self)->None:
+        now=time.time()
+        while self._finished:
+            job_id, finished_at=next(iter(self._finished.items()))
+            if now-finished_at<=self.result_ttl and len(self._finished)<=self.max_finished:
+                break
+            self._finished.popitem(last=False)
+            self._jobs.pop(job_id, None)
+
+    def _finish(self, job:Job, status:str)->None:
+        job.status=status
+        job.finished_at=time.time()
+        job.email_input=None
+        job.triage=None
+        self._pending-=1
+        self._finished[job.id]=job.finished_at
+        if status=="completed":
+            self.completed+=1
+        else:
+            self.failed+=1
+
+    async def _step(self, job:Job)->None:
+        if job.stage==TRIAGE:
+            job.triage=await self._triage_fn(job.email_input)
+            job.classification=job.triage["classification"]
+            job.stage=PROCESS
+            job.status="queued"
+            job.priority=_CLASSIFICATION_PRIORITY.get(job.classification, PRIORITY_TRIAGE)
+            self._enqueue(job)
+        else:
+            job.result=await self._process_fn(job.email_input, job.triage)
+            job.classification=job.result["classification"]
+            self._finish(job, "completed")
+
+    async def _run(self)->None:
+        while True:
+            _, _, job=await self._queue.get()
+            try:
+                job.status="running"
+                with tracing.start_trace(job.trace_id):
+                    try:
+                        await self._step(job)
+                    except asyncio.CancelledError:
+                        job.error="Service shut down while the job was running"
+                        self._finish(job, "failed")
+                        raise
+                    except Exception as e:
+                        job.error=str(e)
+                        self._finish(job, "failed")
+                        tracing.error("job.failed", job_id=job.id, stage=job.stage, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout:Optional[float]=None)->None:
+        """Let queued jobs finish (up to `timeout`), then stop the workers."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            tracing.warning("job.stop_timeout", pending=self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self._queue.empty():
+            _, _, job=self._queue.get_nowait()
+            job.error="Service shut down before the job ran"
+            self._finish(job, "failed")
+        self._queue=None
+        self._tasks=[]
+
+    def stats(self)->dict:
+        return {"queued":self.depth(), "pending":self._pending, "completed":self.completed, "failed":self.failed, "rejected":self.rejected}
+
+
+job_queue=JobQueue(atriage_email, aprocess_email_shared)
+register_job_queue(job_queue)
@@ -1,19 +1,74 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
 import uvicorn
+import os
+import json
+import math
+import time
 import uuid 
+from contextlib import asynccontextmanager
 from typing import Dict, List, Any
-from schemas import ProcessEmailRequest,ProcessEmailResponse, ProcessEmailHITLRequest, ProcessEmailHITLResponse,InterruptInfo
-from agent import process_email
-from agent_hitl import compiled_email_assistant_hitl
+from schemas import ProcessEmailRequest,ProcessEmailResponse, ProcessEmailHITLRequest, ProcessEmailHITLResponse,InterruptInfo, ProcessEmailBatchRequest, ProcessEmailBatchResponse, JobResponse
+from agent import aprocess_email_shared, process_emails_batch, astream_email, BATCH_MAX_CONCURRENCY, BATCH_GROUP_CONVERSATIONS
+from graphs import graph_factory, HITL_ASYNC
+from nodes import memory_worker
+from jobs import job_queue, QueueFull, JOBS_RETRY_AFTER_SECONDS
+from persistence import SqliteCheckpointer, amark_thread_completed
+from models import registry
+from ratelimit import LLMRateLimitError
+from metrics import render_latest
+import tracing
 from langgraph.types import Command
 
 
+GRAPH_WARM_UP = os.getenv("GRAPH_WARM_UP", "true").lower() in ("1", "true", "yes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build models and graphs before accepting traffic, so the first request
+    # does not pay for it. With GRAPH_WARM_UP=false they are built on first use.
+    if GRAPH_WARM_UP:
+        graph_factory.warm_up()
+    checkpointer = graph_factory.checkpointer
+    if isinstance(checkpointer, SqliteCheckpointer):
+        checkpointer.start_vacuum()
+    yield
+    await job_queue.stop(timeout=30)
+    memory_worker.stop(timeout=30)
+    if isinstance(checkpointer, SqliteCheckpointer):
+        checkpointer.stop_vacuum()
+    await registry.aclose()
+
+
 app = FastAPI(
     title="Email Assistant API",
     description="A complex email assistant built with LangGraph and FastAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "100"))
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Run each request under a trace id (the caller's `X-Trace-Id`, or a new one) and echo it back."""
+    with tracing.start_trace(request.headers.get(tracing.TRACE_HEADER)) as trace_id:
+        start = time.perf_counter()
+        response = await call_next(request)
+        response.headers[tracing.TRACE_HEADER] = trace_id
+
+        tracing.log(
+            tracing.ERROR if response.status_code >= 500 else tracing.INFO,
+            "http.request",
+            method=request.method,
+            path=request.url.path,
+            status=response.status_code,
+            duration_ms=round((time.perf_counter() - start) * 1000, 2)
+        )
+        return response
+
 
 
 @app.get("/")
@@ -23,9 +78,22 @@ async def root() -> Dict[str, str]:
 
 
 @app.get("/health")
-async def health_check() -> Dict[str, str]:
+async def health_check() -> Dict[str, Any]:
     """Health check endpoint."""
-    return {"status": "healthy", "service": "email-assistant"}
+    return {
+        "status": "healthy",
+        "service": "email-assistant",
+        "memory_queue_depth": memory_worker.depth(),
+        "jobs": job_queue.stats(),
+        "cold_start_seconds": graph_factory.timings
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus metrics: per-node latency, LLM tokens, tool calls and triage outcomes."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 
 
@@ -66,8 +134,18 @@ def _extract_final_result(state: Dict[str, Any]) -> ProcessEmailResponse:
 
 
 
+def _rate_limited(e: LLMRateLimitError) -> HTTPException:
+    # The provider is overloaded, not this request wrong: tell the caller when to retry.
+    return HTTPException(
+        status_code=503,
+        detail=f"LLM provider is rate limiting requests: {str(e)}",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after or 1)))}
+    )
+
+
 @app.post("/process-email", response_model=ProcessEmailResponse)
-def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
+async def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
+    """Process an email; concurrent identical emails (client retries, one alert to several aliases) share one run."""
 
     try:
         email_dict = {
@@ -77,14 +155,16 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
             "email_thread": request.email.email_thread
         }
 
-        result = process_email(email_dict)
+        result = await aprocess_email_shared(email_dict)
 
         return ProcessEmailResponse(
             classification=result["classification"],
             response=result["response"],
             reasoning=result["reasoning"]
         )
-    
+
+    except LLMRateLimitError as e:
+        raise _rate_limited(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -93,6 +173,105 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
 
 
 
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        classification=job.classification,
+        result=ProcessEmailResponse(**job.result) if job.result is not None else None,
+        error=job.error
+    )
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job_endpoint(request: ProcessEmailRequest, response: Response) -> JobResponse:
+    """Queue an email for processing and return at once; poll GET /jobs/{job_id} for the result."""
+    try:
+        job = job_queue.submit(request.email.model_dump())
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Job queue is full: {str(e)}",
+            headers={"Retry-After": str(JOBS_RETRY_AFTER_SECONDS)}
+        )
+
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return _job_response(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_endpoint(job_id: str) -> JobResponse:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found (unknown or expired)")
+    return _job_response(job)
+
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/process-email/stream")
+async def process_email_stream_endpoint(request: ProcessEmailRequest) -> StreamingResponse:
+    """Process an email, streaming triage, tool calls and draft tokens as server-sent events."""
+
+    async def events():
+        try:
+            async for event, data in astream_email(request.email.model_dump()):
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error processing email: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
+@app.post("/process-emails-batch", response_model=ProcessEmailBatchResponse)
+async def process_emails_batch_endpoint(request: ProcessEmailBatchRequest) -> ProcessEmailBatchResponse:
+    """Process several emails concurrently, returning results in input order."""
+    if len(request.emails) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.emails)} emails (max {BATCH_MAX_SIZE})"
+        )
+
+    max_concurrency = min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+
+    try:
+        results = await process_emails_batch(
+            [email.model_dump() for email in request.emails],
+            max_concurrency=max_concurrency,
+            group_conversations=BATCH_GROUP_CONVERSATIONS if request.group_conversations is None else request.group_conversations
+        )
+
+        return ProcessEmailBatchResponse(
+            results=[
+                ProcessEmailResponse(
+                    classification=result["classification"],
+                    response=result["response"],
+                    reasoning=result["reasoning"],
+                    superseded_by=result.get("superseded_by"),
+                    error=result.get("error")
+                )
+                for result in results
+            ]
+        )
+
+    except LLMRateLimitError as e:
+        raise _rate_limited(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing email batch: {str(e)}"
+        )
+
+
+
 @app.post("/process-email-hitl", response_model=ProcessEmailHITLResponse)
 async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> ProcessEmailHITLResponse:
     try:        
@@ -116,7 +295,7 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
                 "email_thread": request.email.email_thread
             }
             
-            for chunk in compiled_email_assistant_hitl.stream(
+            async for chunk in graph_factory.get(HITL_ASYNC).astream(
                 {"email_input": email_dict}, 
                 config=config
             ):
@@ -134,9 +313,10 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
                         )
                     )
                             
-            complete_state = compiled_email_assistant_hitl.get_state(config)
+            complete_state = await graph_factory.get(HITL_ASYNC).aget_state(config)
             if complete_state and complete_state.values:
                 result = _extract_final_result(complete_state.values)
+                await amark_thread_completed(graph_factory.checkpointer, thread_id)
                 return ProcessEmailHITLResponse(
                     status="completed",
                     thread_id=thread_id,
@@ -146,7 +326,7 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
         else:
 
             try:
-                state = compiled_email_assistant_hitl.get_state(config)
+                state = await graph_factory.get(HITL_ASYNC).aget_state(config)
                 if not state or not state.values:
                     raise HTTPException(
                         status_code=400,
@@ -165,7 +345,7 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
                     "args": human_response.args or {}
                 }])
                 
-                for chunk in compiled_email_assistant_hitl.stream(
+                async for chunk in graph_factory.get(HITL_ASYNC).astream(
                     resume_command,
                     config=config
                 ):
@@ -184,9 +364,10 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
                         )
                                     
 
-                complete_state = compiled_email_assistant_hitl.get_state(config)
+                complete_state = await graph_factory.get(HITL_ASYNC).aget_state(config)
                 if complete_state and complete_state.values:
                     result = _extract_final_result(complete_state.values)
+                    await amark_thread_completed(graph_factory.checkpointer, thread_id)
                     return ProcessEmailHITLResponse(
                         status="completed",
                         thread_id=thread_id,
@@ -196,6 +377,8 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
             except Exception as e:
                 if isinstance(e, HTTPException):
                     raise
+                if isinstance(e, LLMRateLimitError):
+                    raise _rate_limited(e)
                 raise HTTPException(status_code=400, detail=f"Failed to resume thread: {str(e)}")
         
         raise HTTPException(status_code=500, detail="Unexpected workflow state")
@@ -203,6 +386,8 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
     except Exception as e:
         if isinstance(e, HTTPException):
             raise
+        if isinstance(e, LLMRateLimitError):
+            raise _rate_limited(e)
         
         raise HTTPException(
             status_code=500,
@@ -213,7 +398,7 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
 async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
     try:
         config = {"configurable": {"thread_id": thread_id}}
-        state = compiled_email_assistant_hitl.get_state(config)
+        state = await graph_factory.get(HITL_ASYNC).aget_state(config)
         
         if not state or not state.values:
             raise HTTPException(
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import tracing
+
+
+class MemoryUpdateWorker:
+    """Applies preference updates on a background thread, off the request path.
+
+    Feedback events queued for the same (store, namespace) while an earlier one
+    is still waiting are merged, so a burst of reviewer decisions costs a
+    single memory-model rewrite per namespace instead of one per decision.
+    """
+
+    def __init__(self, update_fn:Callable):
+        self._update_fn=update_fn
+        self._pending:"OrderedDict[tuple, list]"=OrderedDict()
+        self._cond=threading.Condition()
+        self._thread:Optional[threading.Thread]=None
+        self._running=0
+        self._stopping=False
+        self.processed=0
+        self.coalesced=0
+        self.failed=0
+
+    def submit(self, store, namespace, messages:list)->None:
+        key=(id(store), tuple(namespace))
+        with self._cond:
+            if key in self._pending:
+                self._pending[key][2].append(messages)
+                self.coalesced+=1
+            else:
+                # The update runs under the trace of the first request that asked for it.
+                self._pending[key]=[store, tuple(namespace), [messages], tracing.current_trace_id()]
+            self._ensure_started()
+            self._cond.notify_all()
+
+    def depth(self)->int:
+        with self._cond:
+            return sum(len(events) for _, _, events, _ in self._pending.values())
+
+    def flush(self, timeout:Optional[float]=None)->bool:
+        deadline=None if timeout is None else time.monotonic()+timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining=None if deadline is None else deadline-time.monotonic()
+                if remaining is not None and remaining<=0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout:Optional[float]=None)->None:
+        self.flush(timeout)
+        with self._cond:
+            self._stopping=True
+            self._cond.notify_all()
+            thread=self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._thread=None
+            self._stopping=False
+
+    def _ensure_started(self)->None:
+        if self._thread is None:
+            self._thread=threading.Thread(target=self._run, name="memory-update-worker", daemon=True)
+            self._thread.start()
+
+    def _run(self)->None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, (store, namespace, events, trace_id)=self._pending.popitem(last=False)
+                self._running+=1
+
+            messages=[message for event in events for message in event]
+            with tracing.start_trace(trace_id):
+                try:
+                    self._update_fn(store, namespace, messages)
+                    self.processed+=len(events)
+                except Exception as e:
+                    self.failed+=len(events)
+                    tracing.error("memory.update_failed", namespace=namespace, error=str(e))
+                finally:
+                    with self._cond:
+                        self._running-=1
+                        self._cond.notify_all()
@@ -0,0 +1,238 @@
+import contextvars
+import functools
+import inspect
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.errors import GraphBubbleUp
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from triage_cache import triage_cache
+from dedup import near_duplicate_index
+
+
+LATENCY_BUCKETS=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+NODE_LATENCY=Histogram(
+    "email_assistant_node_latency_seconds",
+    "Wall time spent in each graph node",
+    ["node","status"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_CALLS=Counter(
+    "email_assistant_llm_calls_total",
+    "Chat model calls, by the node that made them",
+    ["node"]
+)
+LLM_TOKENS=Counter(
+    "email_assistant_llm_tokens_total",
+    "Chat model tokens, by the node that made the call and direction (input/output)",
+    ["node","direction"]
+)
+TOOL_CALLS=Counter(
+    "email_assistant_tool_calls_total",
+    "Tool executions, by node and tool",
+    ["node","tool"]
+)
+LLM_RETRIES=Counter(
+    "email_assistant_llm_retries_total",
+    "LLM call attempts retried after a rate-limit (429) or transient provider error",
+    ["reason"]
+)
+LLM_THROTTLE_SECONDS=Counter(
+    "email_assistant_llm_throttle_seconds_total",
+    "Time LLM calls waited for the requests/tokens-per-minute budget"
+)
+TRIAGE_DECISIONS=Counter(
+    "email_assistant_triage_decisions_total",
+    "Triage outcomes, by classification and which tier decided (rule/cache/near_duplicate/classifier/llm/human)",
+    ["classification","source"]
+)
+TRIAGE_CLASSIFIER=Counter(
+    "email_assistant_triage_classifier_predictions_total",
+    "Local classifier predictions, by outcome (hit: confident enough to decide, abstain: fell through to the LLM)",
+    ["outcome"]
+)
+
+# Node currently executing in this context; LLM and tool metrics are attributed to it.
+_current_node:contextvars.ContextVar[str]=contextvars.ContextVar("current_node", default="unknown")
+
+
+def current_node()->str:
+    return _current_node.get()
+
+
+def instrument_node(name:str):
+    """Record wall time for a graph node (sync or async) under `name`.
+
+    The wrapper keeps the wrapped signature, so LangGraph still injects
+    `store`/`config` arguments. Interrupts are recorded with status
+    `interrupted` rather than `error`, since they are the normal HITL pause.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token=_current_node.set(name)
+                start=time.perf_counter()
+                status="ok"
+                try:
+                    return await func(*args, **kwargs)
+                except GraphBubbleUp:
+                    status="interrupted"
+                    raise
+                except Exception:
+                    status="error"
+                    raise
+                finally:
+                    NODE_LATENCY.labels(node=name, status=status).observe(time.perf_counter()-start)
+                    _current_node.reset(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token=_current_node.set(name)
+            start=time.perf_counter()
+            status="ok"
+            try:
+                return func(*args, **kwargs)
+            except GraphBubbleUp:
+                status="interrupted"
+                raise
+            except Exception:
+                status="error"
+                raise
+            finally:
+                NODE_LATENCY.labels(node=name, status=status).observe(time.perf_counter()-start)
+                _current_node.reset(token)
+        return wrapper
+
+    return decorator
+
+
+def record_tool_calls(tool_calls:list)->None:
+    node=current_node()
+    for tool_call in tool_calls:
+        TOOL_CALLS.labels(node=node, tool=tool_call["name"]).inc()
+
+
+def record_triage(classification:str, source:str)->None:
+    TRIAGE_DECISIONS.labels(classification=classification, source=source).inc()
+
+
+def record_classifier(hit:bool)->None:
+    TRIAGE_CLASSIFIER.labels(outcome="hit" if hit else "abstain").inc()
+
+
+def record_llm_retry(reason:str)->None:
+    LLM_RETRIES.labels(reason=reason).inc()
+
+
+def record_llm_throttle(seconds:float)->None:
+    LLM_THROTTLE_SECONDS.inc(seconds)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Counts chat model calls and token usage against the node that made them."""
+
+    def on_llm_end(self, response, **kwargs)->None:
+        node=current_node()
+        LLM_CALLS.labels(node=node).inc()
+
+        input_tokens=output_tokens=0
+        for generations in response.generations:
+            for generation in generations:
+                usage=getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens+=usage.get("input_tokens",0)
+                    output_tokens+=usage.get("output_tokens",0)
+
+        if not (input_tokens or output_tokens):
+            token_usage=(response.llm_output or {}).get("token_usage") or {}
+            input_tokens=token_usage.get("prompt_tokens",0)
+            output_tokens=token_usage.get("completion_tokens",0)
+
+        if input_tokens:
+            LLM_TOKENS.labels(node=node, direction="input").inc(input_tokens)
+        if output_tokens:
+            LLM_TOKENS.labels(node=node, direction="output").inc(output_tokens)
+
+
+token_usage_handler=TokenUsageHandler()
+
+
+class _StatsCollector:
+    """Exposes counters kept by other components at scrape time."""
+
+    def __init__(self):
+        self.memory_worker=None
+        self.job_queue=None
+        self.model_registry=None
+        self.process_flights=None
+
+    def collect(self):
+        stats=triage_cache.stats()
+        yield GaugeMetricFamily("email_assistant_triage_cache_size", "Entries in the triage cache", value=stats["size"])
+        for name in ("hits","misses","evictions"):
+            yield CounterMetricFamily(f"email_assistant_triage_cache_{name}", f"Triage cache {name}", value=stats[name])
+
+        stats=near_duplicate_index.stats()
+        yield GaugeMetricFamily("email_assistant_near_duplicate_index_size", "Recent triage decisions held for near-duplicate matching", value=stats["size"])
+        for name in ("hits","misses"):
+            yield CounterMetricFamily(f"email_assistant_near_duplicate_{name}", f"Near-duplicate lookups that {'found' if name=='hits' else 'did not find'} a match", value=stats[name])
+
+        worker=self.memory_worker
+        if worker is not None:
+            yield GaugeMetricFamily("email_assistant_memory_queue_depth", "Preference updates waiting to be applied", value=worker.depth())
+            for name in ("processed","coalesced","failed"):
+                yield CounterMetricFamily(f"email_assistant_memory_updates_{name}", f"Preference updates {name}", value=getattr(worker, name))
+
+
+        job_queue=self.job_queue
+        if job_queue is not None:
+            stats=job_queue.stats()
+            yield GaugeMetricFamily("email_assistant_job_queue_depth", "Jobs waiting for a worker", value=stats["queued"])
+            yield GaugeMetricFamily("email_assistant_jobs_pending", "Jobs accepted and not yet finished", value=stats["pending"])
+            for name in ("completed","failed","rejected"):
+                yield CounterMetricFamily(f"email_assistant_jobs_{name}", f"Jobs {name}", value=stats[name])
+
+        model_registry=self.model_registry
+        if model_registry is not None:
+            limit=GaugeMetricFamily("email_assistant_llm_concurrency_limit", "Current adaptive concurrency limit per model", labels=["model"])
+            in_flight=GaugeMetricFamily("email_assistant_llm_in_flight", "LLM calls in flight per model", labels=["model"])
+            for model, stats in model_registry.limiter_stats().items():
+                limit.add_metric([model], stats["limit"])
+                in_flight.add_metric([model], stats["in_flight"])
+            yield limit
+            yield in_flight
+
+        flights=self.process_flights
+        if flights is not None:
+            yield GaugeMetricFamily("email_assistant_process_email_in_flight", "Distinct emails being processed", value=flights.in_flight())
+            yield CounterMetricFamily("email_assistant_process_email_runs", "Graph runs started for /process-email requests", value=flights.leaders)
+            yield CounterMetricFamily("email_assistant_process_email_coalesced", "/process-email requests that shared an identical in-flight email's run", value=flights.shared)
+
+
+_stats_collector=_StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_memory_worker(worker)->None:
+    _stats_collector.memory_worker=worker
+
+
+def register_model_registry(model_registry)->None:
+    _stats_collector.model_registry=model_registry
+
+
+def register_process_flights(flights)->None:
+    _stats_collector.process_flights=flights
+
+
+def register_job_queue(job_queue)->None:
+    _stats_collector.job_queue=job_queue
+
+
+def render_latest()->tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,361 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain.chat_models import init_chat_model
+
+from metrics import token_usage_handler, record_llm_retry, record_llm_throttle, register_model_registry
+from ratelimit import RateLimits, LLMRateLimitError, LLM_MAX_RETRIES, LLM_OUTPUT_TOKENS_ESTIMATE, is_rate_limit, is_retryable, retry_after, backoff, estimate_input_tokens, usage_tokens
+import tracing
+
+
+LLM_MODEL=os.getenv("LLM_MODEL","openai:gpt-4.1")
+LLM_MAX_CONNECTIONS=int(os.getenv("LLM_MAX_CONNECTIONS","100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS","20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS=float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS","60"))
+LLM_MAX_CONCURRENCY=int(os.getenv("LLM_MAX_CONCURRENCY","16"))
+LLM_MIN_CONCURRENCY=int(os.getenv("LLM_MIN_CONCURRENCY","1"))
+LLM_LATENCY_TARGET_SECONDS=float(os.getenv("LLM_LATENCY_TARGET_SECONDS","0"))
+LLM_AIMD_DECREASE=float(os.getenv("LLM_AIMD_DECREASE","0.5"))
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight calls across threads and coroutines with a single counter.
+
+    Sync callers block on a condition variable; async callers park on a future
+    that `release` resolves on the caller's own loop, so waiting never ties up
+    a thread.
+
+    The limit adapts (AIMD): it grows by about one per `limit` successful
+    calls up to `max_limit`, and on a rate-limit response or a call slower
+    than `latency_target` it is cut to LLM_AIMD_DECREASE times the calls
+    actually in flight, down to `min_limit`. Only calls started after the
+    last cut can cut again, so a burst of failures that were all in flight
+    together counts once.
+    """
+
+    def __init__(self, limit:int, min_limit:Optional[int]=None, max_limit:Optional[int]=None, latency_target:float=LLM_LATENCY_TARGET_SECONDS):
+        self.limit=limit
+        self.min_limit=min(LLM_MIN_CONCURRENCY, limit) if min_limit is None else min_limit
+        self.max_limit=limit if max_limit is None else max_limit
+        self.latency_target=latency_target
+        self._window=float(limit)
+        self._decreased_at=float("-inf")
+        self.in_flight=0
+        self._lock=threading.Lock()
+        self._cond=threading.Condition(self._lock)
+        self._sync_waiting=0
+        self._async_waiters=deque()
+
+    def acquire(self)->None:
+        with self._cond:
+            self._sync_waiting+=1
+            try:
+                while self.in_flight>=self.limit:
+                    self._cond.wait()
+            finally:
+                self._sync_waiting-=1
+            self.in_flight+=1
+
+    async def aacquire(self)->None:
+        loop=asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight<self.limit and not self._async_waiters:
+                self.in_flight+=1
+                return
+            waiter=(loop, loop.create_future())
+            self._async_waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+            # Cancelled after _grant resolved the future: the slot is ours, give
+            # it back. Cancelled before: _grant sees the done future and does.
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self)->None:
+        with self._lock:
+            self.in_flight-=1
+            self._dispatch()
+
+    def _dispatch(self)->None:
+        # Called with the lock held: hand free slots to parked coroutines first,
+        # then wake as many blocked threads as there are slots left.
+        while self.in_flight<self.limit and self._async_waiters:
+            loop, future=self._async_waiters.popleft()
+            self.in_flight+=1
+            loop.call_soon_threadsafe(self._grant, future)
+        if self.in_flight<self.limit and self._sync_waiting:
+            self._cond.notify(min(self._sync_waiting, self.limit-self.in_flight))
+
+    def on_success(self, started:float)->None:
+        if self.latency_target and time.monotonic()-started>self.latency_target:
+            self.on_overload(started)
+            return
+        with self._lock:
+            if self._window<self.max_limit:
+                self._window=min(self.max_limit, self._window+1/self._window)
+                self.limit=int(self._window)
+                self._dispatch()
+
+    def on_overload(self, started:float)->None:
+        with self._lock:
+            # Calls already in flight at the last cut ran at the old limit;
+            # their failures are the same overload, not a new one.
+            if started<self._decreased_at:
+                return
+            self._decreased_at=time.monotonic()
+            # The failed call has already released its slot.
+            self._window=max(self.min_limit, min(self._window, self.in_flight+1)*LLM_AIMD_DECREASE)
+            self.limit=int(self._window)
+        tracing.warning("llm.concurrency_decreased", limit=self.limit)
+
+    def _grant(self, future)->None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class LimitedModel:
+    """Chat model (or derived runnable) whose calls go through the model's limits.
+
+    Each attempt waits for the requests/tokens-per-minute budget, then holds a
+    limiter slot. Rate-limit and transient provider errors are retried with
+    jittered backoff (a stream only before its first chunk); the outcome of
+    every attempt feeds the limiter's adaptive concurrency. A call still rate
+    limited after LLM_MAX_RETRIES raises LLMRateLimitError.
+
+    `with_structured_output` and `bind_tools` return limited wrappers that share
+    the parent's limits, so every runnable derived from one model counts
+    against the same per-model budget.
+    """
+
+    def __init__(self, runnable, limiter:ConcurrencyLimiter, rate_limits:Optional[RateLimits]=None, max_retries:int=LLM_MAX_RETRIES):
+        self.runnable=runnable
+        self.limiter=limiter
+        self.rate_limits=rate_limits
+        self.max_retries=max_retries
+
+    def _reserve(self, input)->Tuple[int, float]:
+        tokens=estimate_input_tokens(input)+LLM_OUTPUT_TOKENS_ESTIMATE
+        wait=self.rate_limits.reserve(tokens) if self.rate_limits is not None else 0.0
+        if wait:
+            record_llm_throttle(wait)
+        return tokens, wait
+
+    def _settle(self, tokens:int, result, started:float)->None:
+        self.limiter.on_success(started)
+        if self.rate_limits is not None:
+            self.rate_limits.reconcile(tokens, usage_tokens(result))
+
+    def _retry_delay(self, error:Exception, attempt:int, tokens:int, started:float)->float:
+        """Delay before the next attempt; re-raises when `error` is final.
+
+        The failed attempt used none of the tokens it reserved, so they go back
+        to the budget first.
+        """
+        if self.rate_limits is not None:
+            self.rate_limits.reconcile(tokens, 0)
+        rate_limited=is_rate_limit(error)
+        if rate_limited:
+            self.limiter.on_overload(started)
+        if not is_retryable(error):
+            raise error
+        if attempt>=self.max_retries:
+            if rate_limited:
+                raise LLMRateLimitError(f"Still rate limited after {attempt+1} attempts: {error}", retry_after(error)) from error
+            raise error
+        delay=backoff(attempt, retry_after(error))
+        record_llm_retry("rate_limit" if rate_limited else "error")
+        tracing.warning("llm.retry", attempt=attempt+1, delay_s=round(delay, 3), error=str(error))
+        return delay
+
+    def invoke(self, input, config=None, **kwargs):
+        attempt=0
+        while True:
+            tokens, wait=self._reserve(input)
+            if wait:
+                time.sleep(wait)
+            try:
+                with self.limiter.slot():
+                    started=time.monotonic()
+                    result=self.runnable.invoke(input, config, **kwargs)
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt, tokens, started))
+                attempt+=1
+                continue
+            self._settle(tokens, result, started)
+            return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        attempt=0
+        while True:
+            tokens, wait=self._reserve(input)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                async with self.limiter.aslot():
+                    started=time.monotonic()
+                    result=await self.runnable.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, tokens, started))
+                attempt+=1
+                continue
+            self._settle(tokens, result, started)
+            return result
+
+    def stream(self, input, config=None, **kwargs):
+        attempt=0
+        while True:
+            tokens, wait=self._reserve(input)
+            if wait:
+                time.sleep(wait)
+            started_streaming=False
+            try:
+                with self.limiter.slot():
+                    started=time.monotonic()
+                    for chunk in self.runnable.stream(input, config, **kwargs):
+                        started_streaming=True
+                        yield chunk
+            except Exception as e:
+                if started_streaming:
+                    raise
+                time.sleep(self._retry_delay(e, attempt, tokens, started))
+                attempt+=1
+                continue
+            self._settle(tokens, None, started)
+            return
+
+    async def astream(self, input, config=None, **kwargs):
+        attempt=0
+        while True:
+            tokens, wait=self._reserve(input)
+            if wait:
+                await asyncio.sleep(wait)
+            started_streaming=False
+            try:
+                async with self.limiter.aslot():
+                    started=time.monotonic()
+                    async for chunk in self.runnable.astream(input, config, **kwargs):
+                        started_streaming=True
+                        yield chunk
+            except Exception as e:
+                if started_streaming:
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt, tokens, started))
+                attempt+=1
+                continue
+            self._settle(tokens, None, started)
+            return
+
+    def with_structured_output(self, *args, **kwargs)->"LimitedModel":
+        return LimitedModel(self.runnable.with_structured_output(*args, **kwargs), self.limiter, self.rate_limits, self.max_retries)
+
+    def bind_tools(self, *args, **kwargs)->"LimitedModel":
+        return LimitedModel(self.runnable.bind_tools(*args, **kwargs), self.limiter, self.rate_limits, self.max_retries)
+
+    def __getattr__(self, name):
+        return getattr(self.runnable, name)
+
+
+class ModelRegistry:
+    """Process-wide cache of chat models sharing pooled keep-alive HTTP clients."""
+
+    def __init__(self, max_connections:int=LLM_MAX_CONNECTIONS, max_keepalive_connections:int=LLM_MAX_KEEPALIVE_CONNECTIONS, max_concurrency:int=LLM_MAX_CONCURRENCY):
+        self.max_concurrency=max_concurrency
+        self._limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        self._lock=threading.Lock()
+        self._models:Dict[Tuple[str, float], LimitedModel]={}
+        self._limiters:Dict[str, ConcurrencyLimiter]={}
+        self._rate_limits:Dict[str, RateLimits]={}
+        self._http_client:Optional[httpx.Client]=None
+        self._http_async_client:Optional[httpx.AsyncClient]=None
+
+    def _client_kwargs(self, model:str)->dict:
+        if not model.startswith("openai:"):
+            return {}
+        if self._http_client is None:
+            self._http_client=httpx.Client(limits=self._limits, timeout=httpx.Timeout(60.0, connect=10.0))
+            self._http_async_client=httpx.AsyncClient(limits=self._limits, timeout=httpx.Timeout(60.0, connect=10.0))
+        # Retries belong to LimitedModel, which also has to see the 429s.
+        return {"http_client":self._http_client, "http_async_client":self._http_async_client, "max_retries":0}
+
+    def _build(self, model:str, temperature:float):
+        # `fake:*` models are scripted and offline, for benchmarks and local runs.
+        if model.startswith("fake:"):
+            from fake_models import FakeChatModel
+            return FakeChatModel.from_env(callbacks=[token_usage_handler])
+        return init_chat_model(model, temperature=temperature, callbacks=[token_usage_handler], **self._client_kwargs(model))
+
+    def _limits_for(self, model:str)->Tuple[ConcurrencyLimiter, RateLimits]:
+        # Called with the lock held.
+        if model not in self._limiters:
+            self._limiters[model]=ConcurrencyLimiter(self.max_concurrency)
+            self._rate_limits[model]=RateLimits()
+        return self._limiters[model], self._rate_limits[model]
+
+    def limiter(self, model:str)->ConcurrencyLimiter:
+        with self._lock:
+            return self._limits_for(model)[0]
+
+    def limiter_stats(self)->Dict[str, dict]:
+        with self._lock:
+            return {model:{"limit":limiter.limit, "in_flight":limiter.in_flight} for model, limiter in self._limiters.items()}
+
+    def get(self, model:str=LLM_MODEL, temperature:float=0.0)->LimitedModel:
+        key=(model, temperature)
+        with self._lock:
+            cached=self._models.get(key)
+            if cached is not None:
+                return cached
+            chat_model=self._build(model, temperature)
+            self._models[key]=LimitedModel(chat_model, *self._limits_for(model))
+            return self._models[key]
+
+    async def aclose(self)->None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        with self._lock:
+            self._models.clear()
+            self._http_client=None
+            self._http_async_client=None
+
+
+registry=ModelRegistry()
+register_model_registry(registry)
+
+
+def get_chat_model(model:str=LLM_MODEL, temperature:float=0.0)->LimitedModel:
+    return registry.get(model, temperature)
@@ -0,0 +1,623 @@
+"""Node definitions shared by the plain and HITL email graphs (see graphs.py)."""
+from typing import Literal, Optional, Tuple
+from langgraph.types import Command, interrupt
+from langgraph.store.base import BaseStore
+from langgraph.graph import END
+from schemas import RouterSchema,State, UserPrefernces
+from utils import parse_email, format_email_markdown, normalize_email_input, format_for_display
+from prompts import TRIAGE_USER_PROMPT,MEMORY_UPDATE_INSTRUCTIONS, MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT
+from agent_tools import TOOLS, run_tool_calls, arun_tool_calls, invoke_tool, ainvoke_tool
+from models import get_chat_model
+from triage_cache import triage_cache
+from triage_rules import triage_rules
+from classifier import triage_classifier, triage_log
+from dedup import near_duplicate_index
+from compaction import compact_messages, estimate_tokens
+from metrics import instrument_node, record_triage, record_classifier, record_tool_calls, register_memory_worker
+import tracing
+from preferences import prompt_assembler, TRIAGE_PREFERENCES_NAMESPACE
+from memory_worker import MemoryUpdateWorker
+
+
+class AgentModels:
+    """Chat models used by the nodes, built on first use rather than at import.
+
+    The bound runnables are rebuilt whenever the registry hands out a different
+    model, e.g. after `registry.aclose()` closed the HTTP clients the old one used.
+    """
+
+    def __init__(self):
+        self._llm=None
+        self._bound={}
+
+    def _get(self, name:str, build):
+        llm=get_chat_model()
+        if llm is not self._llm:
+            self._llm, self._bound=llm, {}
+        bound=self._bound
+        if name not in bound:
+            bound[name]=build(llm)
+        return bound[name]
+
+    @property
+    def llm(self):
+        return self._get("llm", lambda llm: llm)
+
+    @property
+    def router(self):
+        return self._get("router", lambda llm: llm.with_structured_output(RouterSchema))
+
+    @property
+    def with_tools(self):
+        return self._get("with_tools", lambda llm: llm.bind_tools(TOOLS, tool_choice='any'))
+
+    @property
+    def memory(self):
+        return self._get("memory", lambda llm: llm.with_structured_output(UserPrefernces))
+
+
+models=AgentModels()
+
+
+def _triage_messages(author:str, to:str, subject:str, email_thread:str)->list:
+    system_prompt=prompt_assembler.triage_system_prompt()
+
+    user_prompt= TRIAGE_USER_PROMPT.format(
+        author=author, to=to, subject=subject, email_thread=email_thread
+    )
+
+    return [
+        {"role":"system","content":system_prompt},
+        {"role":"user","content":user_prompt}
+    ]
+
+
+def _route(result:RouterSchema, email_input:dict, thread_chars_removed:int)->Command:
+    author,to, subject, email_thread=parse_email(email_input)
+    tracing.info("triage.decision", classification=result.classification, reasoning=result.reasoning)
+
+    if result.classification=='respond':
+        goto="response_agent"
+        update={
+            "classification_decision":result.classification,
+            "messages":[{
+                "role":"user",
+                "content":f"Respond to the email: \n\n {format_email_markdown(subject,author, to, email_thread)}"
+            }]
+        }
+    elif result.classification=='ignore':
+        goto=END 
+        update={"classification_decision":result.classification}
+    elif result.classification=='notify':
+        goto=END 
+        update={"classification_decision":result.classification}
+    else:
+        raise ValueError(f"Invalid classificaton: {result.classification}")
+
+    # state["email_input"] keeps the raw email for reviewers; only the prompts get the stripped thread.
+    update["thread_chars_removed"]=thread_chars_removed
+    
+    return Command(goto=goto,update=update)
+
+
+def _classifier_match(author:str, to:str, subject:str, email_thread:str)->Optional[RouterSchema]:
+    result, confidence=triage_classifier.match(author, to, subject, email_thread)
+    if confidence is None:
+        return None
+    record_classifier(result is not None)
+    if result is not None:
+        tracing.debug("triage.classifier_hit", classification=result.classification, confidence=confidence)
+        record_triage(result.classification, "classifier")
+    return result
+
+
+def _classify_without_llm(author:str, to:str, subject:str, email_thread:str)->Tuple[Optional[RouterSchema], list, str, int]:
+    """Try every tier short of the LLM; returns (decision or None, LLM messages, cache key, near-duplicate scope)."""
+    # Cheapest tier first: deterministic rules, cached decisions, decisions for
+    # near-duplicates seen recently, then the local classifier when it is confident.
+    result=triage_rules.match(author, to, subject, email_thread)
+    if result is not None:
+        tracing.debug("triage.rule_hit", classification=result.classification)
+        record_triage(result.classification, "rule")
+        return result, [], "", 0
+
+    messages=_triage_messages(author, to, subject, email_thread)
+
+    cache_key=triage_cache.key(messages[0]["content"], author, to, subject, email_thread)
+    scope=hash(messages[0]["content"])
+    result=triage_cache.get(cache_key)
+    if result is not None:
+        tracing.debug("triage.cache_hit", classification=result.classification)
+        record_triage(result.classification, "cache")
+        return result, messages, cache_key, scope
+
+    result=near_duplicate_index.get(scope, author, subject, email_thread)
+    if result is not None:
+        tracing.debug("triage.near_duplicate_hit", classification=result.classification)
+        record_triage(result.classification, "near_duplicate")
+        return result, messages, cache_key, scope
+
+    return _classifier_match(author, to, subject, email_thread), messages, cache_key, scope
+
+
+def _remember_llm_decision(result:RouterSchema, cache_key:str, scope:int, author:str, to:str, subject:str, email_thread:str)->RouterSchema:
+    triage_cache.put(cache_key, result)
+    near_duplicate_index.put(scope, author, subject, email_thread, result)
+    record_triage(result.classification, "llm")
+    triage_log.record({"author":author, "to":to, "subject":subject, "email_thread":email_thread}, result.classification, "llm")
+    return result
+
+
+def _given_decision(state:State)->Optional[RouterSchema]:
+    # Already decided, and counted in the triage metrics, by whoever made the decision.
+    decision=state.get("triage_decision")
+    return RouterSchema(**decision) if decision else None
+
+
+def _classify(author:str, to:str, subject:str, email_thread:str)->RouterSchema:
+    result, messages, cache_key, scope=_classify_without_llm(author, to, subject, email_thread)
+    if result is not None:
+        return result
+    return _remember_llm_decision(models.router.invoke(messages), cache_key, scope, author, to, subject, email_thread)
+
+
+async def _aclassify(author:str, to:str, subject:str, email_thread:str)->RouterSchema:
+    result, messages, cache_key, scope=_classify_without_llm(author, to, subject, email_thread)
+    if result is not None:
+        return result
+    return _remember_llm_decision(await models.router.ainvoke(messages), cache_key, scope, author, to, subject, email_thread)
+
+
+@instrument_node("triage_router")
+def triage_router(state:State):
+
+    email_input, thread_chars_removed=normalize_email_input(state["email_input"])
+    tracing.debug("triage.normalized", chars_removed=thread_chars_removed)
+
+    author,to, subject, email_thread=parse_email(email_input)
+
+    result=_given_decision(state) or _classify(author, to, subject, email_thread)
+
+    return _route(result, email_input, thread_chars_removed)
+
+
+@instrument_node("triage_router")
+async def atriage_router(state:State):
+
+    email_input, thread_chars_removed=normalize_email_input(state["email_input"])
+    tracing.debug("triage.normalized", chars_removed=thread_chars_removed)
+
+    author,to, subject, email_thread=parse_email(email_input)
+
+    result=_given_decision(state) or await _aclassify(author, to, subject, email_thread)
+
+    return _route(result, email_input, thread_chars_removed)
+
+
+def _agent_messages(state:State):
+    system_prompt=prompt_assembler.agent_system_prompt()
+    tracing.debug("llm_call.messages", count=len(state["messages"]), messages=lambda: tracing.summarize_messages(state["messages"]))
+
+    messages, tokens_saved=compact_messages(state["messages"], reserved_tokens=estimate_tokens(system_prompt))
+    if tokens_saved:
+        tracing.debug("llm_call.compacted", tokens_saved=tokens_saved)
+
+    return [
+        {"role":"system","content":system_prompt}
+    ]+ messages, tokens_saved
+
+
+@instrument_node("llm_call")
+def llm_call(state:State):
+    messages, tokens_saved=_agent_messages(state)
+    return {
+        "messages":[
+            models.with_tools.invoke(messages) 
+        ],
+        "compaction_tokens_saved":tokens_saved
+    }
+
+
+@instrument_node("llm_call")
+async def allm_call(state:State):
+    messages, tokens_saved=_agent_messages(state)
+    return {
+        "messages":[
+            await models.with_tools.ainvoke(messages) 
+        ],
+        "compaction_tokens_saved":tokens_saved
+    }
+
+
+def _tool_message(tool_call:dict, observation)->dict:
+    tracing.debug("tool.executed", tool=tool_call['name'], args=tool_call['args'])
+    return {
+        "role":"tool",
+        "content":str(observation),
+        "tool_call_id":tool_call['id']
+    }
+
+
+@instrument_node("tool_handler")
+def tool_handler(state:State):
+    last_message=state['messages'][-1]
+    result=[]
+
+    observations=run_tool_calls(last_message.tool_calls)
+    for tool_call, observation in zip(last_message.tool_calls, observations):
+        result.append(_tool_message(tool_call, observation))
+
+    return {'messages':result}
+
+
+@instrument_node("tool_handler")
+async def atool_handler(state:State):
+    last_message=state['messages'][-1]
+    result=[]
+
+    observations=await arun_tool_calls(last_message.tool_calls)
+    for tool_call, observation in zip(last_message.tool_calls, observations):
+        result.append(_tool_message(tool_call, observation))
+
+    return {'messages':result}
+
+
+def should_continue(state: State)-> Literal["tool_handler","__end__"]:
+    
+    last_message=state['messages'][-1]
+
+    if last_message.tool_calls:
+
+        for tool_call in last_message.tool_calls:
+            if tool_call['name']=='Done':
+                tracing.debug("agent.done")
+                return END 
+        return "tool_handler"
+    
+    return  END
+
+def _memory_messages(user_preferences, namespace, messages)->list:
+    current_profile=user_preferences.value["user_preferences"] if user_preferences else "No existing preferences"
+
+    return [
+        {"role":"system","content":MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=current_profile,namespace=namespace)},
+    ] + messages
+
+
+@instrument_node("update_memory")
+def update_memory(store, namespace, messages):
+
+    user_preferences=store.get(namespace, "user_preferences")
+
+    result=models.memory.invoke(_memory_messages(user_preferences, namespace, messages))
+
+    tracing.debug("memory.updated", namespace=namespace, user_preferences=result.user_preferences)
+
+    store.put(namespace,"user_preferences",{"user_preferences":result.user_preferences})
+
+    if namespace==TRIAGE_PREFERENCES_NAMESPACE:
+        triage_cache.clear()
+
+
+# Preference rewrites run here instead of inside the HITL nodes, so a reviewer
+# decision returns as soon as the graph step is done.
+memory_worker=MemoryUpdateWorker(update_memory)
+register_memory_worker(memory_worker)
+
+
+def _triage_review_request(state:State):
+
+    author, to, subject, email_thread=parse_email(state['email_input'])
+
+    email_markdown=format_email_markdown(subject,author, to, email_thread)
+
+    messages=[{
+        "role":"user",
+        "content":f"Email to notify user about: {email_markdown}"
+    }]
+
+
+    request={
+        "action_request":{
+            "action":f"Email Assistant: {state['classification_decision']}",
+            "args":{}
+        },
+        "config":{
+            "allow_ignore":True,
+            "allow_respond":True,
+            "allow_edit":False,
+            "allow_accept":False,
+        },
+        "description":email_markdown
+    }
+
+    return messages, request
+
+
+def _apply_triage_review(response, messages):
+    """Append the reviewer's decision to `messages`; returns (goto, memory_update)."""
+
+    if response['type']=='response':
+        user_input=response['args']
+        messages.append({
+            "role":"user",
+            "content":f"User wants to reply to the email. Use this feedback to respond: {user_input}"
+        })
+
+        memory_update=(TRIAGE_PREFERENCES_NAMESPACE,[{
+            "role":"user",
+            "content":f"The user decided to respond to the email, so update the triage preferences to capture this."
+            }] + messages)
+        goto='response_agent'
+        record_triage("respond", "human")
+    
+    elif response['type']=='ignore':
+        messages.append({
+            "role":"user",
+            "content":f"The user decided to ignore the email even though it was classified as notify. Update triage prefernces to capture this."
+        })
+
+        memory_update=(TRIAGE_PREFERENCES_NAMESPACE,messages)
+        goto= END 
+        record_triage("ignore", "human")
+    else:
+        raise ValueError(f"Invalid response type: {response}")
+
+    return goto, memory_update
+
+
+@instrument_node("triage_interrupt_handler")
+def triage_interrupt_handler(state:State, store:BaseStore) -> Command[Literal['response_agent','__end__']]:
+
+    messages, request=_triage_review_request(state)
+
+    response=interrupt([request])[0]
+
+    goto, memory_update=_apply_triage_review(response, messages)
+    memory_worker.submit(store, *memory_update)
+    triage_log.record(normalize_email_input(state['email_input'])[0], "respond" if goto=='response_agent' else "ignore", "human")
+
+    update={
+        "messages":messages,
+        "classification_decision":state['classification_decision']
+    }
+
+    return Command(goto=goto, update=update)
+
+
+@instrument_node("triage_interrupt_handler")
+async def atriage_interrupt_handler(state:State, store:BaseStore) -> Command[Literal['response_agent','__end__']]:
+
+    messages, request=_triage_review_request(state)
+
+    response=interrupt([request])[0]
+
+    goto, memory_update=_apply_triage_review(response, messages)
+    memory_worker.submit(store, *memory_update)
+    triage_log.record(normalize_email_input(state['email_input'])[0], "respond" if goto=='response_agent' else "ignore", "human")
+
+    update={
+        "messages":messages,
+        "classification_decision":state['classification_decision']
+    }
+
+    return Command(goto=goto, update=update)
+
+
+
+HITL_TOOLS=['write_email','schedule_meeting','Question']
+
+
+def _review_request(state:State, tool_call:dict)->dict:
+    email_input=state['email_input']
+    author, to, subject, email_thread=parse_email(email_input)
+    original_email_markdown=format_email_markdown(subject,author, to, email_thread)
+
+    tool_display =format_for_display(tool_call)
+    description= original_email_markdown + tool_display
+
+    if tool_call["name"] == "write_email":
+        config = {
+            "allow_ignore": True,    
+            "allow_respond": True,   
+            "allow_edit": True,    
+            "allow_accept": True,    
+        }
+    elif tool_call["name"] == "schedule_meeting":
+        config = {
+            "allow_ignore": True,   
+            "allow_respond": True,  
+            "allow_edit": True,      
+            "allow_accept": True,  
+        }
+    elif tool_call["name"] == "Question":
+        config = {
+            "allow_ignore": True,   
+            "allow_respond": True,  
+            "allow_edit": False,     
+            "allow_accept": False,  
+        }
+    else:
+        raise ValueError(f"Unexpected HITL tool: {tool_call['name']}")
+
+
+    return {
+        "action_request": {
+            "action": tool_call["name"],
+            "args": tool_call["args"]
+        },
+        "config": config,
+        "description": description,
+    }
+
+
+def _apply_review(state:State, tool_call:dict, response:dict, result:list):
+    """Apply a reviewer response to `tool_call`, appending messages to `result`.
+
+    Returns (tool_args, end, memory_update): the args to run the tool with (or
+    None), whether the workflow should end, and an optional (namespace, messages)
+    preference update.
+    """
+    tool_args=None
+    end=False
+    memory_update=None
+
+    if response["type"] == "accept":
+        tool_args = tool_call["args"]
+    elif response["type"] == "edit":
+        edited_args = response["args"]["args"]
+
+        ai_message = state["messages"][-1]  
+        current_id = tool_call["id"]  
+
+        updated_tool_calls = [tc for tc in ai_message.tool_calls if tc["id"] != current_id] + [
+            {"type": "tool_call", "name": tool_call["name"], "args": edited_args, "id": current_id}
+        ]
+        
+        result.append(ai_message.model_copy(update={"tool_calls": updated_tool_calls}))
+
+        if tool_call["name"] == "write_email":
+            initial_tool_call = tool_call["args"]
+            tool_args = edited_args
+            memory_update = (("email_assistant", "response_preferences"), [{
+                "role": "user",
+                "content": f"User edited the email response. Here is the initial email generated by the assistant: {initial_tool_call}. Here is the edited email: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        elif tool_call["name"] == "schedule_meeting":
+            initial_tool_call = tool_call["args"]
+            tool_args = edited_args
+            memory_update = (("email_assistant", "cal_preferences"), [{
+                "role": "user",
+                "content": f"User edited the calendar invitation. Here is the initial calendar invitation generated by the assistant: {initial_tool_call}. Here is the edited calendar invitation: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        else:
+            raise ValueError(f"Invalid tool call: {tool_call['name']}")
+
+    elif response["type"] == "ignore":
+        # Ignoring a drafted action means the email should not have been "respond".
+        triage_log.record(normalize_email_input(state["email_input"])[0], "ignore", "human")
+        if tool_call["name"] == "write_email":
+            result.append({"role": "tool", "content": "User ignored this email draft. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
+            end = True
+            memory_update = (TRIAGE_PREFERENCES_NAMESPACE, state["messages"] + result + [{
+                "role": "user",
+                "content": f"The user ignored the email draft. That means they did not want to respond to the email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        elif tool_call["name"] == "schedule_meeting":
+            result.append({"role": "tool", "content": "User ignored this calendar meeting draft. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
+            end = True
+            memory_update = (TRIAGE_PREFERENCES_NAMESPACE, state["messages"] + result + [{
+                "role": "user",
+                "content": f"The user ignored the calendar meeting draft. That means they did not want to schedule a meeting for this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        elif tool_call["name"] == "Question":
+            result.append({"role": "tool", "content": "User ignored this question. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
+            end = True
+            memory_update = (TRIAGE_PREFERENCES_NAMESPACE, state["messages"] + result + [{
+                "role": "user",
+                "content": f"The user ignored the Question. That means they did not want to answer the question or deal with this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        else:
+            raise ValueError(f"Invalid tool call: {tool_call['name']}")
+        
+    elif response["type"] == "response":
+        user_feedback = response["args"]
+        if tool_call["name"] == "write_email":
+            result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the email. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
+            memory_update = (("email_assistant", "response_preferences"), state["messages"] + result + [{
+                "role": "user",
+                "content": f"User gave feedback, which we can use to update the response preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        elif tool_call["name"] == "schedule_meeting":
+           
+            result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the meeting request. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
+
+            memory_update = (("email_assistant", "cal_preferences"), state["messages"] + result + [{
+                "role": "user",
+                "content": f"User gave feedback, which we can use to update the calendar preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+            }])
+        elif tool_call["name"] == "Question": 
+
+            result.append({"role": "tool", "content": f"User answered the question, which can we can use for any follow up actions. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
+        else:
+            raise ValueError(f"Invalid tool call: {tool_call['name']}")
+
+    else:
+        raise ValueError(f"Invalid response type: {response}")
+
+    return tool_args, end, memory_update
+
+
+def _auto_tool_calls(tool_calls:list)->list:
+    # Tools that need no review are independent of the reviewer's decisions,
+    # so they all run up front, concurrently.
+    return [tool_call for tool_call in tool_calls if tool_call['name'] not in HITL_TOOLS]
+
+
+def _review_tool_call(state:State, store:BaseStore, tool_call:dict, observations:dict, result:list):
+    """Handle one tool call of the turn; returns (args to run the tool with or None, whether to end)."""
+    if tool_call['name'] not in HITL_TOOLS:
+        result.append(_tool_message(tool_call, observations[tool_call['id']]))
+        return None, False
+
+    response=interrupt([_review_request(state, tool_call)])[0]
+
+    tool_args, end, memory_update=_apply_review(state, tool_call, response, result)
+    if tool_args is not None:
+        record_tool_calls([tool_call])
+    if memory_update:
+        memory_worker.submit(store, *memory_update)
+    return tool_args, end
+
+
+@instrument_node("interrupt_handler")
+def interrupt_handler(state: State, store: BaseStore)-> Command[Literal["llm_call","__end__"]]:
+
+    result=[]
+    goto='llm_call'
+    tool_calls=state['messages'][-1].tool_calls
+
+    auto_calls=_auto_tool_calls(tool_calls)
+    observations=dict(zip([tool_call['id'] for tool_call in auto_calls], run_tool_calls(auto_calls)))
+
+    for tool_call in tool_calls:
+        tool_args, end=_review_tool_call(state, store, tool_call, observations, result)
+        if tool_args is not None:
+            result.append(_tool_message(tool_call, invoke_tool(tool_call, tool_args)))
+        if end:
+            goto=END
+
+    return Command(goto=goto, update={"messages":result})
+
+
+@instrument_node("interrupt_handler")
+async def ainterrupt_handler(state: State, store: BaseStore)-> Command[Literal["llm_call","__end__"]]:
+
+    result=[]
+    goto='llm_call'
+    tool_calls=state['messages'][-1].tool_calls
+
+    auto_calls=_auto_tool_calls(tool_calls)
+    observations=dict(zip([tool_call['id'] for tool_call in auto_calls], await arun_tool_calls(auto_calls)))
+
+    for tool_call in tool_calls:
+        tool_args, end=_review_tool_call(state, store, tool_call, observations, result)
+        if tool_args is not None:
+            result.append(_tool_message(tool_call, await ainvoke_tool(tool_call, tool_args)))
+        if end:
+            goto=END
+
+    return Command(goto=goto, update={"messages":result})
+
+
+def hitl_should_continue(state: State, store: BaseStore) -> Literal["interrupt_handler", "__end__"]:
+    """Route to tool handler, or end if Done tool called"""
+    messages = state["messages"]
+    last_message = messages[-1]
+    if last_message.tool_calls:
+        for tool_call in last_message.tool_calls: 
+            if tool_call["name"] == "Done":
+                return END
+            else:
+                return "interrupt_handler"
+    return END
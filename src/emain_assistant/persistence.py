@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.store.base import BaseStore, GetOp, Item, PutOp
+from langgraph.store.memory import InMemoryStore
+from langgraph.store.sqlite import SqliteStore
+
+import tracing
+
+
+HITL_CHECKPOINT_DB=os.getenv("HITL_CHECKPOINT_DB")
+HITL_COMPLETED_THREAD_TTL_SECONDS=float(os.getenv("HITL_COMPLETED_THREAD_TTL_SECONDS",str(24*3600)))
+HITL_ABANDONED_THREAD_TTL_SECONDS=float(os.getenv("HITL_ABANDONED_THREAD_TTL_SECONDS",str(7*24*3600)))
+HITL_VACUUM_INTERVAL_SECONDS=float(os.getenv("HITL_VACUUM_INTERVAL_SECONDS","3600"))
+PREFERENCE_STORE_DB=os.getenv("PREFERENCE_STORE_DB")
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """File-backed (WAL) checkpointer that expires old threads.
+
+    Completed threads are kept for `completed_ttl` seconds after they finish and
+    interrupted threads nobody resumed for `abandoned_ttl` seconds after their
+    last checkpoint. The async methods run the sync implementation in a worker
+    thread so the same instance serves both the sync and the async graphs.
+    """
+
+    def __init__(self, path:str, completed_ttl:float=HITL_COMPLETED_THREAD_TTL_SECONDS, abandoned_ttl:float=HITL_ABANDONED_THREAD_TTL_SECONDS):
+        conn=sqlite3.connect(path, check_same_thread=False)
+        # auto_vacuum only takes effect on a fresh database, before any table exists.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        super().__init__(conn)
+        self.completed_ttl=completed_ttl
+        self.abandoned_ttl=abandoned_ttl
+        self._vacuum_stop=threading.Event()
+        self._vacuum_thread:Optional[threading.Thread]=None
+
+    def setup(self)->None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config=super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO thread_activity (thread_id, updated_at, completed) VALUES (?, ?, 0)
+                ON CONFLICT(thread_id) DO UPDATE SET updated_at=excluded.updated_at, completed=0
+                """,
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        return next_config
+
+    def mark_completed(self, thread_id:str)->None:
+        with self.cursor() as cur:
+            cur.execute(
+                "UPDATE thread_activity SET completed=1, updated_at=? WHERE thread_id=?",
+                (time.time(), str(thread_id)),
+            )
+
+    def delete_thread(self, thread_id:str)->None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id=?", (str(thread_id),))
+
+    def expire_threads(self, now:Optional[float]=None)->int:
+        now=time.time() if now is None else now
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                """
+                SELECT thread_id FROM thread_activity
+                WHERE (completed=1 AND updated_at<?) OR (completed=0 AND updated_at<?)
+                """,
+                (now-self.completed_ttl, now-self.abandoned_ttl),
+            )
+            expired=[row[0] for row in cur.fetchall()]
+
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
+
+    def vacuum(self)->int:
+        expired=self.expire_threads()
+        with self.lock:
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return expired
+
+    def start_vacuum(self, interval:float=HITL_VACUUM_INTERVAL_SECONDS)->None:
+        if self._vacuum_thread is not None:
+            return
+
+        def _run():
+            while not self._vacuum_stop.wait(interval):
+                try:
+                    expired=self.vacuum()
+                    if expired:
+                        tracing.info("checkpoint.vacuum", expired_threads=expired)
+                except Exception as e:
+                    tracing.error("checkpoint.vacuum_failed", error=str(e))
+
+        self._vacuum_stop.clear()
+        self._vacuum_thread=threading.Thread(target=_run, name="checkpoint-vacuum", daemon=True)
+        self._vacuum_thread.start()
+
+    def stop_vacuum(self)->None:
+        if self._vacuum_thread is None:
+            return
+        self._vacuum_stop.set()
+        self._vacuum_thread.join()
+        self._vacuum_thread=None
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter:Optional[dict[str, Any]]=None, before=None, limit:Optional[int]=None)->AsyncIterator:
+        items=await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes:Sequence, task_id:str, task_path:str="")->None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id:str)->None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def amark_completed(self, thread_id:str)->None:
+        await asyncio.to_thread(self.mark_completed, thread_id)
+
+
+def build_checkpointer():
+    if HITL_CHECKPOINT_DB:
+        return SqliteCheckpointer(HITL_CHECKPOINT_DB)
+    return InMemorySaver()
+
+
+def mark_thread_completed(checkpointer, thread_id:str)->None:
+    if isinstance(checkpointer, SqliteCheckpointer):
+        checkpointer.mark_completed(thread_id)
+
+
+async def amark_thread_completed(checkpointer, thread_id:str)->None:
+    if isinstance(checkpointer, SqliteCheckpointer):
+        await checkpointer.amark_completed(thread_id)
+
+
+class CachedStore(BaseStore):
+    """Read-through cache in front of another store.
+
+    Every namespace carries a version number that is bumped on each write
+    through this store. `get` results (including misses) are cached together
+    with the version they were read at and are only served while that version
+    is current, so a hit is a dict lookup and never touches the backend.
+
+    Writes made by other processes sharing the backend do not go through this
+    store. When `data_version` is given (SQLite's `PRAGMA data_version`, which
+    changes whenever another connection commits) it is checked on every read,
+    and a change moves every namespace to a new version.
+    """
+
+    def __init__(self, backend:BaseStore, data_version:Optional[Callable[[], int]]=None):
+        self.backend=backend
+        self._data_version=data_version
+        self._lock=threading.Lock()
+        # Versions come from one counter, so an external change can move every
+        # namespace past any version handed out before it.
+        self._clock=itertools.count(1)
+        self._external=0
+        self._seen_data_version=data_version() if data_version is not None else None
+        self._versions:Dict[Tuple[str, ...], int]={}
+        self._items:Dict[Tuple[Tuple[str, ...], str], Tuple[int, Optional[Item]]]={}
+
+    def _revalidate(self)->None:
+        if self._data_version is None:
+            return
+        data_version=self._data_version()
+        with self._lock:
+            if data_version!=self._seen_data_version:
+                self._seen_data_version=data_version
+                self._external=next(self._clock)
+                self._items.clear()
+
+    def _version(self, namespace:Tuple[str, ...])->int:
+        return max(self._versions.get(namespace, 0), self._external)
+
+    def version(self, namespace:Tuple[str, ...])->int:
+        self._revalidate()
+        return self._version(tuple(namespace))
+
+    def _lookup(self, ops:List)->Tuple[List, List, Dict[int, int]]:
+        results=[None]*len(ops)
+        pending=[]
+        read_versions={}
+        self._revalidate()
+        with self._lock:
+            for index, op in enumerate(ops):
+                if isinstance(op, GetOp):
+                    namespace=tuple(op.namespace)
+                    version=self._version(namespace)
+                    cached=self._items.get((namespace, op.key))
+                    if cached is not None and cached[0]==version:
+                        results[index]=cached[1]
+                        continue
+                    read_versions[index]=version
+                pending.append(index)
+        return results, pending, read_versions
+
+    def _store(self, ops:List, results:List, pending:List[int], backend_results:List, read_versions:Dict[int, int])->None:
+        with self._lock:
+            for index, result in zip(pending, backend_results):
+                results[index]=result
+                op=ops[index]
+                if isinstance(op, PutOp):
+                    namespace=tuple(op.namespace)
+                    self._versions[namespace]=next(self._clock)
+                    self._items.pop((namespace, op.key), None)
+                elif isinstance(op, GetOp):
+                    namespace=tuple(op.namespace)
+                    # Skip caching if a write landed while the backend was read.
+                    if self._version(namespace)==read_versions[index]:
+                        self._items[(namespace, op.key)]=(read_versions[index], result)
+
+    def batch(self, ops:Iterable)->List:
+        ops=list(ops)
+        results, pending, read_versions=self._lookup(ops)
+        if pending:
+            backend_results=self.backend.batch([ops[index] for index in pending])
+            self._store(ops, results, pending, backend_results, read_versions)
+        return results
+
+    async def abatch(self, ops:Iterable)->List:
+        ops=list(ops)
+        results, pending, read_versions=self._lookup(ops)
+        if pending:
+            # Only cache misses and writes pay for a trip to the backend.
+            backend_results=await asyncio.to_thread(self.backend.batch, [ops[index] for index in pending])
+            self._store(ops, results, pending, backend_results, read_versions)
+        return results
+
+
+def build_preference_store()->CachedStore:
+    if PREFERENCE_STORE_DB:
+        conn=sqlite3.connect(PREFERENCE_STORE_DB, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        backend=SqliteStore(conn)
+
+        def data_version()->int:
+            with backend.lock:
+                return conn.execute("PRAGMA data_version").fetchone()[0]
+
+        return CachedStore(backend, data_version)
+    return CachedStore(InMemoryStore())
@@ -0,0 +1,69 @@
+import threading
+from datetime import date
+from typing import Dict, Tuple
+
+from persistence import build_preference_store
+from prompts import TRIAGE_SYSTEM_PROMPT, AGENT_SYSTEM_PROMPT, DEFAULT_BACKGROUND, DEFAULT_TRIAGE_INSTRUCTIONS, DEFAULT_RESPONSE_PREFERENCES, DEFAULT_CAL_PREFERENCES
+
+
+TRIAGE_PREFERENCES_NAMESPACE=("email_assistant","triage_preferences")
+RESPONSE_PREFERENCES_NAMESPACE=("email_assistant","response_preferences")
+CAL_PREFERENCES_NAMESPACE=("email_assistant","cal_preferences")
+
+# Shared by the plain and HITL graphs so preferences learned through review
+# also shape unattended processing.
+store=build_preference_store()
+
+
+class PromptAssembler:
+    """Renders system prompts from the learned preferences in `store`.
+
+    Each prompt is rendered once per combination of the preference versions it
+    depends on (plus the date, for the agent prompt) and reused until one of
+    them changes, so the per-call cost is a few dict lookups.
+    """
+
+    def __init__(self, store):
+        self.store=store
+        self._lock=threading.Lock()
+        self._rendered:Dict[str, Tuple[tuple, str]]={}
+
+    def _preferences(self, namespace:Tuple[str, ...], default:str)->str:
+        item=self.store.get(namespace, "user_preferences")
+        return item.value["user_preferences"] if item else default
+
+    def _cached(self, name:str, key:tuple, render)->str:
+        cached=self._rendered.get(name)
+        if cached is not None and cached[0]==key:
+            return cached[1]
+
+        text=render()
+        with self._lock:
+            self._rendered[name]=(key, text)
+        return text
+
+    def triage_system_prompt(self)->str:
+        return self._cached(
+            "triage",
+            (self.store.version(TRIAGE_PREFERENCES_NAMESPACE),),
+            lambda: TRIAGE_SYSTEM_PROMPT.format(
+                background=DEFAULT_BACKGROUND,
+                triage_instructions=self._preferences(TRIAGE_PREFERENCES_NAMESPACE, DEFAULT_TRIAGE_INSTRUCTIONS)
+            )
+        )
+
+    def agent_system_prompt(self)->str:
+        today=date.today().isoformat()
+        return self._cached(
+            "agent",
+            (self.store.version(RESPONSE_PREFERENCES_NAMESPACE), self.store.version(CAL_PREFERENCES_NAMESPACE), today),
+            lambda: AGENT_SYSTEM_PROMPT.format(
+                background=DEFAULT_BACKGROUND,
+                responses_preferences=self._preferences(RESPONSE_PREFERENCES_NAMESPACE, DEFAULT_RESPONSE_PREFERENCES),
+                cal_preferences=self._preferences(CAL_PREFERENCES_NAMESPACE, DEFAULT_CAL_PREFERENCES),
+                today=today
+            )
+        )
+
+
+prompt_assembler=PromptAssembler(store)
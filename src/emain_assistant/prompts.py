@@ -1,6 +1,10 @@
-from datetime import datetime
-
+# Bump whenever the triage prompts or RouterSchema change in a way that should
+# invalidate cached triage decisions.
+TRIAGE_PROMPT_VERSION="2"
 
+# Static sections come first and learned preferences last, so the rendered
+# prefix stays byte-identical across preference updates and provider-side
+# prompt caching keeps hitting.
 TRIAGE_SYSTEM_PROMPT="""
 
 < Role >
@@ -8,10 +12,6 @@ Your role is to triage incoming emails based upon instructs and background infor
 </ Role >
 
 
-<Background>
-{background}
-</ Background> 
-
 < Instructions >
 Categorize each email into one of three categories:
 1. IGNORE - Emails that are not worth responding to or tracking 
@@ -20,6 +20,11 @@ Categorize each email into one of three categories:
 Classify the below email into one of these categories.
 </ Instructions >
 
+
+<Background>
+{background}
+</ Background> 
+
 < Rules >
 {triage_instructions}
 </ Rules >
@@ -97,7 +102,7 @@ When handling emails, follow these steps:
 3. For responding to the email, draft a response email with the write_email tool
 4. For meeting requests, use the check_calendar availability tool to find open time slots
 5. To schedule a meeting, use the schedule_meeting tool with a datetime object for the preferred_day parameter
-    - Today's date is """ + datetime.now().strftime("%Y-%m-%d") + """ - use this for scheduling meetings accurately
+    - Today's date is given in the < Today > section below - use this for scheduling meetings accurately
 6. If you scheduled a meeting, then draft a short response email using the write_email tool
 7. After using the write_email too, the task is complete
 8. If you have sent the email, then use the Done tool to indicatet that the task is complete
@@ -116,6 +121,10 @@ When handling emails, follow these steps:
 {cal_preferences}
 </ Calendar Preferences >
 
+< Today >
+{today}
+</ Today >
+
 
 """
 
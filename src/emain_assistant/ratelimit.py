@@ -0,0 +1,141 @@
+import math
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+from compaction import CHARS_PER_TOKEN
+
+
+LLM_RPM=float(os.getenv("LLM_RPM","0"))
+LLM_TPM=float(os.getenv("LLM_TPM","0"))
+LLM_OUTPUT_TOKENS_ESTIMATE=int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE","256"))
+LLM_MAX_RETRIES=int(os.getenv("LLM_MAX_RETRIES","5"))
+LLM_RETRY_BASE_SECONDS=float(os.getenv("LLM_RETRY_BASE_SECONDS","0.5"))
+LLM_RETRY_MAX_SECONDS=float(os.getenv("LLM_RETRY_MAX_SECONDS","30"))
+
+RETRYABLE_STATUS=frozenset({408, 429, 500, 502, 503, 504, 529})
+_RETRYABLE_ERRORS=frozenset({"APIConnectionError","APITimeoutError","InternalServerError","ServiceUnavailableError","OverloadedError"})
+
+
+class LLMRateLimitError(Exception):
+    """The provider kept rate limiting a call after every retry was spent."""
+
+    def __init__(self, message:str, retry_after:Optional[float]=None):
+        super().__init__(message)
+        self.retry_after=retry_after
+
+
+class TokenBucket:
+    """Refills at `per_minute` units per minute up to `capacity` (one minute's worth by default).
+
+    `reserve` takes the units straight away and returns how long the caller
+    must wait before using them, so sync and async callers can both wait
+    without holding the lock, and callers are served in reservation order.
+    """
+
+    def __init__(self, per_minute:float, capacity:Optional[float]=None):
+        self.rate=per_minute/60
+        self.capacity=capacity if capacity is not None else per_minute
+        self._tokens=self.capacity
+        self._updated=time.monotonic()
+        self._lock=threading.Lock()
+
+    def _refill(self, now:float)->None:
+        self._tokens=min(self.capacity, self._tokens+(now-self._updated)*self.rate)
+        self._updated=now
+
+    def reserve(self, amount:float)->float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens-=amount
+            return 0.0 if self._tokens>=0 else -self._tokens/self.rate
+
+    def adjust(self, amount:float)->None:
+        """Take (positive) or give back (negative) units after the fact, e.g. once actual token usage is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens=min(self.capacity, self._tokens-amount)
+
+
+class RateLimits:
+    """Requests-per-minute and tokens-per-minute budgets for one model; 0 disables a budget."""
+
+    def __init__(self, rpm:float=LLM_RPM, tpm:float=LLM_TPM):
+        self.requests=TokenBucket(rpm) if rpm>0 else None
+        self.tokens=TokenBucket(tpm) if tpm>0 else None
+
+    def reserve(self, tokens:int)->float:
+        wait=0.0
+        if self.requests is not None:
+            wait=self.requests.reserve(1)
+        if self.tokens is not None:
+            wait=max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def reconcile(self, estimated:int, actual:Optional[int])->None:
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(actual-estimated)
+
+
+def status_code(error:BaseException)->Optional[int]:
+    status=getattr(error, "status_code", None)
+    if status is None:
+        status=getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_rate_limit(error:BaseException)->bool:
+    return status_code(error)==429 or type(error).__name__=="RateLimitError"
+
+
+def is_retryable(error:BaseException)->bool:
+    status=status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def retry_after(error:BaseException)->Optional[float]:
+    """Server-requested delay from `retry-after-ms` / `retry-after` (seconds form only)."""
+    headers=getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"])/1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backoff(attempt:int, requested:Optional[float]=None, base:float=LLM_RETRY_BASE_SECONDS, cap:float=LLM_RETRY_MAX_SECONDS)->float:
+    """Full-jitter exponential backoff; a server-requested delay is honoured, plus jitter so callers spread out."""
+    if requested is not None:
+        return min(cap, requested+random.uniform(0, base))
+    return random.uniform(0, min(cap, base*2**attempt))
+
+
+def estimate_input_tokens(input)->int:
+    # Same characters-per-token heuristic as history compaction.
+    if isinstance(input, str):
+        chars=len(input)
+    elif isinstance(input, (list, tuple)):
+        chars=sum(len(str(message.get("content","") if isinstance(message, dict) else getattr(message, "content", message))) for message in input)
+    else:
+        chars=len(str(input))
+    return math.ceil(chars/CHARS_PER_TOKEN)
+
+
+def usage_tokens(result)->Optional[int]:
+    usage=getattr(result, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("total_tokens") or (usage.get("input_tokens",0)+usage.get("output_tokens",0))
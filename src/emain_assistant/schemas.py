@@ -1,6 +1,7 @@
 
+import operator
 from pydantic import BaseModel, Field
-from typing_extensions import Literal, TypedDict, Optional, Any, Dict, List
+from typing_extensions import Annotated, Literal, TypedDict, Optional, Any, Dict, List
 from langgraph.graph import MessagesState
 
 class RouterSchema(BaseModel):
@@ -17,6 +18,12 @@ class RouterSchema(BaseModel):
 class State(MessagesState):
     email_input:dict 
     classification_decision: Literal["ignore","responsd","notify"]
+    # Estimated prompt tokens removed by history compaction, summed over the run.
+    compaction_tokens_saved: Annotated[int, operator.add]
+    # Characters of quoted history, signatures and disclaimers stripped before triage.
+    thread_chars_removed: int
+    # Classification already made before the graph ran (the job queue's triage stage); skips the triage tiers.
+    triage_decision: dict
 
 
 
@@ -41,9 +48,53 @@ class ProcessEmailRequest(BaseModel):
     
 
 class ProcessEmailResponse(BaseModel):
-    classification: Literal["ignore", "respond", "notify"]
+    classification: Optional[Literal["ignore", "respond", "notify"]] = Field(
+        description="None when processing the email failed; see `error`"
+    )
     response: str
     reasoning: str
+    superseded_by: Optional[int] = Field(
+        default=None,
+        description="In a batch: index of the newer email from the same conversation that was processed in this one's place"
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="In a batch: why this email could not be processed; the other emails are unaffected"
+    )
+
+
+class ProcessEmailBatchRequest(BaseModel):
+    emails: List[EmailInput] = Field(description="Emails to process")
+    max_concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="Maximum number of emails processed concurrently (capped by the server limit)"
+    )
+    group_conversations: Optional[bool] = Field(
+        default=None,
+        description="Process only the newest email per conversation, with earlier ones as context (server default when unset)"
+    )
+
+
+class ProcessEmailBatchResponse(BaseModel):
+    results: List[ProcessEmailResponse] = Field(description="Per-email results, in input order")
+
+
+class JobResponse(BaseModel):
+    job_id: str = Field(description="Job ID to poll with GET /jobs/{job_id}")
+    status: Literal["queued", "running", "completed", "failed"] = Field(description="Status of the job")
+    classification: Optional[Literal["ignore", "respond", "notify"]] = Field(
+        default=None,
+        description="Triage decision, once known"
+    )
+    result: Optional[ProcessEmailResponse] = Field(
+        default=None,
+        description="Final result when status=completed"
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Error message when status=failed"
+    )
 
 
 class HumanResponse(BaseModel):
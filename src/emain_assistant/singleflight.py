@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls with the same key onto one in-flight computation.
+
+    The first caller for a key starts the computation as a task; callers
+    arriving while it runs await the same task and get the same result (or
+    exception). The task is shielded, so one caller giving up (a client
+    disconnect cancelling its request) does not cancel it for the others.
+    Nothing is kept once the task finishes: this is coalescing, not caching.
+    """
+
+    def __init__(self):
+        self._calls:Dict[Hashable, asyncio.Task]={}
+        self.leaders=0
+        self.shared=0
+
+    def in_flight(self)->int:
+        return len(self._calls)
+
+    async def do(self, key:Hashable, fn:Callable[[], Awaitable[Any]])->Any:
+        loop=asyncio.get_running_loop()
+        task=self._calls.get(key)
+        if task is not None and task.get_loop() is loop:
+            self.shared+=1
+            return await asyncio.shield(task)
+
+        task=loop.create_task(fn())
+        self._calls[key]=task
+        self.leaders+=1
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key:Hashable, task:asyncio.Task)->None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved even if every caller was cancelled.
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,129 @@
+"""Local OpenAI-compatible chat completions server that answers like the fake model and returns scripted 429s.
+
+    python stub_llm_server.py --port 8001 --script 200,429,429 --rpm 120 --max-concurrency 4
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub LLM_MODEL=openai:stub python main.py
+
+Requests cycle through `--script` status codes; on top of that, requests over
+`--rpm` in the last minute or beyond `--max-concurrency` in flight get a 429
+with a Retry-After header, the way a real provider pushes back. GET /stats
+reports what was served.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from fake_models import DEFAULT_TOOL_SCRIPT, FakeChatModel
+
+
+def _completion(model:str, message:dict, messages:list)->dict:
+    prompt_tokens=sum(len(str(m.get("content") or "")) for m in messages)//4
+    completion_tokens=len(json.dumps(message))//4
+    return {
+        "id":f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object":"chat.completion",
+        "created":int(time.time()),
+        "model":model,
+        "choices":[{"index":0, "message":message, "finish_reason":"tool_calls" if message.get("tool_calls") else "stop"}],
+        "usage":{"prompt_tokens":prompt_tokens, "completion_tokens":completion_tokens, "total_tokens":prompt_tokens+completion_tokens},
+    }
+
+
+def _tool_call(name:str, args:dict)->dict:
+    return {"role":"assistant", "content":None, "tool_calls":[{"id":f"call_{uuid.uuid4().hex[:12]}", "type":"function", "function":{"name":name, "arguments":json.dumps(args)}}]}
+
+
+def _reply(body:dict, structured_outputs:dict)->dict:
+    messages=body.get("messages", [])
+    response_format=body.get("response_format") or {}
+    if response_format.get("type")=="json_schema":
+        name=response_format.get("json_schema", {}).get("name")
+        return {"role":"assistant", "content":json.dumps(structured_outputs.get(name, {}))}
+
+    tool_names=[tool["function"]["name"] for tool in body.get("tools") or []]
+    if len(tool_names)==1 and tool_names[0] in structured_outputs:
+        return _tool_call(tool_names[0], structured_outputs[tool_names[0]])
+    if tool_names:
+        step=sum(1 for message in messages if message.get("role")=="assistant")
+        name, args=DEFAULT_TOOL_SCRIPT[min(step, len(DEFAULT_TOOL_SCRIPT)-1)]
+        return _tool_call(name, args)
+    return {"role":"assistant", "content":"Stub response."}
+
+
+def create_app(script:Optional[List[int]]=None, rpm:int=0, max_concurrency:int=0, latency_ms:float=0.0, retry_after:float=1.0)->FastAPI:
+    app=FastAPI(title="Stub LLM server")
+    statuses=itertools.cycle(script or [200])
+    recent=deque()
+    structured_outputs=FakeChatModel.from_env().structured_outputs
+    stats={"requests":0, "ok":0, "rate_limited":0, "errors":0, "in_flight":0, "max_in_flight":0}
+
+    def _error(status:int, message:str)->JSONResponse:
+        if status==429:
+            stats["rate_limited"]+=1
+        else:
+            stats["errors"]+=1
+        return JSONResponse(
+            status_code=status,
+            content={"error":{"message":message, "type":"rate_limit_error" if status==429 else "server_error", "code":None}},
+            headers={"retry-after":str(retry_after)} if status==429 else None,
+        )
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request:Request):
+        body=await request.json()
+        stats["requests"]+=1
+        now=time.monotonic()
+        while recent and now-recent[0]>60:
+            recent.popleft()
+
+        status=next(statuses)
+        if status!=200:
+            return _error(status, f"Scripted {status}")
+        if rpm and len(recent)>=rpm:
+            return _error(429, f"Rate limit of {rpm} requests per minute reached")
+        if max_concurrency and stats["in_flight"]>=max_concurrency:
+            return _error(429, f"Too many concurrent requests (max {max_concurrency})")
+
+        recent.append(now)
+        stats["in_flight"]+=1
+        stats["max_in_flight"]=max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency_ms/1000)
+        finally:
+            stats["in_flight"]-=1
+        stats["ok"]+=1
+        return _completion(body.get("model","stub"), _reply(body, structured_outputs), body.get("messages", []))
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main()->None:
+    import uvicorn
+
+    parser=argparse.ArgumentParser(description="OpenAI-compatible stub LLM server with scripted rate limiting.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--script", default="200", help="Comma-separated status codes to cycle through, e.g. 200,429,429")
+    parser.add_argument("--rpm", type=int, default=0, help="429 once more than this many requests arrived in the last minute (0: off)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="429 beyond this many requests in flight (0: off)")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    args=parser.parse_args()
+
+    script=[int(status) for status in args.script.split(",") if status.strip()]
+    uvicorn.run(create_app(script, args.rpm, args.max_concurrency, args.latency_ms, args.retry_after), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__=="__main__":
+    main()
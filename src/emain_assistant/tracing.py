@@ -0,0 +1,120 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+
+DEBUG=10
+INFO=20
+WARNING=30
+ERROR=40
+OFF=100
+
+_LEVELS={"DEBUG":DEBUG, "INFO":INFO, "WARNING":WARNING, "ERROR":ERROR, "OFF":OFF}
+
+TRACE_LEVEL=_LEVELS.get(os.getenv("TRACE_LEVEL","INFO").upper(), INFO)
+TRACE_SAMPLE_RATE=float(os.getenv("TRACE_SAMPLE_RATE","1.0"))
+TRACE_HEADER="X-Trace-Id"
+
+logger=logging.getLogger("email_assistant.trace")
+if not logger.handlers:
+    _handler=logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate=False
+
+
+class _Trace:
+    __slots__=("trace_id","sampled")
+
+    def __init__(self, trace_id:str, sampled:bool):
+        self.trace_id=trace_id
+        self.sampled=sampled
+
+
+_current_trace:contextvars.ContextVar[Optional[_Trace]]=contextvars.ContextVar("current_trace", default=None)
+
+
+def _sample()->bool:
+    return TRACE_SAMPLE_RATE>=1.0 or random.random()<TRACE_SAMPLE_RATE
+
+
+@contextmanager
+def start_trace(trace_id:Optional[str]=None):
+    """Run the block under one trace id; the sampling decision is made once, here."""
+    trace=_Trace(trace_id or uuid.uuid4().hex, _sample())
+    token=_current_trace.set(trace)
+    try:
+        yield trace.trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace_id()->Optional[str]:
+    trace=_current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def enabled(level:int)->bool:
+    """True when an event at `level` would be written in the current context.
+
+    Warnings and errors ignore sampling, so failures are always visible.
+    """
+    if level<TRACE_LEVEL:
+        return False
+    if level>=WARNING:
+        return True
+    trace=_current_trace.get()
+    return trace.sampled if trace is not None else _sample()
+
+
+def log(level:int, event:str, **fields)->None:
+    _emit(level, event, fields)
+
+
+def _emit(level:int, event:str, fields:dict)->None:
+    if not enabled(level):
+        return
+
+    record={"ts":round(time.time(), 6), "level":logging.getLevelName(level), "event":event, "trace_id":current_trace_id()}
+    # Payloads may be zero-argument callables so that expensive ones are only
+    # built for events that are actually written.
+    for key, value in fields.items():
+        record[key]=value() if callable(value) else value
+
+    logger.log(level, json.dumps(record, default=str))
+
+
+def debug(event:str, **fields)->None:
+    _emit(DEBUG, event, fields)
+
+
+def info(event:str, **fields)->None:
+    _emit(INFO, event, fields)
+
+
+def warning(event:str, **fields)->None:
+    _emit(WARNING, event, fields)
+
+
+def error(event:str, **fields)->None:
+    _emit(ERROR, event, fields)
+
+
+def summarize_messages(messages:list)->list:
+    """Shape of a message list (type, size, tool names) without its content."""
+    return [
+        {
+            "type":message.type,
+            "chars":len(str(message.content)),
+            "tool_calls":[tool_call["name"] for tool_call in (getattr(message, "tool_calls", None) or [])],
+        }
+        for message in messages
+    ]
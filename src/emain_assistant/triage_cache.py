@@ -0,0 +1,100 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from prompts import TRIAGE_PROMPT_VERSION
+from schemas import RouterSchema
+
+
+TRIAGE_CACHE_MAX_SIZE=int(os.getenv("TRIAGE_CACHE_MAX_SIZE","1024"))
+TRIAGE_CACHE_TTL_SECONDS=float(os.getenv("TRIAGE_CACHE_TTL_SECONDS","3600"))
+
+_WHITESPACE=re.compile(r"\s+")
+
+
+def normalize_email(author:str, to:str, subject:str, email_thread:str)-> Tuple[str, str, str, str]:
+    """Collapse whitespace (and case, for addresses) so trivially different copies hash alike."""
+    return (
+        _WHITESPACE.sub(" ", author).strip().lower(),
+        _WHITESPACE.sub(" ", to).strip().lower(),
+        _WHITESPACE.sub(" ", subject).strip(),
+        _WHITESPACE.sub(" ", email_thread).strip(),
+    )
+
+
+def email_fingerprint(author:str, to:str, subject:str, email_thread:str)->str:
+    digest=hashlib.sha256()
+    for part in normalize_email(author, to, subject, email_thread):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class TriageCache:
+    """Thread-safe LRU + TTL cache of triage decisions keyed by email content and prompt."""
+
+    def __init__(self, max_size:int=TRIAGE_CACHE_MAX_SIZE, ttl_seconds:float=TRIAGE_CACHE_TTL_SECONDS):
+        self.max_size=max_size
+        self.ttl_seconds=ttl_seconds
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self._entries:"OrderedDict[str, Tuple[float, RouterSchema]]"=OrderedDict()
+        self._lock=threading.Lock()
+
+    def key(self, system_prompt:str, author:str, to:str, subject:str, email_thread:str)->str:
+        # The rendered system prompt carries the triage instructions, so a
+        # preference change produces a new key even before the cache is cleared.
+        digest=hashlib.sha256()
+        digest.update(TRIAGE_PROMPT_VERSION.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(system_prompt.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(email_fingerprint(author, to, subject, email_thread).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key:str)->Optional[RouterSchema]:
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+
+            expires_at, result=entry
+            if expires_at<=time.monotonic():
+                del self._entries[key]
+                self.evictions+=1
+                self.misses+=1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return result
+
+    def put(self, key:str, result:RouterSchema)->None:
+        with self._lock:
+            self._entries[key]=(time.monotonic()+self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions+=1
+
+    def clear(self)->None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self)->dict:
+        with self._lock:
+            return {
+                "size":len(self._entries),
+                "hits":self.hits,
+                "misses":self.misses,
+                "evictions":self.evictions,
+            }
+
+
+triage_cache=TriageCache()
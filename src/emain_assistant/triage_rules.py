@@ -0,0 +1,77 @@
+import json
+import os
+import re
+from typing import List, Optional
+
+from schemas import RouterSchema
+
+
+TRIAGE_RULES_PATH=os.getenv(
+    "TRIAGE_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),"triage_rules.json")
+)
+
+RULE_FIELDS=("sender","domain","subject","body")
+CLASSIFICATIONS=("ignore","notify","respond")
+
+_DOMAIN=re.compile(r"@([\w.-]+)")
+
+
+def sender_domain(author:str)->str:
+    match=_DOMAIN.search(author)
+    return match.group(1).lower() if match else ""
+
+
+class TriageRules:
+    """Deterministic sender/domain/subject/body rules evaluated before the LLM.
+
+    Each pattern is compiled on its own and rules are tried in the order
+    they are listed, so the first listed rule that matches wins and one
+    rule's groups or backreferences cannot interfere with another's.
+    """
+
+    def __init__(self, rules:List[dict]):
+        self.rules=rules
+        self.hits=[0]*len(rules)
+        self._patterns=[]
+
+        for index, rule in enumerate(rules):
+            field=rule.get("field")
+            if field not in RULE_FIELDS:
+                raise ValueError(f"Rule {rule.get('name', index)!r}: field must be one of {RULE_FIELDS}, got {field!r}")
+            if rule.get("classification") not in CLASSIFICATIONS:
+                raise ValueError(f"Rule {rule.get('name', index)!r}: classification must be one of {CLASSIFICATIONS}, got {rule.get('classification')!r}")
+            try:
+                self._patterns.append(re.compile(rule["pattern"], re.IGNORECASE))
+            except (KeyError, re.error) as e:
+                raise ValueError(f"Rule {rule.get('name', index)!r}: invalid pattern: {e}")
+
+    @classmethod
+    def from_file(cls, path:str=TRIAGE_RULES_PATH)->"TriageRules":
+        if not os.path.exists(path):
+            return cls([])
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f).get("rules", []))
+
+    def match(self, author:str, to:str, subject:str, email_thread:str)->Optional[RouterSchema]:
+        if not self._patterns:
+            return None
+
+        values={
+            "sender":author,
+            "domain":sender_domain(author),
+            "subject":subject,
+            "body":email_thread,
+        }
+
+        for index, (rule, pattern) in enumerate(zip(self.rules, self._patterns)):
+            if pattern.search(values[rule["field"]]):
+                self.hits[index]+=1
+                return RouterSchema(
+                    reasoning=f"Matched pre-triage rule '{rule.get('name', index)}' ({rule['field']} ~ /{rule['pattern']}/)",
+                    classification=rule["classification"]
+                )
+        return None
+
+
+triage_rules=TriageRules.from_file()
@@ -1,7 +1,16 @@
-from typing import List, Tuple, Any
+from typing import Generator, Iterable, List, NamedTuple, Tuple, Any
+import io
 import json 
+import os
+import re
 
 
+# Fall back to the original thread when a cutoff leaves less than this share
+# of it and fewer than NORMALIZE_MIN_KEEP_CHARS characters: a false-positive
+# signature, disclaimer or header match, not quoted history.
+NORMALIZE_MIN_KEEP_RATIO=float(os.getenv("NORMALIZE_MIN_KEEP_RATIO","0.1"))
+NORMALIZE_MIN_KEEP_CHARS=int(os.getenv("NORMALIZE_MIN_KEEP_CHARS","20"))
+
 
 def parse_email(email_input:dict)-> Tuple[str, str, str, str]:
 
@@ -13,6 +22,110 @@ def parse_email(email_input:dict)-> Tuple[str, str, str, str]:
     )
 
 
+class NormalizedThread(NamedTuple):
+    text: str
+    removed_chars: int
+
+
+_QUOTE_HEADER=re.compile(r"^\s*On\b.{0,300}\bwrote:\s*$", re.IGNORECASE)
+_QUOTE_HEADER_TAIL=re.compile(r"^.{0,200}\bwrote:\s*$", re.IGNORECASE)
+_ORIGINAL_MESSAGE=re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE)
+_OUTLOOK_FROM=re.compile(r"^\s*\*?From:\*?\s", re.IGNORECASE)
+_OUTLOOK_SENT=re.compile(r"^\s*\*?(Sent|Date):\*?\s", re.IGNORECASE)
+_SIGNATURE_DELIMITER=re.compile(r"^--\s?$")
+_MOBILE_FOOTER=re.compile(r"^\s*Sent from my [\w ]{1,40}$", re.IGNORECASE)
+_DISCLAIMER=re.compile(
+    r"^\s*(CONFIDENTIALITY NOTICE|DISCLAIMER|This (e-?mail|message)( and any (attachments|files)( transmitted with it)?)? (is|are|may (be|contain)) (confidential|privileged|intended))",
+    re.IGNORECASE
+)
+
+
+def strip_quoted_lines(lines:Iterable[str])->Generator[str, None, bool]:
+    """Yield the lines of an email body that are not quoted history or boilerplate.
+
+    Drops `>` quoted lines and their "On ... wrote:" headers (inline answers
+    between quotes are kept), and stops at an Outlook-style original message,
+    a `-- ` signature delimiter or a legal disclaimer once some body text has
+    been yielded; before that those lines are body text. Works line by line,
+    so it never holds more than one line of lookahead. The generator returns
+    True when it stopped at such a cutoff.
+    """
+    pending=None
+    previous_blank=True
+    has_body=False
+
+    for line in lines:
+        line=line.rstrip("\r\n")
+
+        if pending is not None:
+            held, pending=pending, None
+            if _QUOTE_HEADER_TAIL.match(line):
+                continue
+            if has_body and _OUTLOOK_FROM.match(held) and _OUTLOOK_SENT.match(line):
+                return True
+            if not held.strip():
+                if not previous_blank:
+                    yield held
+                previous_blank=True
+            else:
+                yield held
+                previous_blank=False
+                has_body=True
+
+        stripped=line.lstrip()
+        if stripped.startswith(">") or _QUOTE_HEADER.match(line) or _MOBILE_FOOTER.match(line):
+            continue
+        if has_body and (_ORIGINAL_MESSAGE.match(line) or _SIGNATURE_DELIMITER.match(line) or _DISCLAIMER.match(line)):
+            return True
+        if stripped.lower().startswith("on ") or (has_body and _OUTLOOK_FROM.match(line)):
+            # Could be the first half of a wrapped quote header; decide on the next line.
+            pending=line
+            continue
+
+        if not stripped:
+            if not previous_blank:
+                yield ""
+            previous_blank=True
+        else:
+            yield line
+            previous_blank=False
+            has_body=True
+
+    if pending is not None and pending.strip():
+        yield pending
+    return False
+
+
+def normalize_email_thread(email_thread:str)->NormalizedThread:
+    """Thread with quoted history and boilerplate stripped, or the original when stripping looks wrong."""
+    lines=strip_quoted_lines(io.StringIO(email_thread))
+    kept=[]
+    try:
+        while True:
+            kept.append(next(lines))
+    except StopIteration as stop:
+        cut=stop.value
+    text="\n".join(kept).strip()
+
+    if not text or (cut and len(text)<NORMALIZE_MIN_KEEP_RATIO*len(email_thread) and len(text)<NORMALIZE_MIN_KEEP_CHARS):
+        text=email_thread.strip()
+    return NormalizedThread(text, len(email_thread)-len(text))
+
+
+# Set on an email_input whose thread is already normalized (a merged
+# conversation, see conversations.with_earlier_messages); normalizing it again
+# could cut the thread at a line of one of the merged messages.
+THREAD_NORMALIZED="thread_normalized"
+
+
+def normalize_email_input(email_input:dict)->Tuple[dict, int]:
+    """Return a copy of `email_input` with a normalized thread, and the characters removed."""
+    if email_input.get(THREAD_NORMALIZED):
+        return email_input, 0
+    normalized=normalize_email_thread(email_input.get("email_thread",""))
+    return {**email_input, "email_thread":normalized.text}, normalized.removed_chars
+
+
 def format_email_markdown(subject:str, author:str, to:str, email_thread:str)->str:
 
     return f"""
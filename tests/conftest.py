@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The service modules import each other by bare name, as when run from src/emain_assistant.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "emain_assistant"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLM_MODEL", "fake:test")
+os.environ.setdefault("TRACE_LEVEL", "ERROR")
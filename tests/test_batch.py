@@ -0,0 +1,57 @@
+import asyncio
+
+import agent
+import nodes
+
+
+def _email(subject:str, email_thread:str, author:str="Ann <ann@x.com>")->dict:
+    return {"author":author, "to":"bob@x.com", "subject":subject, "email_thread":email_thread}
+
+
+def test_one_failing_email_does_not_fail_the_batch(monkeypatch):
+    aclassify=nodes._aclassify
+
+    async def flaky(author, to, subject, email_thread):
+        if subject=="Broken":
+            raise RuntimeError("provider returned garbage")
+        return await aclassify(author, to, subject, email_thread)
+
+    monkeypatch.setattr(nodes, "_aclassify", flaky)
+    emails=[
+        _email("Offsite agenda", "Could you send me the agenda for the offsite next week?"),
+        _email("Broken", "This one fails during triage."),
+        _email("Invoice 4411", "Please confirm you received invoice 4411 for the October retainer.", author="Dan <dan@y.com>"),
+    ]
+
+    results=asyncio.run(agent.process_emails_batch(emails, group_conversations=False))
+
+    assert len(results)==3
+    assert results[1]==agent._failed_result(RuntimeError("provider returned garbage"))
+    assert results[1]["error"]=="RuntimeError: provider returned garbage"
+    for result in (results[0], results[2]):
+        assert result["classification"]=="respond"
+        assert result["response"]!="No response generated"
+        assert result.get("error") is None
+
+
+def test_earlier_messages_of_a_conversation_point_at_the_latest(monkeypatch):
+    processed=[]
+
+    async def aprocess_email(email_input:dict)->dict:
+        processed.append(email_input)
+        return {"classification":"notify", "response":"No response generated", "reasoning":"", "compaction_tokens_saved":0, "thread_chars_removed":0}
+
+    monkeypatch.setattr(agent, "aprocess_email", aprocess_email)
+    emails=[
+        _email("Offsite agenda", "Could you send me the agenda?"),
+        _email("Invoice 4411", "Please confirm invoice 4411.", author="Dan <dan@y.com>"),
+        _email("Re: Offsite agenda", "Any news on the agenda?"),
+    ]
+
+    results=asyncio.run(agent.process_emails_batch(emails))
+
+    assert len(processed)==2
+    assert results[0]["superseded_by"]==2
+    assert results[0]["classification"]=="notify"
+    assert "superseded_by" not in results[1]
+    assert "superseded_by" not in results[2]
@@ -0,0 +1,154 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import agent_tools
+from calendar_engine import BusyIndex, CalendarEngine, attendee_key, parse_ics_busy
+
+
+DAY=date(2026, 10, 20)
+
+
+def _at(hour:int, minute:int=0, day:date=DAY)->datetime:
+    return datetime(day.year, day.month, day.day, hour, minute)
+
+
+def _ics(*events:str)->list:
+    lines=["BEGIN:VCALENDAR"]
+    for event in events:
+        lines+=["BEGIN:VEVENT", *event.strip().splitlines(), "END:VEVENT"]
+    return [line+"\r\n" for line in lines+["END:VCALENDAR"]]
+
+
+def _write_calendar(directory, attendee:str, *events:str)->None:
+    (directory/f"{attendee}.ics").write_text("".join(_ics(*events)), encoding="utf-8")
+
+
+def test_parse_ics_busy_time_forms():
+    busy=parse_ics_busy(_ics(
+        "DTSTART:20261020T090000Z\nDTEND:20261020T100000Z",
+        "DTSTART;TZID=Europe/Berlin:20261020T140000\nDTEND;TZID=Europe/Berlin:20261020T150000",
+        "DTSTART:20261020T160000\nDURATION:PT45M",
+        "DTSTART;VALUE=DATE:20261021",
+    ))
+    assert busy==[
+        (_at(9), _at(10)),
+        (_at(12), _at(13)),
+        (_at(16), _at(16, 45)),
+        (datetime(2026, 10, 21), datetime(2026, 10, 22)),
+    ]
+
+
+def test_parse_ics_busy_skips_free_cancelled_and_empty_events():
+    busy=parse_ics_busy(_ics(
+        "DTSTART:20261020T090000Z\nDTEND:20261020T100000Z\nSTATUS:CANCELLED",
+        "DTSTART:20261020T090000Z\nDTEND:20261020T100000Z\nTRANSP:TRANSPARENT",
+        "DTSTART:20261020T090000Z",
+        "SUMMARY:no start",
+    ))
+    assert busy==[]
+
+
+def test_parse_ics_busy_unfolds_continuation_lines():
+    assert parse_ics_busy(["BEGIN:VEVENT\r\n", "DTSTART:20261020T0900\r\n", " 00Z\r\n", "DTEND:20261020T100000Z\r\n", "END:VEVENT\r\n"])==[(_at(9), _at(10))]
+
+
+def test_attendee_key_extracts_the_address():
+    assert attendee_key("Bob Smith <Bob@Example.com>")=="bob@example.com"
+    assert attendee_key(" Carol ")=="carol"
+
+
+def test_busy_index_merges_overlapping_and_adjacent_intervals():
+    index=BusyIndex([(_at(9), _at(10)), (_at(9, 30), _at(11)), (_at(11), _at(12)), (_at(14), _at(15))])
+    assert list(zip(index.starts, index.ends))==[(_at(9), _at(12)), (_at(14), _at(15))]
+    assert not index.is_free(_at(11, 30), _at(13))
+    assert index.is_free(_at(12), _at(14))
+
+    merged=index.added(_at(12), _at(14, 30))
+    assert list(zip(merged.starts, merged.ends))==[(_at(9), _at(15))]
+    assert list(zip(index.starts, index.ends))==[(_at(9), _at(12)), (_at(14), _at(15))]
+
+
+def test_find_slots_skips_busy_time_and_realigns_to_the_grid(tmp_path):
+    _write_calendar(tmp_path, "bob@x.com", "DTSTART:20261020T090000\nDTEND:20261020T101500")
+    _write_calendar(tmp_path, "carol@x.com", "DTSTART:20261020T110000\nDTEND:20261020T120000")
+    engine=CalendarEngine(str(tmp_path))
+
+    slots=engine.find_slots(["Bob <bob@x.com>", "carol@x.com"], DAY, DAY, 30, k=3)
+    assert slots==[(_at(10, 30), _at(11)), (_at(12), _at(12, 30)), (_at(12, 30), _at(13))]
+
+
+def test_find_slots_without_a_calendar_file_is_free_in_working_hours(tmp_path):
+    engine=CalendarEngine(str(tmp_path))
+    assert engine.find_slots(["nobody@x.com"], DAY, DAY, 60, k=1)==[(_at(9), _at(10))]
+    assert engine.find_slots(["nobody@x.com"], DAY, DAY, 9*60)==[]
+
+
+def test_find_slots_moves_to_the_next_day(tmp_path):
+    _write_calendar(tmp_path, "bob@x.com", "DTSTART:20261020T090000\nDTEND:20261020T170000")
+    engine=CalendarEngine(str(tmp_path))
+    assert engine.find_slots(["bob@x.com"], DAY, DAY+timedelta(days=1), 30, k=1)==[(_at(9, day=DAY+timedelta(days=1)), _at(9, 30, day=DAY+timedelta(days=1)))]
+
+
+def test_book_reserves_the_slot_and_reports_conflicts(tmp_path):
+    engine=CalendarEngine(str(tmp_path))
+    assert engine.book(["bob@x.com", "carol@x.com"], _at(10), _at(11))==[]
+    assert engine.book(["Carol <carol@x.com>", "dan@x.com"], _at(10, 30), _at(11, 30))==["Carol <carol@x.com>"]
+    assert engine.find_slots(["bob@x.com"], DAY, DAY, 60, k=2)==[(_at(9), _at(10)), (_at(11), _at(12))]
+
+
+def test_book_does_not_change_an_index_a_search_is_reading(tmp_path):
+    engine=CalendarEngine(str(tmp_path))
+    engine.book(["bob@x.com"], _at(9), _at(10))
+    searching=engine.index("bob@x.com")
+    engine.book(["bob@x.com"], _at(10), _at(11))
+    assert list(zip(searching.starts, searching.ends))==[(_at(9), _at(10))]
+    assert not engine.index("bob@x.com").is_free(_at(10), _at(11))
+
+
+def test_book_survives_a_calendar_file_change(tmp_path):
+    engine=CalendarEngine(str(tmp_path))
+    engine.book(["bob@x.com"], _at(10), _at(11))
+    _write_calendar(tmp_path, "bob@x.com", "DTSTART:20261020T130000\nDTEND:20261020T140000")
+    assert engine.conflicts(["bob@x.com"], _at(10), _at(11))==["bob@x.com"]
+    assert engine.conflicts(["bob@x.com"], _at(13), _at(14))==["bob@x.com"]
+
+
+def test_book_is_idempotent_per_booking_id(tmp_path):
+    engine=CalendarEngine(str(tmp_path))
+    assert engine.book(["bob@x.com"], _at(10), _at(11), booking_id="call_1")==[]
+    assert engine.book(["bob@x.com"], _at(10), _at(11), booking_id="call_1")==[]
+    assert engine.book(["bob@x.com"], _at(10), _at(11), booking_id="call_2")==["bob@x.com"]
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine=CalendarEngine(str(tmp_path))
+    monkeypatch.setattr(agent_tools, "calendar_engine", engine)
+    return engine
+
+
+def _schedule_call(call_id:str, **args)->dict:
+    return {"id":call_id, "name":"schedule_meeting", "args":{"attendees":["bob@x.com"], "subject":"Sync", "duration_minutes":30, "preferred_day":"2026-10-20T00:00:00", "start_time":1000, **args}}
+
+
+def test_schedule_meeting_replayed_tool_call_does_not_conflict_with_itself(engine):
+    call=_schedule_call("call_1")
+    first=agent_tools.invoke_tool(call)
+    assert "scheduled on Tuesday, October 20, 2026 at 10:00" in first
+    assert agent_tools.invoke_tool(call)==first
+    assert "conflicts for bob@x.com" in agent_tools.invoke_tool(_schedule_call("call_2"))
+
+
+@pytest.mark.parametrize("start_time", [60, 24, 2400, 1275, -5])
+def test_schedule_meeting_rejects_invalid_start_times(engine, start_time):
+    assert agent_tools.invoke_tool(_schedule_call("call_1", start_time=start_time)).startswith(f"Invalid start_time {start_time}")
+
+
+@pytest.mark.parametrize("start_time, expected", [(9, "09:00"), (14, "14:00"), (1430, "14:30"), (0, "00:00")])
+def test_schedule_meeting_accepts_hours_and_hhmm(engine, start_time, expected):
+    assert agent_tools.invoke_tool(_schedule_call("call_1", start_time=start_time)).endswith(f"at {expected}")
+
+
+def test_schedule_meeting_rejects_non_positive_duration(engine):
+    assert agent_tools.invoke_tool(_schedule_call("call_1", duration_minutes=0)).startswith("Invalid duration_minutes")
@@ -0,0 +1,121 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import classifier
+from classifier import LinearTriageClassifier, TriageClassifierTier, TriageLog, featurize, load_training_set, train
+
+
+N_FEATURES=2**12
+
+_TEMPLATES={
+    "notify":("alerts@monitor.io", "Disk usage above {n}% on host {n}", "Automated alert: disk usage crossed the threshold on host {n}. No action needed if it recovers."),
+    "respond":("{name}@company.com", "Question about the {topic} plan", "Hi, could you send me your thoughts on the {topic} plan before our meeting? Thanks, {name}"),
+    "ignore":("deals@shop.example", "{n}% off everything this weekend", "Huge savings on all items, use code SAVE{n} at checkout. Unsubscribe any time."),
+}
+
+
+def _samples(count_per_class:int=20):
+    samples, labels=[], []
+    for classification, (author, subject, body) in _TEMPLATES.items():
+        for i in range(count_per_class):
+            values={"n":i+10, "name":f"person{i}", "topic":["budget","hiring","roadmap","launch"][i%4]}
+            samples.append({"author":author.format(**values), "to":"me@company.com", "subject":subject.format(**values), "email_thread":body.format(**values)})
+            labels.append(classification)
+    return samples, labels
+
+
+def test_featurize_is_deterministic_and_normalised():
+    indices, values=featurize("a@x.com", "me", "Hello there", "Some body text", N_FEATURES)
+    again=featurize("a@x.com", "me", "Hello there", "Some body text", N_FEATURES)
+    assert np.array_equal(indices, again[0]) and np.array_equal(values, again[1])
+    assert np.all(np.diff(indices)>0) and indices.max()<N_FEATURES
+    assert np.linalg.norm(values)==pytest.approx(1.0)
+
+
+def test_fit_separates_the_classes_and_round_trips_through_a_file(tmp_path):
+    samples, labels=_samples()
+    model=LinearTriageClassifier.fit(samples, labels, n_features=N_FEATURES, epochs=100)
+    for sample, label in zip(samples, labels):
+        predicted, confidence=model.predict(sample["author"], sample["to"], sample["subject"], sample["email_thread"])
+        assert predicted==label
+
+    predicted, confidence=model.predict("alerts@monitor.io", "me", "Disk usage above 97% on host 3", "Automated alert: disk usage crossed the threshold.")
+    assert predicted=="notify" and confidence>0.5
+    assert model.predict_proba("x@y.com", "me", "hi", "hello").sum()==pytest.approx(1.0)
+
+    path=str(tmp_path/"model.npz")
+    model.save(path)
+    loaded=LinearTriageClassifier.load(path)
+    assert loaded.classes==model.classes
+    assert np.array_equal(loaded.weights, model.weights)
+
+
+def test_tier_abstains_without_a_model_or_below_the_threshold(tmp_path):
+    assert TriageClassifierTier(path=None).match("a@x.com", "me", "s", "b")==(None, None)
+    assert TriageClassifierTier(path=str(tmp_path/"missing.npz")).match("a@x.com", "me", "s", "b")==(None, None)
+
+    samples, labels=_samples()
+    path=str(tmp_path/"model.npz")
+    LinearTriageClassifier.fit(samples, labels, n_features=N_FEATURES, epochs=100).save(path)
+
+    result, confidence=TriageClassifierTier(path=path, threshold=0.0).match(**{key:samples[0][key] for key in ("author","to","subject","email_thread")})
+    assert result.classification==labels[0] and confidence>0
+
+    result, confidence=TriageClassifierTier(path=path, threshold=1.01).match(**{key:samples[0][key] for key in ("author","to","subject","email_thread")})
+    assert result is None and confidence is not None
+
+
+def test_tier_reloads_when_the_model_file_changes(tmp_path):
+    path=str(tmp_path/"model.npz")
+    samples, labels=_samples()
+    LinearTriageClassifier.fit(samples, labels, n_features=N_FEATURES, epochs=100).save(path)
+    tier=TriageClassifierTier(path=path, threshold=0.0)
+    first=tier._current_model()
+
+    LinearTriageClassifier.fit(samples, labels, n_features=N_FEATURES, epochs=10).save(path)
+    os.utime(path, (os.path.getmtime(path)+10,)*2)
+    assert tier._current_model() is first  # checked at most every few seconds
+    tier._checked=None
+    assert tier._current_model() is not first
+
+
+def test_triage_log_keeps_the_latest_label_and_prefers_reviewers(tmp_path):
+    path=str(tmp_path/"triage_log.jsonl")
+    log=TriageLog(path)
+    email={"author":"a@x.com", "to":"me", "subject":"Hello", "email_thread":"Body"}
+    other={"author":"b@x.com", "to":"me", "subject":"Other", "email_thread":"Body"}
+    log.record(email, "respond", "llm")
+    log.record(email, "ignore", "human")
+    log.record({**email, "email_thread":"Body  "}, "respond", "llm")
+    log.record(other, "notify", "llm")
+    log.record(other, "respond", "llm")
+
+    samples, labels=load_training_set(path)
+    assert sorted(zip([sample["author"] for sample in samples], labels))==[("a@x.com", "ignore"), ("b@x.com", "respond")]
+    with open(path, encoding="utf-8") as f:
+        assert {json.loads(line)["source"] for line in f}=={"llm", "human"}
+
+
+def test_triage_log_is_off_without_a_path():
+    TriageLog(None).record({"author":"a@x.com"}, "ignore", "llm")
+
+
+def test_train_writes_a_model_and_reports_holdout_metrics(tmp_path, monkeypatch):
+    log_path=str(tmp_path/"triage_log.jsonl")
+    out_path=str(tmp_path/"model.npz")
+    log=TriageLog(log_path)
+    samples, labels=_samples(count_per_class=3)
+    for sample, label in zip(samples, labels):
+        log.record(sample, label, "llm")
+
+    with pytest.raises(ValueError):
+        train(log_path, out_path)
+
+    monkeypatch.setattr(classifier, "TRIAGE_CLASSIFIER_MIN_SAMPLES", 5)
+    report=train(log_path, out_path, holdout=0.34, threshold=0.0, n_features=N_FEATURES, epochs=50)
+    assert report["samples"]==9 and report["holdout"]==3
+    assert 0.0<=report["holdout_accuracy"]<=1.0 and report["coverage_at_threshold"]==1.0
+    assert os.path.exists(out_path)
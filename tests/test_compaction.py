@@ -0,0 +1,92 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import compaction
+from compaction import compact_messages, estimate_tokens
+
+
+def _tokens(messages)->int:
+    return sum(estimate_tokens(compaction._content(message)) for message in messages)
+
+
+def _tool_call(call_id:str)->dict:
+    return {"name":"check_calendar_availability", "args":{"day":"Monday"}, "id":call_id}
+
+
+def _history(email_chars:int=4000, tool_chars:int=3000, tool_turns:int=3)->list:
+    messages=[HumanMessage(content="Respond to the email: "+"e"*email_chars)]
+    for turn in range(tool_turns):
+        messages.append(AIMessage(content="", tool_calls=[_tool_call(f"call_{turn}")]))
+        messages.append(ToolMessage(content=f"result {turn} "+"r"*tool_chars, tool_call_id=f"call_{turn}"))
+    return messages
+
+
+def test_history_within_budget_is_returned_unchanged():
+    messages=_history(email_chars=100, tool_chars=100)
+    compacted, saved=compact_messages(messages, budget=10_000)
+    assert compacted is messages
+    assert saved==0
+
+
+def test_compaction_fits_the_budget_and_reports_the_tokens_saved():
+    messages=_history()
+    budget=2500
+    compacted, saved=compact_messages(messages, budget=budget, reserved_tokens=200)
+    assert 200+_tokens(compacted)<=budget
+    assert saved==_tokens(messages)-_tokens(compacted)
+    # Nothing is dropped, so every tool call keeps its result.
+    assert [type(message) for message in compacted]==[type(message) for message in messages]
+    assert [getattr(message, "tool_call_id", None) for message in compacted]==[getattr(message, "tool_call_id", None) for message in messages]
+
+
+def test_older_tool_results_are_trimmed_before_anything_else(monkeypatch):
+    monkeypatch.setattr(compaction, "COMPACTION_KEEP_RECENT", 1)
+    messages=_history(tool_chars=3000)
+    # Trimming the two older tool results is enough to fit.
+    budget=_tokens(messages)-1000
+    compacted, _=compact_messages(messages, budget=budget)
+
+    assert compacted[0].content==messages[0].content
+    assert "characters trimmed" in compacted[2].content
+    assert "characters trimmed" in compacted[4].content
+    assert compacted[-1].content==messages[-1].content
+    assert compacted[2].content.startswith("result 0")
+
+
+def test_recent_messages_and_the_latest_user_message_are_never_trimmed(monkeypatch):
+    monkeypatch.setattr(compaction, "COMPACTION_KEEP_RECENT", 2)
+    messages=_history()+[HumanMessage(content="Please also mention Friday. "+"u"*5000)]
+    compacted, saved=compact_messages(messages, budget=100)
+
+    assert saved>0
+    assert compacted[-1].content==messages[-1].content
+    assert compacted[-2].content==messages[-2].content
+    assert "characters trimmed" in compacted[0].content
+    assert len(compacted)==len(messages)
+
+
+def test_dict_messages_are_compacted_too():
+    messages=[
+        {"role":"user", "content":"Respond to the email: "+"e"*8000},
+        {"role":"assistant", "content":"Checking."},
+        {"role":"user", "content":"Go ahead."},
+        {"role":"assistant", "content":"Done."},
+    ]
+    compacted, saved=compact_messages(messages, budget=1000)
+    assert saved>0
+    assert compacted[0]["role"]=="user"
+    assert "characters trimmed" in compacted[0]["content"]
+    assert compacted[1:]==messages[1:]
+
+
+def test_agent_messages_keep_the_system_prompt_and_latest_user_message(monkeypatch):
+    import nodes
+
+    monkeypatch.setattr(nodes, "compact_messages", lambda messages, reserved_tokens: compact_messages(messages, budget=500, reserved_tokens=reserved_tokens))
+    history=_history()+[HumanMessage(content="Make it shorter.")]
+
+    messages, saved=nodes._agent_messages({"messages":history})
+    assert saved>0
+    assert messages[0]["role"]=="system"
+    assert messages[0]["content"]
+    assert messages[-1].content=="Make it shorter."
+    assert len(messages)==len(history)+1
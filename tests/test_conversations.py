@@ -0,0 +1,69 @@
+from conversations import group_conversations, normalize_subject, participants, with_earlier_messages
+from utils import normalize_email_input
+
+
+def _email(author:str, to:str, subject:str, email_thread:str)->dict:
+    return {"author":author, "to":to, "subject":subject, "email_thread":email_thread}
+
+
+def test_normalize_subject_strips_reply_and_forward_prefixes():
+    for subject in ["Budget review", "Re: Budget review", "RE: re: Budget  review", "Fwd: Re: Budget review", "FW: Budget review", "Re[2]: Budget review", "AW: WG: budget REVIEW "]:
+        assert normalize_subject(subject)=="budget review"
+    assert normalize_subject("Regarding the budget")=="regarding the budget"
+    assert normalize_subject("")==""
+
+
+def test_participants_ignore_direction_and_display_names():
+    assert participants(_email("Ann <Ann@X.com>", "bob@x.com", "", ""))==participants(_email("Bob <bob@x.com>", "ann@x.com", "", ""))
+
+
+def test_group_conversations_groups_replies_and_forwards_by_subject_and_participants():
+    emails=[
+        _email("ann@x.com", "bob@x.com", "Budget review", "Can we meet?"),
+        _email("carol@x.com", "bob@x.com", "Budget review", "Same subject, different people."),
+        _email("bob@x.com", "Ann <ann@x.com>", "Re: Budget review", "Tuesday works."),
+        _email("ann@x.com", "bob@x.com", "", "No subject."),
+        _email("ann@x.com", "bob@x.com", "", "No subject either."),
+        _email("ann@x.com", "bob@x.com", "RE: Fwd: budget review", "See you then."),
+    ]
+    assert group_conversations(emails)==[[0, 2, 5], [1], [3], [4]]
+
+
+def test_the_newest_message_carries_the_earlier_ones_in_order():
+    emails=[
+        _email("ann@x.com", "bob@x.com", "Budget review", "Can we meet?"),
+        _email("bob@x.com", "ann@x.com", "Re: Budget review", "Tuesday works.\n\nOn Mon, Ann wrote:\n> Can we meet?"),
+        _email("ann@x.com", "bob@x.com", "Re: Budget review", "See you at 10."),
+    ]
+    group=group_conversations(emails)[0]
+    merged=with_earlier_messages(emails[group[-1]], [emails[index] for index in group[:-1]])
+
+    assert merged["author"]=="ann@x.com"
+    assert merged["subject"]=="Re: Budget review"
+    email_thread=merged["email_thread"]
+    assert email_thread.startswith("See you at 10.")
+    assert email_thread.index("Can we meet?")<email_thread.index("Tuesday works.")
+    assert "> Can we meet?" not in email_thread
+
+
+def test_merged_thread_is_not_cut_at_a_line_of_an_earlier_message():
+    earlier=[
+        _email("ann@x.com", "bob@x.com", "Servers", "DISCLAIMER: the numbers below are rough.\nWe need three servers."),
+        _email("ann@x.com", "bob@x.com", "Re: Servers", "--\nAnd a load balancer."),
+    ]
+    latest=_email("bob@x.com", "ann@x.com", "Re: Servers", "Ordering them today.\n\n-- \nBob")
+    merged=with_earlier_messages(latest, earlier)
+
+    normalized, removed=normalize_email_input(merged)
+    email_thread=normalized["email_thread"]
+    assert removed==0
+    assert email_thread.startswith("Ordering them today.")
+    assert "Bob" not in email_thread
+    assert "We need three servers." in email_thread
+    assert email_thread.endswith("And a load balancer.")
+
+
+def test_without_earlier_messages_the_email_is_unchanged():
+    latest=_email("bob@x.com", "ann@x.com", "Servers", "Ordering them today.\n\n-- \nBob")
+    assert with_earlier_messages(latest, [])==latest
+    assert normalize_email_input(latest)[0]["email_thread"]=="Ordering them today."
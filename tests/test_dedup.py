@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+import dedup
+from dedup import BANDS, NearDuplicateIndex, cluster_near_duplicates, simhash
+from schemas import RouterSchema
+
+
+BODY="Hi {name},\n\nThis week's product digest: our new dashboard ships Thursday with faster exports, the mobile app gets offline mode, and pricing for team plans stays the same. Read more at https://ex.com/t/{name}?u={n}\n\nCheers, the team. Manage preferences: {name}@mail.com"
+OTHER="Hi team, the build server will be down for maintenance Saturday from 9 to 11, please push your branches before Friday evening and ping me with questions."
+NOTIFY=RouterSchema(reasoning="r", classification="notify")
+
+
+def _distance(a:int, b:int)->int:
+    return (a^b).bit_count()
+
+
+def test_simhash_is_stable_and_ignores_links_addresses_and_numbers():
+    first=simhash("Digest #1", BODY.format(name="ann", n=1))
+    assert first==simhash("Digest #1", BODY.format(name="ann", n=1))
+    assert first==simhash("Digest #2", BODY.format(name="ann", n=99))
+    assert 0<=first<2**64
+
+
+def test_simhash_is_none_for_short_texts():
+    assert simhash("Hi", "see you at noon") is None
+
+
+def test_simhash_separates_personalised_copies_from_unrelated_mail():
+    ann=simhash("Digest", BODY.format(name="ann", n=1))
+    bob=simhash("Digest", BODY.format(name="bob", n=2))
+    assert _distance(ann, bob)<=dedup.DEDUP_MAX_DISTANCE
+    assert _distance(ann, simhash("Update", OTHER))>3*dedup.DEDUP_MAX_DISTANCE
+
+
+def test_index_requires_the_same_scope_and_sender_domain():
+    index=NearDuplicateIndex(window_seconds=60)
+    index.put("prompt", "news@vendor.com", "Digest", BODY.format(name="ann", n=1), NOTIFY)
+
+    assert index.get("prompt", "other@vendor.com", "Digest", BODY.format(name="bob", n=2))==NOTIFY
+    assert index.get("prompt", "news@elsewhere.com", "Digest", BODY.format(name="bob", n=2)) is None
+    assert index.get("new prompt", "news@vendor.com", "Digest", BODY.format(name="bob", n=2)) is None
+    assert index.get("prompt", "news@vendor.com", "Update", OTHER) is None
+    assert index.stats()=={"size":1, "hits":1, "misses":3}
+
+
+def test_index_finds_every_signature_within_max_distance():
+    # Two signatures within distance BANDS-1 always share a band, so the
+    # bucketed lookup must agree with a brute-force scan.
+    index=NearDuplicateIndex(window_seconds=60, max_distance=BANDS-1)
+    base=simhash("Digest", BODY.format(name="ann", n=1))
+    entry=dedup._Entry(base, None, "", NOTIFY, time.monotonic())
+    index._entries.append(entry)
+    for band in dedup._bands(base):
+        index._buckets.setdefault(band, []).append(entry)
+
+    for bits in ((0,), (0, 9, 18), tuple(range(0, 64, 9))):
+        probe=base
+        for bit in bits:
+            probe^=1<<bit
+        assert (index._nearest(probe, None, "") is entry)==(len(bits)<BANDS)
+
+
+def test_index_rejects_a_max_distance_the_bands_cannot_guarantee():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(max_distance=BANDS)
+
+
+def test_index_expires_by_age_and_size(monkeypatch):
+    now=[1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+    index=NearDuplicateIndex(window_seconds=10, max_entries=2)
+    for i, name in enumerate(("ann", "bob", "cy")):
+        index.put(i, "news@vendor.com", "Digest", BODY.format(name=name, n=i), NOTIFY)
+    assert len(index)==2
+    assert index.get(0, "news@vendor.com", "Digest", BODY.format(name="dee", n=9)) is None
+
+    now[0]+=11
+    assert index.get(2, "news@vendor.com", "Digest", BODY.format(name="dee", n=9)) is None
+    assert len(index)==0 and index._buckets=={}
+
+
+def test_cluster_near_duplicates_labels_each_email_with_its_first_copy():
+    emails=[{"author":"news@vendor.com", "subject":"Digest", "email_thread":BODY.format(name=name, n=i)} for i, name in enumerate(("ann", "bob", "cy"))]
+    emails.insert(1, {"author":"boss@company.com", "subject":"Update", "email_thread":OTHER})
+    emails.append({"author":"x@y.com", "subject":"Hi", "email_thread":"too short"})
+    assert cluster_near_duplicates(emails)==[0, 1, 0, 0, 4]
@@ -0,0 +1,147 @@
+import json
+import os
+
+import pytest
+
+from ingest import Cursor, ingest, iter_maildir, iter_mbox, to_email_input
+
+
+def _message(i:int, subject:str=None, author:str=None, body:str=None)->str:
+    return (
+        f"From: {author or f'sender{i}@x.com'}\n"
+        f"To: me@y.com\n"
+        f"Subject: {subject or f'Message {i}'}\n"
+        f"Message-ID: <{i}@x.com>\n"
+        f"\n"
+        f"{body or f'Body of message {i}'}\n"
+    )
+
+
+def _write_mbox(path, messages:list)->None:
+    with open(path, "w", encoding="utf-8") as f:
+        for message in messages:
+            f.write("From sender@x.com Mon Oct 19 10:00:00 2026\n"+message+"\n")
+
+
+def _write_maildir(path, messages:list)->None:
+    for sub in ("cur", "new", "tmp"):
+        os.makedirs(path/sub)
+    for i, message in enumerate(messages):
+        (path/("cur" if i%2 else "new")/f"{1700000000+i}.M{i}.host").write_text(message, encoding="utf-8")
+
+
+def _triage(email_input:dict)->dict:
+    return {"classification":"notify", "reasoning":email_input["subject"]}
+
+
+def _records(path)->list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_iter_mbox_splits_messages_and_unescapes_from_lines(tmp_path):
+    path=tmp_path/"box.mbox"
+    _write_mbox(path, [_message(0, body="First\n>From the start"), _message(1)])
+    messages=list(iter_mbox(str(path)))
+    assert len(messages)==2
+    assert messages[0][1]==messages[1][0]
+    assert b"\nFrom the start" in messages[0][2]
+    assert to_email_input(messages[1][2])==("<1@x.com>", {"author":"sender1@x.com", "to":"me@y.com", "subject":"Message 1", "email_thread":"Body of message 1\n\n"})
+
+    # Resuming from a message's offset yields it and what follows.
+    assert [offset for offset, _, _ in iter_mbox(str(path), messages[1][0])]==[messages[1][0]]
+
+
+def test_to_email_input_prefers_plain_text_and_strips_html():
+    raw=(
+        "From: a@x.com\nTo: me@y.com\nSubject: Hi\nMIME-Version: 1.0\nContent-Type: text/html; charset=utf-8\n\n"
+        "<html><style>p {}</style><p>Hello &amp; welcome</p></html>\n"
+    ).encode("utf-8")
+    _, email_input=to_email_input(raw)
+    assert email_input["email_thread"].split()==["Hello", "&", "welcome"]
+
+
+@pytest.mark.parametrize("kind", ["mbox", "maildir"])
+def test_resumes_where_the_previous_run_stopped(tmp_path, kind):
+    source=tmp_path/"source"
+    messages=[_message(i) for i in range(25)]
+    if kind=="mbox":
+        _write_mbox(source, messages)
+    else:
+        _write_maildir(source, messages)
+    out=str(tmp_path/"out.jsonl")
+
+    first=ingest(str(source), out, workers=2, limit=10, cursor_every=3, triage=_triage, group_conversations=False)
+    assert first["processed"]==10
+    second=ingest(str(source), out, workers=2, cursor_every=3, triage=_triage, group_conversations=False)
+    assert second["processed"]==15 and second["total_processed"]==25
+    assert ingest(str(source), out, workers=2, triage=_triage, group_conversations=False)["processed"]==0
+
+    assert [record["subject"] for record in _records(out)]==[f"Message {i}" for i in range(25)]
+
+
+def test_resume_drops_records_written_after_the_last_cursor_save(tmp_path):
+    source=tmp_path/"box.mbox"
+    _write_mbox(source, [_message(i) for i in range(6)])
+    out=tmp_path/"out.jsonl"
+
+    ingest(str(source), str(out), workers=1, limit=3, triage=_triage, group_conversations=False)
+    # A run killed before its next cursor save leaves extra records behind.
+    with open(out, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"subject":"Message 3"})+"\n"+'{"subject": "Mess')
+
+    ingest(str(source), str(out), workers=1, triage=_triage, group_conversations=False)
+    assert [record["subject"] for record in _records(out)]==[f"Message {i}" for i in range(6)]
+
+
+def test_a_failed_triage_is_recorded_and_the_run_continues(tmp_path):
+    source=tmp_path/"box.mbox"
+    _write_mbox(source, [_message(i) for i in range(4)])
+    out=tmp_path/"out.jsonl"
+
+    def triage(email_input):
+        if email_input["subject"]=="Message 2":
+            raise RuntimeError("provider down")
+        return _triage(email_input)
+
+    summary=ingest(str(source), str(out), workers=2, triage=triage, group_conversations=False)
+    assert summary["errors"]==1
+    assert [record.get("error") for record in _records(out)]==[None, None, "provider down", None]
+
+
+def test_cursor_refuses_another_source(tmp_path):
+    cursor=Cursor(str(tmp_path/"out.cursor"), str(tmp_path/"a.mbox"))
+    cursor.position=42
+    cursor.save()
+    assert Cursor(cursor.path, str(tmp_path/"a.mbox")).load().position==42
+    with pytest.raises(ValueError):
+        Cursor(cursor.path, str(tmp_path/"b.mbox")).load()
+
+
+def test_conversation_members_in_a_chunk_are_triaged_once(tmp_path):
+    source=tmp_path/"box.mbox"
+    _write_mbox(source, [
+        _message(0, subject="Budget", author="a@x.com"),
+        _message(1, subject="Other"),
+        _message(2, subject="Re: Budget", author="a@x.com"),
+    ])
+    out=tmp_path/"out.jsonl"
+    seen=[]
+
+    def triage(email_input):
+        seen.append(email_input["subject"])
+        return _triage(email_input)
+
+    ingest(str(source), str(out), workers=2, triage=triage)
+    records=_records(out)
+    assert sorted(seen)==["Other", "Re: Budget"]
+    assert records[0]["superseded_by"]==records[2]["position"]
+    assert records[0]["reasoning"]=="Re: Budget"
+    assert "superseded_by" not in records[2]
+
+
+def test_iter_maildir_resumes_after_a_name(tmp_path):
+    _write_maildir(tmp_path/"md", [_message(i) for i in range(4)])
+    names=[name for name, _, _ in iter_maildir(str(tmp_path/"md"))]
+    assert names==sorted(names) and len(names)==4
+    assert [name for name, _, _ in iter_maildir(str(tmp_path/"md"), names[1])]==names[2:]
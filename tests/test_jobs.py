@@ -0,0 +1,148 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import jobs
+import main
+from jobs import JobQueue, QueueFull
+
+
+CLASSIFICATIONS={"First": "respond", "Reply needed": "respond", "FYI": "notify"}
+
+
+def _email(subject:str, author:str="Eve <eve@other.com>")->dict:
+    return {"author":author, "to":"bob@x.com", "subject":subject, "email_thread":f"About: {subject}"}
+
+
+class Stages:
+    """Triage and process functions that record the order they ran in."""
+
+    def __init__(self, process_delay:float=0.0):
+        self.events=[]
+        self.gate=asyncio.Event()
+        self.process_delay=process_delay
+
+    async def triage(self, email_input:dict)->dict:
+        self.events.append(("triage", email_input["subject"]))
+        if email_input["subject"]=="First":
+            await self.gate.wait()
+        return {"classification":CLASSIFICATIONS.get(email_input["subject"], "respond"), "reasoning":"scripted"}
+
+    async def process(self, email_input:dict, triage_decision)->dict:
+        self.events.append(("process", email_input["subject"], triage_decision and triage_decision["classification"]))
+        await asyncio.sleep(self.process_delay)
+        if email_input["subject"]=="Broken":
+            raise RuntimeError("graph failed")
+        classification=triage_decision["classification"] if triage_decision else "ignore"
+        return {"classification":classification, "response":"", "reasoning":"", "compaction_tokens_saved":0, "thread_chars_removed":0}
+
+
+def test_jobs_run_by_priority_across_triage_and_process_stages():
+    async def run():
+        stages=Stages()
+        queue=JobQueue(stages.triage, stages.process, workers=1)
+        first=queue.submit(_email("First"))
+        await asyncio.sleep(0)
+        # The only worker is busy triaging "First"; these queue up behind it.
+        fyi=queue.submit(_email("FYI"))
+        colleague=queue.submit(_email("Reply needed", author="Carol <carol@x.com>"))
+        newsletter=queue.submit(_email("Big sale", author="newsletter@shop.com"))
+        assert (fyi.priority, colleague.priority)==(jobs.PRIORITY_TRIAGE, jobs.PRIORITY_TRIAGE_SENDER)
+        assert (newsletter.stage, newsletter.classification, newsletter.priority)==(jobs.PROCESS, "ignore", jobs.PRIORITY_IGNORE)
+
+        stages.gate.set()
+        await queue.stop(timeout=5)
+        return stages.events, [first, fyi, colleague, newsletter]
+
+    events, submitted=asyncio.run(run())
+    assert events==[
+        ("triage", "First"),
+        ("process", "First", "respond"),
+        ("triage", "Reply needed"),
+        ("process", "Reply needed", "respond"),
+        ("triage", "FYI"),
+        ("process", "FYI", "notify"),
+        # Matched a pre-triage rule, so it skipped the triage stage.
+        ("process", "Big sale", None),
+    ]
+    assert [job.status for job in submitted]==["completed"]*4
+    assert [job.classification for job in submitted]==["respond", "notify", "respond", "ignore"]
+
+
+def test_a_failing_job_is_recorded_and_the_rest_still_run():
+    async def run():
+        stages=Stages()
+        stages.gate.set()
+        queue=JobQueue(stages.triage, stages.process, workers=2)
+        broken=queue.submit(_email("Broken"))
+        fine=queue.submit(_email("FYI"))
+        await queue.stop(timeout=5)
+        return queue, broken, fine
+
+    queue, broken, fine=asyncio.run(run())
+    assert (broken.status, broken.error)==("failed", "graph failed")
+    assert fine.status=="completed"
+    assert queue.stats()=={"queued":0, "pending":0, "completed":1, "failed":1, "rejected":0}
+    assert broken.email_input is None and broken.triage is None
+
+
+def test_submit_raises_queue_full_past_max_pending():
+    async def run():
+        stages=Stages()
+        queue=JobQueue(stages.triage, stages.process, workers=1, max_pending=2)
+        queue.submit(_email("First"))
+        queue.submit(_email("FYI"))
+        try:
+            queue.submit(_email("One too many"))
+        except QueueFull:
+            rejected=True
+        else:
+            rejected=False
+        stages.gate.set()
+        await queue.stop(timeout=5)
+        return rejected, queue.stats()
+
+    rejected, stats=asyncio.run(run())
+    assert rejected
+    assert stats["rejected"]==1
+    assert stats["completed"]==2
+
+
+def test_full_queue_returns_503_with_retry_after(monkeypatch):
+    async def never(*args):
+        raise AssertionError("nothing should run")
+
+    monkeypatch.setattr(main, "job_queue", JobQueue(never, never, workers=1, max_pending=0))
+    response=TestClient(main.app).post("/jobs", json={"email":_email("FYI")})
+    assert response.status_code==503
+    assert response.headers["Retry-After"]==str(jobs.JOBS_RETRY_AFTER_SECONDS)
+
+
+def test_stop_drains_queued_jobs_before_stopping_the_workers():
+    async def run():
+        stages=Stages(process_delay=0.01)
+        stages.gate.set()
+        queue=JobQueue(stages.triage, stages.process, workers=2)
+        submitted=[queue.submit(_email(f"Email {index}")) for index in range(6)]
+        await queue.stop(timeout=5)
+        return queue, submitted
+
+    queue, submitted=asyncio.run(run())
+    assert [job.status for job in submitted]==["completed"]*6
+    assert queue.pending()==0
+    assert queue.depth()==0
+
+
+def test_stop_fails_what_is_left_at_the_timeout():
+    async def run():
+        stages=Stages()
+        queue=JobQueue(stages.triage, stages.process, workers=1)
+        running=queue.submit(_email("First"))
+        waiting=queue.submit(_email("FYI"))
+        await queue.stop(timeout=0.05)
+        return queue, running, waiting
+
+    queue, running, waiting=asyncio.run(run())
+    assert (running.status, running.error)==("failed", "Service shut down while the job was running")
+    assert (waiting.status, waiting.error)==("failed", "Service shut down before the job ran")
+    assert queue.pending()==0
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from memory_worker import MemoryUpdateWorker
+
+
+class Recorder:
+    """update_fn that records its calls; the first call blocks until `release` is set."""
+
+    def __init__(self, delay:float=0.0):
+        self.calls=[]
+        self.delay=delay
+        self.started=threading.Event()
+        self.release=threading.Event()
+
+    def __call__(self, store, namespace, messages):
+        self.started.set()
+        self.release.wait(5)
+        time.sleep(self.delay)
+        self.calls.append((store, namespace, messages))
+
+
+def test_updates_coalesce_per_store_and_namespace():
+    update=Recorder()
+    worker=MemoryUpdateWorker(update)
+    store, other_store=object(), object()
+
+    worker.submit(store, ("prefs", "triage"), ["first"])
+    assert update.started.wait(5)
+    # The worker is busy with the first event; these queue up behind it.
+    worker.submit(store, ("prefs", "triage"), ["a"])
+    worker.submit(store, ["prefs", "triage"], ["b"])
+    worker.submit(store, ("prefs", "calendar"), ["c"])
+    worker.submit(other_store, ("prefs", "triage"), ["d"])
+    assert worker.depth()==4
+    update.release.set()
+
+    assert worker.flush(timeout=5)
+    assert update.calls==[
+        (store, ("prefs", "triage"), ["first"]),
+        (store, ("prefs", "triage"), ["a", "b"]),
+        (store, ("prefs", "calendar"), ["c"]),
+        (other_store, ("prefs", "triage"), ["d"]),
+    ]
+    assert (worker.processed, worker.coalesced, worker.failed)==(5, 1, 0)
+    worker.stop(timeout=5)
+
+
+def test_flush_waits_for_the_running_update():
+    update=Recorder(delay=0.05)
+    update.release.set()
+    worker=MemoryUpdateWorker(update)
+    worker.submit(object(), ("prefs",), ["a"])
+    assert update.started.wait(5)
+
+    assert worker.flush(timeout=5)
+    assert len(update.calls)==1
+    worker.stop(timeout=5)
+
+
+def test_flush_gives_up_at_the_timeout():
+    update=Recorder()
+    worker=MemoryUpdateWorker(update)
+    worker.submit(object(), ("prefs",), ["a"])
+    assert update.started.wait(5)
+
+    assert not worker.flush(timeout=0.05)
+    update.release.set()
+    worker.stop(timeout=5)
+
+
+def test_stop_applies_pending_updates_first():
+    update=Recorder(delay=0.01)
+    worker=MemoryUpdateWorker(update)
+    store=object()
+    worker.submit(store, ("prefs", "a"), ["1"])
+    assert update.started.wait(5)
+    worker.submit(store, ("prefs", "b"), ["2"])
+    worker.submit(store, ("prefs", "c"), ["3"])
+    update.release.set()
+
+    worker.stop(timeout=5)
+    assert [namespace for _, namespace, _ in update.calls]==[("prefs", "a"), ("prefs", "b"), ("prefs", "c")]
+    assert worker.depth()==0
+
+    # A stopped worker starts again on the next submit.
+    worker.submit(store, ("prefs", "d"), ["4"])
+    assert worker.flush(timeout=5)
+    assert update.calls[-1][1]==("prefs", "d")
+    worker.stop(timeout=5)
+
+
+def test_a_failed_update_is_counted_and_the_worker_keeps_going():
+    calls=[]
+
+    def update(store, namespace, messages):
+        calls.append(namespace)
+        if namespace==("bad",):
+            raise RuntimeError("memory model failed")
+
+    worker=MemoryUpdateWorker(update)
+    worker.submit(object(), ("bad",), ["x"])
+    worker.submit(object(), ("good",), ["y"])
+    assert worker.flush(timeout=5)
+    assert calls==[("bad",), ("good",)]
+    assert (worker.processed, worker.failed)==(1, 1)
+    worker.stop(timeout=5)
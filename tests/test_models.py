@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import models
+from models import ConcurrencyLimiter, LimitedModel
+from ratelimit import LLMRateLimitError, RateLimits
+
+
+def _rate_limited()->httpx.HTTPStatusError:
+    request=httpx.Request("POST", "https://llm.example/v1/chat/completions")
+    return httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, request=request))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(models, "backoff", lambda attempt, requested=None: 0.0)
+
+
+class Scripted:
+    """Runnable that raises or returns the next scripted outcome and tracks concurrency."""
+
+    def __init__(self, outcomes=(), delay:float=0.0):
+        self.outcomes=list(outcomes)
+        self.delay=delay
+        self.calls=0
+        self.current=0
+        self.peak=0
+        self._lock=threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            self.calls+=1
+            outcome=self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _enter(self):
+        with self._lock:
+            self.current+=1
+            self.peak=max(self.peak, self.current)
+
+    def _exit(self):
+        with self._lock:
+            self.current-=1
+
+    def invoke(self, input, config=None, **kwargs):
+        self._enter()
+        try:
+            time.sleep(self.delay)
+            return self._next()
+        finally:
+            self._exit()
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self._enter()
+        try:
+            await asyncio.sleep(self.delay)
+            return self._next()
+        finally:
+            self._exit()
+
+    async def astream(self, input, config=None, **kwargs):
+        outcome=self._next()
+        for chunk in outcome:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def test_limiter_caps_threads_and_coroutines():
+    runnable=Scripted(delay=0.02)
+    model=LimitedModel(runnable, ConcurrencyLimiter(3))
+
+    threads=[threading.Thread(target=model.invoke, args=("x",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    async def run():
+        await asyncio.gather(*(model.ainvoke("x") for _ in range(8)))
+
+    asyncio.run(run())
+    for thread in threads:
+        thread.join()
+    assert runnable.peak<=3 and runnable.calls==16
+    assert model.limiter.in_flight==0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        limiter=ConcurrencyLimiter(1)
+        await limiter.aacquire()
+        waiter=asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        assert limiter.in_flight==0 and not limiter._async_waiters
+
+    asyncio.run(run())
+
+
+def test_waiter_cancelled_after_its_grant_gives_the_slot_back():
+    async def run():
+        limiter=ConcurrencyLimiter(1)
+        await limiter.aacquire()
+        waiter=asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        # _grant runs and resolves the waiter's future before the task resumes.
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.in_flight==0
+
+    asyncio.run(run())
+
+
+def test_overload_cuts_from_the_calls_in_flight_once_per_window():
+    limiter=ConcurrencyLimiter(16)
+    started=time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+
+    limiter.on_overload(started)
+    assert limiter.limit==3
+    # Calls that were already running at the cut are the same overload.
+    limiter.on_overload(started)
+    assert limiter.limit==3
+
+    limiter.on_overload(time.monotonic())
+    assert limiter.limit==1
+    limiter.on_overload(time.monotonic())
+    assert limiter.limit==limiter.min_limit==1
+
+
+def test_success_grows_the_limit_additively_up_to_max():
+    limiter=ConcurrencyLimiter(2, max_limit=4)
+    now=time.monotonic()
+    for _ in range(2):
+        limiter.on_success(now)
+    assert limiter.limit==2
+    limiter.on_success(now)
+    assert limiter.limit==3
+    for _ in range(50):
+        limiter.on_success(now)
+    assert limiter.limit==4
+
+
+def test_slow_calls_count_as_overload():
+    limiter=ConcurrencyLimiter(8, latency_target=1.0)
+    limiter.on_success(time.monotonic()-0.5)
+    assert limiter.limit==8
+    limiter.on_success(time.monotonic()-2)
+    assert limiter.limit==1
+
+
+def test_retries_rate_limits_and_refunds_the_failed_attempts():
+    limits=RateLimits(rpm=0, tpm=1000)
+    runnable=Scripted([_rate_limited(), _rate_limited()])
+    model=LimitedModel(runnable, ConcurrencyLimiter(4), limits, max_retries=5)
+
+    assert model.invoke("x"*40)=="ok"
+    assert runnable.calls==3
+    # Only the successful attempt's estimate is still reserved.
+    assert limits.tokens.reserve(0)==0.0
+    assert limits.tokens._tokens==pytest.approx(1000-models.estimate_input_tokens("x"*40)-models.LLM_OUTPUT_TOKENS_ESTIMATE, abs=1)
+
+
+def test_gives_up_with_llm_rate_limit_error():
+    runnable=Scripted([_rate_limited()]*3)
+    model=LimitedModel(runnable, ConcurrencyLimiter(4), max_retries=2)
+
+    async def run():
+        with pytest.raises(LLMRateLimitError):
+            await model.ainvoke("x")
+
+    asyncio.run(run())
+    assert runnable.calls==3
+    assert model.limiter.in_flight==0
+
+
+def test_non_retryable_errors_are_raised_at_once_with_tokens_refunded():
+    limits=RateLimits(rpm=0, tpm=1000)
+    runnable=Scripted([ValueError("bad request")])
+    model=LimitedModel(runnable, ConcurrencyLimiter(4), limits)
+
+    with pytest.raises(ValueError):
+        model.invoke("x")
+    assert runnable.calls==1
+    assert limits.tokens._tokens==pytest.approx(1000, abs=1)
+
+
+def test_settle_errors_are_not_retried(monkeypatch):
+    runnable=Scripted()
+    model=LimitedModel(runnable, ConcurrencyLimiter(4))
+
+    def broken_settle(*args):
+        raise httpx.ConnectError("settle failed")
+
+    monkeypatch.setattr(model, "_settle", broken_settle)
+    with pytest.raises(httpx.ConnectError):
+        model.invoke("x")
+    assert runnable.calls==1
+
+
+def test_astream_retries_only_before_the_first_chunk():
+    async def collect(model):
+        return [chunk async for chunk in model.astream("x")]
+
+    runnable=Scripted([_rate_limited(), ["a", "b"]])
+    assert asyncio.run(collect(LimitedModel(runnable, ConcurrencyLimiter(2))))==["a", "b"]
+    assert runnable.calls==2
+
+    runnable=Scripted([["a", _rate_limited()]])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(collect(LimitedModel(runnable, ConcurrencyLimiter(2))))
+    assert runnable.calls==1
+
+
+def test_registry_close_rebuilds_models_and_clients():
+    registry=models.ModelRegistry()
+    first=registry.get("openai:gpt-4o-mini")
+    closed=registry._http_async_client
+    asyncio.run(registry.aclose())
+    assert closed.is_closed
+
+    second=registry.get("openai:gpt-4o-mini")
+    assert second is not first
+    assert not registry._http_async_client.is_closed
+    asyncio.run(registry.aclose())
+
+
+def test_agent_models_follow_the_registry_across_close():
+    from nodes import models as agent_models
+
+    router, llm=agent_models.router, agent_models.llm
+    assert agent_models.router is router
+    asyncio.run(models.registry.aclose())
+    assert agent_models.llm is not llm
+    assert agent_models.router is not router
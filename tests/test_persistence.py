@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.store.base import GetOp
+from langgraph.store.memory import InMemoryStore
+
+import persistence
+from persistence import CachedStore, SqliteCheckpointer, amark_thread_completed
+
+
+class CountingStore(InMemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.reads=0
+
+    def batch(self, ops):
+        ops=list(ops)
+        self.reads+=sum(isinstance(op, GetOp) for op in ops)
+        return super().batch(ops)
+
+
+def test_cached_store_serves_repeat_reads_without_the_backend():
+    backend=CountingStore()
+    store=CachedStore(backend)
+    store.put(("prefs",), "triage", {"rules":"v1"})
+
+    assert store.get(("prefs",), "triage").value=={"rules":"v1"}
+    assert store.get(("prefs",), "triage").value=={"rules":"v1"}
+    assert store.get(("prefs",), "missing") is None
+    assert store.get(("prefs",), "missing") is None
+    assert backend.reads==2
+
+
+def test_cached_store_write_bumps_the_namespace_version():
+    backend=CountingStore()
+    store=CachedStore(backend)
+    store.put(("prefs",), "triage", {"rules":"v1"})
+    store.get(("prefs",), "triage")
+    before=store.version(("prefs",))
+
+    store.put(("prefs",), "triage", {"rules":"v2"})
+    assert store.version(("prefs",))>before
+    assert store.get(("prefs",), "triage").value=={"rules":"v2"}
+    assert backend.reads==2
+
+
+def test_cached_store_data_version_change_invalidates_every_namespace():
+    backend=CountingStore()
+    data_version=[1]
+    store=CachedStore(backend, lambda: data_version[0])
+    store.put(("prefs", "a"), "k", {"v":1})
+    store.get(("prefs", "a"), "k")
+    store.get(("prefs", "b"), "k")
+    versions=store.version(("prefs", "a")), store.version(("prefs", "b"))
+
+    # Another process writes straight to the backend and bumps the data version.
+    backend.put(("prefs", "b"), "k", {"v":2})
+    data_version[0]=2
+    assert store.get(("prefs", "b"), "k").value=={"v":2}
+    assert store.version(("prefs", "a"))>versions[0]
+    assert store.version(("prefs", "b"))>versions[1]
+    assert backend.reads==3
+
+
+def test_sqlite_preference_store_sees_writes_from_another_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "PREFERENCE_STORE_DB", str(tmp_path/"preferences.db"))
+    ours=persistence.build_preference_store()
+    theirs=persistence.build_preference_store()
+
+    ours.put(("prefs",), "triage", {"rules":"v1"})
+    assert theirs.get(("prefs",), "triage").value=={"rules":"v1"}
+    assert ours.get(("prefs",), "triage").value=={"rules":"v1"}
+
+    theirs.put(("prefs",), "triage", {"rules":"v2"})
+    assert ours.get(("prefs",), "triage").value=={"rules":"v2"}
+
+    theirs.delete(("prefs",), "triage")
+    assert ours.get(("prefs",), "triage") is None
+
+
+def _config(thread_id:str)->dict:
+    return {"configurable":{"thread_id":thread_id, "checkpoint_ns":""}}
+
+
+def _completed(checkpointer:SqliteCheckpointer, thread_id:str)->int:
+    with checkpointer.cursor(transaction=False) as cur:
+        cur.execute("SELECT completed FROM thread_activity WHERE thread_id=?", (thread_id,))
+        return cur.fetchone()[0]
+
+
+def test_mark_thread_completed_runs_off_the_event_loop(tmp_path, monkeypatch):
+    checkpointer=SqliteCheckpointer(str(tmp_path/"checkpoints.db"))
+    threads=[]
+    mark_completed=checkpointer.mark_completed
+
+    def tracked(thread_id:str)->None:
+        threads.append(threading.get_ident())
+        mark_completed(thread_id)
+
+    monkeypatch.setattr(checkpointer, "mark_completed", tracked)
+
+    async def run():
+        await checkpointer.aput(_config("t1"), empty_checkpoint(), {}, {})
+        assert _completed(checkpointer, "t1")==0
+        await amark_thread_completed(checkpointer, "t1")
+        return threading.get_ident()
+
+    loop_thread=asyncio.run(run())
+    assert threads and threads[0]!=loop_thread
+    assert _completed(checkpointer, "t1")==1
@@ -0,0 +1,107 @@
+import httpx
+import pytest
+
+import ratelimit
+from ratelimit import RateLimits, TokenBucket, backoff, estimate_input_tokens, is_rate_limit, is_retryable, retry_after, usage_tokens
+
+
+class Clock:
+    def __init__(self, now:float=1000.0):
+        self.now=now
+
+    def __call__(self)->float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def _status_error(status:int, headers:dict=None)->httpx.HTTPStatusError:
+    request=httpx.Request("POST", "https://llm.example/v1/chat/completions")
+    response=httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+def test_token_bucket_reserves_ahead_and_reports_the_wait(clock):
+    bucket=TokenBucket(per_minute=60)
+    assert bucket.reserve(60)==0.0
+    assert bucket.reserve(1)==pytest.approx(1.0)
+    # Later reservations queue behind earlier ones.
+    assert bucket.reserve(2)==pytest.approx(3.0)
+
+    clock.now+=3
+    assert bucket.reserve(1)==pytest.approx(1.0)
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket=TokenBucket(per_minute=60, capacity=10)
+    bucket.reserve(10)
+    clock.now+=3600
+    assert bucket.reserve(10)==0.0
+    assert bucket.reserve(1)==pytest.approx(1.0)
+
+
+def test_token_bucket_adjust_takes_and_gives_back(clock):
+    bucket=TokenBucket(per_minute=60)
+    bucket.reserve(60)
+    bucket.adjust(-30)
+    assert bucket.reserve(30)==0.0
+    bucket.adjust(-1000)
+    assert bucket.reserve(60)==0.0
+    bucket.adjust(6)
+    assert bucket.reserve(0)==pytest.approx(6.0)
+
+
+def test_rate_limits_wait_for_the_tighter_budget_and_reconcile(clock):
+    limits=RateLimits(rpm=60, tpm=600)
+    assert limits.reserve(600)==0.0
+    assert limits.reserve(60)==pytest.approx(6.0)
+    # A failed attempt used none of its tokens.
+    limits.reconcile(60, 0)
+    assert limits.reserve(0)==0.0
+    limits.reconcile(0, 120)
+    assert limits.reserve(0)==pytest.approx(12.0)
+
+    assert RateLimits(rpm=0, tpm=0).reserve(10**9)==0.0
+
+
+def test_error_classification():
+    assert is_rate_limit(_status_error(429))
+    assert is_retryable(_status_error(429)) and is_retryable(_status_error(503))
+    assert not is_retryable(_status_error(400))
+    assert is_retryable(httpx.ConnectTimeout("timeout"))
+    assert not is_retryable(ValueError("bad"))
+
+    class APIConnectionError(Exception):
+        pass
+
+    assert is_retryable(APIConnectionError())
+
+
+def test_retry_after_reads_both_headers():
+    assert retry_after(_status_error(429, {"retry-after-ms":"250"}))==0.25
+    assert retry_after(_status_error(429, {"retry-after":"2"}))==2.0
+    assert retry_after(_status_error(429, {"retry-after":"Wed, 21 Oct 2026 07:28:00 GMT"})) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_backoff_is_jittered_capped_and_honours_the_server():
+    for attempt in range(10):
+        assert 0<=backoff(attempt, base=0.5, cap=4)<=min(4, 0.5*2**attempt)
+    assert 2.0<=backoff(0, requested=2.0, base=0.5)<=2.5
+    assert backoff(0, requested=100, base=0.5, cap=30)==30
+
+
+def test_token_estimates():
+    assert estimate_input_tokens("x"*40)==estimate_input_tokens([{"content":"x"*40}])
+    assert estimate_input_tokens("")==0
+
+    class Result:
+        usage_metadata={"input_tokens":10, "output_tokens":5}
+
+    assert usage_tokens(Result())==15
+    assert usage_tokens(object()) is None
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import agent
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run_and_its_result():
+    flights=SingleFlight()
+    runs=[]
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer":42}
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", compute) for _ in range(5)))
+
+    results=asyncio.run(run())
+    assert len(runs)==1
+    assert all(result is results[0] for result in results)
+    assert (flights.leaders, flights.shared)==(1, 4)
+    assert flights.in_flight()==0
+
+
+def test_an_exception_reaches_every_waiter_and_releases_the_key():
+    flights=SingleFlight()
+    runs=[]
+
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def succeeding():
+        runs.append(1)
+        return "ok"
+
+    async def run():
+        results=await asyncio.gather(*(flights.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert flights.in_flight()==0
+        return results, await flights.do("key", succeeding)
+
+    results, retried=asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried=="ok"
+    assert len(runs)==2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    flights=SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first=asyncio.ensure_future(flights.do("key", compute))
+        second=asyncio.ensure_future(flights.do("key", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run())=="done"
+
+
+@pytest.fixture
+def fake_process(monkeypatch):
+    monkeypatch.setattr(agent, "process_flights", SingleFlight())
+    calls=[]
+
+    async def aprocess_email(email_input:dict, triage_decision=None)->dict:
+        calls.append(email_input["to"])
+        await asyncio.sleep(0.01)
+        return {"classification":"respond", "response":f"Reply for {email_input['to']}"}
+
+    monkeypatch.setattr(agent, "aprocess_email", aprocess_email)
+    return calls
+
+
+def _email(to:str)->dict:
+    return {"author":"Ann <ann@x.com>", "to":to, "subject":"Quarterly numbers", "email_thread":"Can you send me the Q3 numbers?"}
+
+
+def test_aprocess_email_shared_coalesces_identical_emails(fake_process):
+    async def run():
+        return await asyncio.gather(*(agent.aprocess_email_shared(_email("bob@x.com")) for _ in range(3)))
+
+    results=asyncio.run(run())
+    assert fake_process==["bob@x.com"]
+    assert all(result is results[0] for result in results)
+
+
+def test_aprocess_email_shared_keeps_different_recipients_apart(fake_process):
+    async def run():
+        return await asyncio.gather(agent.aprocess_email_shared(_email("bob@x.com")), agent.aprocess_email_shared(_email("carol@x.com")))
+
+    bob, carol=asyncio.run(run())
+    assert sorted(fake_process)==["bob@x.com", "carol@x.com"]
+    assert bob["response"]=="Reply for bob@x.com"
+    assert carol["response"]=="Reply for carol@x.com"
@@ -0,0 +1,87 @@
+import io
+
+from utils import normalize_email_input, normalize_email_thread, strip_quoted_lines
+
+
+def _strip(text:str)->list:
+    return list(strip_quoted_lines(io.StringIO(text)))
+
+
+def test_drops_quoted_lines_and_their_header():
+    text="Sounds good.\n\nOn Mon, 3 Jun 2024 at 10:00, Bob <bob@x.com> wrote:\n> Can we meet?\n> Thanks"
+    assert _strip(text)==["Sounds good.", ""]
+
+
+def test_drops_quote_header_wrapped_over_two_lines():
+    text="Yes.\nOn Mon, 3 Jun 2024 at 10:00, Bob Example\n<bob@x.com> wrote:\n> Can we meet?"
+    assert _strip(text)==["Yes."]
+
+
+def test_keeps_inline_answers_between_quotes():
+    text="> Can you make Tuesday?\nYes, after 2pm.\n> And the budget?\nApproved."
+    assert _strip(text)==["Yes, after 2pm.", "Approved."]
+
+
+def test_line_starting_with_on_is_body_text():
+    assert _strip("On second thought, let's meet Friday.\nThanks")==["On second thought, let's meet Friday.", "Thanks"]
+
+
+def test_stops_at_signature_outlook_header_and_disclaimer_after_body():
+    assert _strip("Thanks\n-- \nAlice\nCEO")==["Thanks"]
+    assert _strip("Agreed.\nFrom: Bob\nSent: Monday\nold text")==["Agreed."]
+    assert _strip("Agreed.\n-----Original Message-----\nold text")==["Agreed."]
+    assert _strip("Agreed.\nCONFIDENTIALITY NOTICE: this message is private")==["Agreed."]
+
+
+def test_cutoffs_before_any_body_are_body_text():
+    text="This email is intended for all engineering staff: the build is broken."
+    assert _strip(text)==[text]
+    assert _strip("From: the release team\nSent: every Monday\nRelease notes")==["From: the release team", "Sent: every Monday", "Release notes"]
+
+
+def _cut(text:str)->bool:
+    lines=strip_quoted_lines(io.StringIO(text))
+    try:
+        while True:
+            next(lines)
+    except StopIteration as stop:
+        return stop.value
+
+
+def test_returns_whether_a_cutoff_stopped_it():
+    assert _cut("Thanks\n-- \nAlice") is True
+    assert _cut("Thanks\n> quoted") is False
+
+
+def test_collapses_blank_runs_and_drops_mobile_footer():
+    assert _strip("Hi\n\n\n\nSee you\nSent from my iPhone")==["Hi", "", "See you"]
+
+
+def test_normalize_counts_removed_characters():
+    text="Sure.\n\nOn Mon, Bob wrote:\n> old"
+    normalized=normalize_email_thread(text)
+    assert normalized.text=="Sure."
+    assert normalized.removed_chars==len(text)-len("Sure.")
+
+
+def test_normalize_falls_back_when_nothing_is_left():
+    text="> only a quote"
+    assert normalize_email_thread(text).text==text
+
+
+def test_normalize_falls_back_when_a_cutoff_leaves_a_stub():
+    text="Hello\nFrom: my side of the team we are ready to ship the release.\nSent: via the release channel on Monday morning."
+    assert normalize_email_thread(text).text==text
+
+
+def test_normalize_keeps_a_real_reply_above_outlook_history():
+    text="Thanks, I will review it today.\n\nFrom: Bob\nSent: Monday\nTo: me\nSubject: x\n"+"old history line\n"*50
+    assert normalize_email_thread(text).text=="Thanks, I will review it today."
+
+
+def test_normalize_email_input_copies():
+    email_input={"author":"a@x.com", "email_thread":"Hi\n> old"}
+    normalized, removed=normalize_email_input(email_input)
+    assert normalized=={"author":"a@x.com", "email_thread":"Hi"}
+    assert email_input["email_thread"]=="Hi\n> old"
+    assert removed==len("\n> old")